@@ -1,8 +1,14 @@
 import os
+import asyncio
 import json
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from sqlalchemy import create_engine, event, exc as sa_exc, text
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ttboost.db")
@@ -24,8 +30,19 @@ connect_args: dict = {"check_same_thread": False} if IS_SQLITE else {}
 if not IS_SQLITE and DB_HOSTADDR:
     connect_args["hostaddr"] = DB_HOSTADDR
 
+# Pool mode for Postgres:
+#   null      — NullPool, новое соединение на каждую сессию (по умолчанию, как раньше)
+#   pool      — обычный QueuePool (DB_POOL_SIZE/DB_MAX_OVERFLOW)
+#   pgbouncer — QueuePool поверх PgBouncer в transaction pooling: без prepared statements,
+#               без startup-параметров, search_path через SET LOCAL, размер пула от числа воркеров
+_legacy_null_pool = (os.getenv("DB_USE_NULL_POOL") or "1").strip().lower() not in {"0", "false", "no"}
+DB_POOL_MODE = (os.getenv("DB_POOL_MODE") or ("null" if _legacy_null_pool else "pool")).strip().lower()
+if DB_POOL_MODE not in {"null", "pool", "pgbouncer"}:
+    DB_POOL_MODE = "null"
+
 # For Postgres: set search_path (works with psycopg3 via libpq "options").
-if not IS_SQLITE and DB_SCHEMA and DB_SCHEMA != "public":
+# PgBouncer отвергает неизвестные startup-параметры, там search_path ставится на каждую транзакцию.
+if not IS_SQLITE and DB_SCHEMA and DB_SCHEMA != "public" and DB_POOL_MODE != "pgbouncer":
     connect_args["options"] = f"-c search_path={DB_SCHEMA},public"
 
 # Psycopg auto-prepared statements conflict with PgBouncer / managed Postgres
@@ -35,21 +52,182 @@ if not IS_SQLITE and DATABASE_URL.startswith("postgresql+psycopg"):
 
 engine_kwargs: dict = {"echo": False, "future": True, "connect_args": connect_args}
 
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except ValueError:
+        return default
+
+
+def _worker_count() -> int:
+    # uvicorn/gunicorn берут число воркеров из WEB_CONCURRENCY; DB_WORKERS — явное переопределение.
+    return max(1, _env_int("DB_WORKERS", _env_int("WEB_CONCURRENCY", 1)))
+
+
+class _PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.connect_retries = 0
+        self.connect_errors = 0
+        self.invalidations = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "checkout_wait_max_ms": round(self.wait_max_ms, 3),
+                "slow_checkouts": self.slow_checkouts,
+                "checkout_timeouts": self.timeouts,
+                "connects": self.connects,
+                "connect_retries": self.connect_retries,
+                "connect_errors": self.connect_errors,
+                "invalidations": self.invalidations,
+            }
+
+
+POOL_METRICS = _PoolMetrics()
+_SLOW_CHECKOUT_MS = float(_env_int("DB_POOL_SLOW_CHECKOUT_MS", 100))
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool, который меряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            # Только исчерпанный пул; ошибки подключения считает _connect_with_backoff.
+            with POOL_METRICS.lock:
+                POOL_METRICS.timeouts += 1
+            raise
+        waited = (time.perf_counter() - t0) * 1000.0
+        with POOL_METRICS.lock:
+            POOL_METRICS.checkouts += 1
+            POOL_METRICS.wait_total_ms += waited
+            if waited > POOL_METRICS.wait_max_ms:
+                POOL_METRICS.wait_max_ms = waited
+            if waited >= _SLOW_CHECKOUT_MS:
+                POOL_METRICS.slow_checkouts += 1
+        return conn
+
+
 # Managed Postgres providers and PgBouncer session mode are sensitive to idle pooled
 # connections. By default we avoid holding connections open between requests.
 if not IS_SQLITE:
-    use_null_pool = (os.getenv("DB_USE_NULL_POOL") or "1").strip().lower() not in {"0", "false", "no"}
-    if use_null_pool:
+    if DB_POOL_MODE == "null":
         engine_kwargs["poolclass"] = NullPool
+    elif DB_POOL_MODE == "pgbouncer":
+        # Бюджет серверных соединений (default_pool_size в PgBouncer) делим на воркеры.
+        budget = max(1, _env_int("DB_POOL_BUDGET", 20))
+        engine_kwargs["poolclass"] = _TimedQueuePool
+        engine_kwargs["pool_size"] = _env_int("DB_POOL_SIZE", max(1, budget // _worker_count()))
+        engine_kwargs["max_overflow"] = _env_int("DB_MAX_OVERFLOW", 0)
+        engine_kwargs["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", 10)
+        engine_kwargs["pool_pre_ping"] = True
+        engine_kwargs["pool_use_lifo"] = True
+        engine_kwargs["pool_recycle"] = _env_int("DB_POOL_RECYCLE", 300)
+        # prepare_threshold=None для psycopg уже выставлен выше: prepared statements
+        # несовместимы с transaction pooling.
     else:
-        engine_kwargs["pool_size"] = int((os.getenv("DB_POOL_SIZE") or "1").strip() or "1")
-        engine_kwargs["max_overflow"] = int((os.getenv("DB_MAX_OVERFLOW") or "0").strip() or "0")
+        engine_kwargs["poolclass"] = _TimedQueuePool
+        engine_kwargs["pool_size"] = _env_int("DB_POOL_SIZE", 1)
+        engine_kwargs["max_overflow"] = _env_int("DB_MAX_OVERFLOW", 0)
         engine_kwargs["pool_pre_ping"] = True
-        engine_kwargs["pool_recycle"] = int((os.getenv("DB_POOL_RECYCLE") or "300").strip() or "300")
+        engine_kwargs["pool_recycle"] = _env_int("DB_POOL_RECYCLE", 300)
 
 engine = create_engine(DATABASE_URL, **engine_kwargs)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+
+# Число и время SQL-запросов для /metrics (атрибуция к HTTP-запросу / событию WS — в metrics.db_statement).
+from app.services.metrics import db_statement as _metrics_db_statement  # noqa: E402
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _stmt_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info["_stmt_t0"] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _stmt_finished(conn, cursor, statement, parameters, context, executemany):
+    t0 = conn.info.pop("_stmt_t0", None)
+    if t0 is not None:
+        _metrics_db_statement(time.perf_counter() - t0, statement)
+
+
+if not IS_SQLITE and DB_POOL_MODE != "null":
+    _CONNECT_RETRIES = max(0, _env_int("DB_CONNECT_RETRIES", 3))
+    _CONNECT_BACKOFF_MS = max(0, _env_int("DB_CONNECT_BACKOFF_MS", 200))
+
+    def _on_event_loop_thread() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    @event.listens_for(engine, "do_connect")
+    def _connect_with_backoff(dialect, conn_rec, cargs, cparams):
+        # pre-ping выкидывает мёртвое соединение и открывает новое; если PgBouncer/Postgres
+        # в этот момент перезапускается — повторяем с экспоненциальной паузой.
+        # ws_v2 открывает сессии прямо в потоке event loop: там не ждём (time.sleep остановил бы
+        # все соединения воркера), а сразу отдаём ошибку — следующий запрос/событие попробует снова.
+        retries = 0 if _on_event_loop_thread() else _CONNECT_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                conn = dialect.connect(*cargs, **cparams)
+                with POOL_METRICS.lock:
+                    POOL_METRICS.connects += 1
+                return conn
+            except dialect.dbapi.OperationalError:
+                if attempt >= retries:
+                    with POOL_METRICS.lock:
+                        POOL_METRICS.connect_errors += 1
+                    raise
+                with POOL_METRICS.lock:
+                    POOL_METRICS.connect_retries += 1
+                delay = _CONNECT_BACKOFF_MS * (2 ** attempt) / 1000.0
+                logger.warning("[DB] connect failed, retry %s/%s in %.2fs", attempt + 1, _CONNECT_RETRIES, delay)
+                time.sleep(delay)
+
+    @event.listens_for(engine, "invalidate")
+    def _count_invalidation(dbapi_conn, conn_rec, exception):
+        with POOL_METRICS.lock:
+            POOL_METRICS.invalidations += 1
+
+
+if not IS_SQLITE and DB_POOL_MODE == "pgbouncer" and DB_SCHEMA and DB_SCHEMA != "public":
+    @event.listens_for(engine, "begin")
+    def _set_search_path(conn):
+        # В transaction pooling сессия на сервере меняется между транзакциями,
+        # поэтому search_path выставляем на каждую транзакцию.
+        conn.exec_driver_sql(f'SET LOCAL search_path TO "{DB_SCHEMA}", public')
+
+
+def pool_stats() -> dict:
+    """Состояние пула соединений для /status и админки."""
+    pool = engine.pool
+    stats: dict = {"mode": "sqlite" if IS_SQLITE else DB_POOL_MODE, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "workers": _worker_count(),
+        })
+    stats.update(POOL_METRICS.snapshot())
+    return stats
+
 Base = declarative_base()
 
 
@@ -358,3 +536,66 @@ def init_db():
     _migrate_push_tokens_postgres()
     _migrate_password_reset_tokens_postgres()
     _migrate_users_email_unique_postgres()
+
+
+# --- Отпечаток схемы: пропуск bootstrap при неизменных моделях/миграциях ---
+SCHEMA_META_TABLE = "app_schema_meta"
+DB_BOOTSTRAP_FORCE = (os.getenv("DB_BOOTSTRAP_FORCE") or "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def schema_fingerprint(*extra: str) -> str:
+    """sha256 от описания моделей (таблицы, колонки, индексы, ограничения), кода миграций этого
+    модуля и extra (исходник bootstrap из main.py, спецификации индексов)."""
+    import hashlib
+    import inspect as _pyinspect
+    import sys
+
+    from . import models  # noqa: F401 ensure models are imported
+
+    h = hashlib.sha256()
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        h.update(f"T {table.name}\n".encode())
+        for col in table.columns:
+            h.update(f"C {col.name} {col.type!r} {col.nullable} {col.primary_key}\n".encode())
+        for idx in sorted(table.indexes, key=lambda i: i.name or ""):
+            h.update(f"I {idx.name} {[c.name for c in idx.columns]} {idx.unique}\n".encode())
+        for cons in sorted(table.constraints, key=lambda c: c.name or ""):
+            h.update(f"K {type(cons).__name__} {cons.name} {sorted(c.name for c in cons.columns)}\n".encode())
+    try:
+        h.update(_pyinspect.getsource(sys.modules[__name__]).encode())
+    except Exception:
+        pass
+    for part in extra:
+        h.update(part.encode())
+    return h.hexdigest()
+
+
+def get_schema_meta(key: str) -> str | None:
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text(f"SELECT value FROM {SCHEMA_META_TABLE} WHERE key = :k"), {"k": key}).first()
+        return str(row[0]) if row else None
+    except Exception:
+        # Таблицы ещё нет (первый запуск или старая БД).
+        return None
+
+
+def set_schema_meta(key: str, value: str) -> None:
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {SCHEMA_META_TABLE} (key VARCHAR(64) PRIMARY KEY, value VARCHAR(128) NOT NULL)"
+            )
+            conn.execute(text(f"DELETE FROM {SCHEMA_META_TABLE} WHERE key = :k"), {"k": key})
+            conn.execute(text(f"INSERT INTO {SCHEMA_META_TABLE} (key, value) VALUES (:k, :v)"), {"k": key, "v": value})
+    except Exception as e:
+        logger.warning("[DB] Failed to store %s in %s: %s", key, SCHEMA_META_TABLE, e)
+
+
+def stored_schema_fingerprint() -> str | None:
+    # None — таблицы ещё нет (первый запуск или старая БД), значит bootstrap нужен.
+    return get_schema_meta("schema_fingerprint")
+
+
+def store_schema_fingerprint(fingerprint: str) -> None:
+    set_schema_meta("schema_fingerprint", fingerprint)
@@ -0,0 +1,262 @@
+"""Composite/covering indexes matched to the hot query shapes.
+
+Runs at startup next to `_bootstrap_legacy_schema` (same gating via
+`should_bootstrap_schema()`), idempotent on SQLite and Postgres. On Postgres
+indexes are built with CREATE INDEX CONCURRENTLY so a deploy doesn't block
+writes to the tables (DB_INDEX_CONCURRENTLY=0 to disable).
+
+tools/check_indexes.py runs EXPLAIN for each query in HOT_QUERIES and checks
+that the planner picks one of the expected indexes.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+
+from sqlalchemy import inspect
+
+from app.db.database import DB_SCHEMA, IS_SQLITE, engine
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    name: str
+    table: str
+    columns: tuple[str, ...]
+    # Postgres only: extra payload columns for index-only scans.
+    include: tuple[str, ...] = ()
+    reason: str = ""
+    # Index method (Postgres), e.g. "gin"; empty = btree.
+    using: str = ""
+    # Postgres extension the index needs (created best-effort).
+    extension: str = ""
+    dialects: tuple[str, ...] = ("sqlite", "postgresql")
+
+
+INDEXES: list[IndexSpec] = [
+    IndexSpec(
+        "ix_triggers_lookup",
+        "triggers",
+        ("user_id", "event_type", "enabled", "priority DESC", "created_at"),
+        reason="ws_v2 trigger lookup: user_id/event_type/enabled, ORDER BY priority DESC, created_at",
+    ),
+    # Legacy bootstrap раньше создавал idx_gift_events_tt_streamer_day с теми же колонками, но без
+    # INCLUDE; под тем же именем покрывающий индекс никогда бы не создался — отсюда новое имя.
+    IndexSpec(
+        "ix_gift_events_tt_streamer_day",
+        "gift_events_tt",
+        ("streamer_tiktok_username", "day"),
+        include=("donor_username", "gift_count", "gift_coins"),
+        reason="per-streamer gift history by day",
+    ),
+    IndexSpec(
+        "ix_gift_events_tt_streamer_created",
+        "gift_events_tt",
+        ("streamer_tiktok_username", "created_at", "id"),
+        reason="gift export keyset pagination by (created_at, id)",
+    ),
+    IndexSpec(
+        "ix_notification_reads_user_notification",
+        "notification_reads",
+        ("user_id", "notification_id"),
+        reason="read flags for a page of notifications of one user",
+    ),
+    IndexSpec(
+        "ix_users_created_id",
+        "users",
+        ("created_at", "id"),
+        reason="admin list_users keyset pagination (default sort)",
+    ),
+    # ILIKE '%q%' в admin list_users. На SQLite аналога нет — там поиск остаётся сканом
+    # (SQLite используется только в dev/тестах с небольшим числом пользователей).
+    IndexSpec(
+        "ix_users_username_trgm",
+        "users",
+        ("username gin_trgm_ops",),
+        reason="admin user search by username substring",
+        using="gin",
+        extension="pg_trgm",
+        dialects=("postgresql",),
+    ),
+    IndexSpec(
+        "ix_users_email_trgm",
+        "users",
+        ("email gin_trgm_ops",),
+        reason="admin user search by email substring",
+        using="gin",
+        extension="pg_trgm",
+        dialects=("postgresql",),
+    ),
+    IndexSpec(
+        "ix_stream_sessions_user_started",
+        "stream_sessions",
+        ("user_id", "started_at DESC"),
+        reason="latest stream session per user",
+    ),
+]
+
+
+# Индексы, которые больше не нужны ни одному запросу (только замедляют запись): удаляются при старте.
+# (name, table)
+OBSOLETE_INDEXES: list[tuple[str, str]] = [
+    # admin top gifts читает gift_daily_stats; на gift_events(streamer_id, day) остаётся legacy idx_gift_events_streamer_day.
+    ("ix_gift_events_streamer_day", "gift_events"),
+    # Заменён покрывающим ix_gift_events_tt_streamer_day (удаляется после его создания).
+    ("idx_gift_events_tt_streamer_day", "gift_events_tt"),
+]
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    sql: str
+    params: dict = field(default_factory=dict)
+    # Any of these index names in the plan counts as a pass.
+    expect: tuple[str, ...] = ()
+    dialects: tuple[str, ...] = ("sqlite", "postgresql")
+
+
+HOT_QUERIES: list[HotQuery] = [
+    HotQuery(
+        "ws_v2 trigger lookup",
+        "SELECT id FROM triggers WHERE user_id = :user_id AND event_type = :event_type AND enabled = :enabled "
+        "ORDER BY priority DESC, created_at ASC",
+        {"user_id": "u", "event_type": "gift", "enabled": True},
+        ("ix_triggers_lookup",),
+    ),
+    HotQuery(
+        "gift_events_tt by streamer + day",
+        "SELECT donor_username, SUM(gift_coins) FROM gift_events_tt "
+        "WHERE streamer_tiktok_username = :streamer AND day >= :since GROUP BY donor_username",
+        {"streamer": "s", "since": "2024-01-01"},
+        ("ix_gift_events_tt_streamer_day", "idx_gift_events_tt_streamer_donor_day"),
+    ),
+    HotQuery(
+        "gift export page",
+        "SELECT id, created_at FROM gift_events_tt WHERE streamer_tiktok_username = :streamer "
+        "AND (created_at > :after OR (created_at = :after AND id > :after_id)) ORDER BY created_at, id",
+        {"streamer": "s", "after": "2024-01-01 00:00:00", "after_id": ""},
+        ("ix_gift_events_tt_streamer_created",),
+    ),
+    HotQuery(
+        "admin top gifts",
+        "SELECT streamer_id, gift_name, SUM(count), SUM(coins) FROM gift_daily_stats "
+        "WHERE streamer_id IN (:a, :b) GROUP BY streamer_id, gift_name",
+        {"a": "u1", "b": "u2"},
+        ("uq_gift_daily_stats_streamer_gift_day", "sqlite_autoindex_gift_daily_stats_2"),
+    ),
+    HotQuery(
+        "notification read flags",
+        "SELECT notification_id FROM notification_reads WHERE user_id = :user_id AND notification_id IN (:a, :b)",
+        {"user_id": "u", "a": "n1", "b": "n2"},
+        ("ix_notification_reads_user_notification", "uq_notification_read", "sqlite_autoindex_notification_reads_1"),
+    ),
+    HotQuery(
+        "admin users first page",
+        "SELECT id FROM users ORDER BY created_at DESC, id DESC LIMIT 50",
+        {},
+        ("ix_users_created_id",),
+    ),
+    HotQuery(
+        "admin user search",
+        "SELECT id FROM users WHERE username ILIKE :q OR email ILIKE :q",
+        {"q": "%abc%"},
+        ("ix_users_username_trgm", "ix_users_email_trgm"),
+        dialects=("postgresql",),
+    ),
+    HotQuery(
+        "latest stream session",
+        "SELECT id FROM stream_sessions WHERE user_id = :user_id ORDER BY started_at DESC LIMIT 1",
+        {"user_id": "u"},
+        ("ix_stream_sessions_user_started",),
+    ),
+]
+
+
+def _qualified(table: str) -> str:
+    if IS_SQLITE or not DB_SCHEMA or DB_SCHEMA == "public":
+        return table
+    return f'"{DB_SCHEMA}"."{table}"'
+
+
+def create_index_sql(spec: IndexSpec, concurrently: bool = False) -> str:
+    cols = ", ".join(spec.columns)
+    using = f" USING {spec.using}" if spec.using and not IS_SQLITE else ""
+    sql = (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {spec.name} "
+        f"ON {_qualified(spec.table)}{using} ({cols})"
+    )
+    if spec.include and not IS_SQLITE:
+        sql += f" INCLUDE ({', '.join(spec.include)})"
+    return sql
+
+
+def _drop_obsolete_indexes(insp, tables: set[str], concurrently: bool) -> None:
+    for name, table in OBSOLETE_INDEXES:
+        if table not in tables:
+            continue
+        try:
+            existing = {ix.get("name") for ix in insp.get_indexes(table, schema=None if IS_SQLITE else DB_SCHEMA)}
+        except Exception:
+            existing = set()
+        if name not in existing:
+            continue
+        qualified = name if IS_SQLITE or not DB_SCHEMA or DB_SCHEMA == "public" else f'"{DB_SCHEMA}"."{name}"'
+        try:
+            if concurrently:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {qualified}")
+            else:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f"DROP INDEX IF EXISTS {qualified}")
+            print(f"[DB] Dropped obsolete index {name} ON {table}")
+        except Exception as e:  # pragma: no cover
+            print(f"[DB] Failed to drop index {name}: {e}")
+
+
+def ensure_indexes() -> None:
+    try:
+        insp = inspect(engine)
+        tables = set(insp.get_table_names(schema=None if IS_SQLITE else DB_SCHEMA))
+    except Exception as e:  # pragma: no cover
+        print(f"[DB] index migration skipped: {e}")
+        return
+
+    dialect = "sqlite" if IS_SQLITE else "postgresql"
+    missing_extensions: set[str] = set()
+    for ext in sorted({spec.extension for spec in INDEXES if spec.extension and dialect in spec.dialects}):
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"CREATE EXTENSION IF NOT EXISTS {ext}")
+        except Exception as e:  # pragma: no cover
+            # Нет прав на CREATE EXTENSION — индексы, которым оно нужно, пропускаем.
+            print(f"[DB] Extension {ext} unavailable, skipping its indexes: {e}")
+            missing_extensions.add(ext)
+
+    concurrently = not IS_SQLITE and (os.getenv("DB_INDEX_CONCURRENTLY") or "1").strip().lower() not in {"0", "false", "no"}
+    failed_tables: set[str] = set()
+    for spec in INDEXES:
+        if spec.table not in tables or dialect not in spec.dialects or spec.extension in missing_extensions:
+            continue
+        try:
+            existing = {ix.get("name") for ix in insp.get_indexes(spec.table, schema=None if IS_SQLITE else DB_SCHEMA)}
+        except Exception:
+            existing = set()
+        if spec.name in existing:
+            continue
+        try:
+            if concurrently:
+                # CONCURRENTLY нельзя внутри транзакции.
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.exec_driver_sql(create_index_sql(spec, concurrently=True))
+            else:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(create_index_sql(spec))
+            print(f"[DB] Created index {spec.name} ON {spec.table}({', '.join(spec.columns)})")
+        except Exception as e:  # pragma: no cover
+            print(f"[DB] Failed to create index {spec.name}: {e}")
+            failed_tables.add(spec.table)
+    # После создания замен, чтобы запросы не оставались без индекса (и не трогаем таблицы,
+    # где замена не создалась).
+    _drop_obsolete_indexes(insp, tables - failed_tables, concurrently)
@@ -1,7 +1,7 @@
 import enum
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, Enum, ForeignKey, UniqueConstraint, JSON, Date
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, Enum, ForeignKey, UniqueConstraint, JSON, Date, Index, Float
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -32,6 +32,9 @@ class User(Base):
     last_client_os = Column(String(32), nullable=True)  # android|ios|windows|macos|linux|unknown
     last_device = Column(String(255), nullable=True)  # free-form device/model string
     last_ws_at = Column(DateTime, nullable=True)
+    # Денормализация последнего StreamSession (пишется при старте эфира) — для списка в админке.
+    last_live_at = Column(DateTime, nullable=True)
+    last_live_tiktok_username = Column(String(64), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     settings = relationship("UserSettings", back_populates="user", uselist=False, cascade="all, delete-orphan")
@@ -150,6 +153,17 @@ class StreamSession(Base):
     ended_at = Column(DateTime, nullable=True)
     status = Column(String(32), default="running")
 
+    # Итоги эфира (StreamSummary): чекпоинт раз в STREAM_SUMMARY_CHECKPOINT_SEC и финально при отключении.
+    total_coins = Column(Integer, nullable=True)
+    total_gifts = Column(Integer, nullable=True)
+    unique_donors = Column(Integer, nullable=True)  # оценка HyperLogLog
+    peak_viewers = Column(Integer, nullable=True)
+    avg_viewers = Column(Integer, nullable=True)  # среднее, взвешенное по времени
+    chat_messages = Column(Integer, nullable=True)
+    chat_per_min = Column(Float, nullable=True)
+    top_gifts = Column(JSON, nullable=True)  # [{gift_name, coins, count}]
+    summary_updated_at = Column(DateTime, nullable=True)
+
 
 class LicenseStatus(str, enum.Enum):
     active = "active"
@@ -373,6 +387,28 @@ class GiftEvent(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
+class GiftDailyStats(Base):
+    """Дневной rollup gift_events по подаркам: (streamer_id, gift_name, day) -> count, coins.
+
+    coins = sum(gift_coins * gift_count), как в админской аналитике top gifts.
+    Заполняется один раз при bootstrap схемы, пересборка: tools/rebuild_gift_daily_stats.py.
+    """
+
+    __tablename__ = "gift_daily_stats"
+
+    id = Column(String, primary_key=True, default=_uuid)
+    streamer_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    gift_name = Column(String(256), nullable=False)
+    day = Column(Date, nullable=False)
+
+    count = Column(Integer, default=0, nullable=False)
+    coins = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("streamer_id", "gift_name", "day", name="uq_gift_daily_stats_streamer_gift_day"),
+    )
+
+
 class DonorStats(Base):
     __tablename__ = "donor_stats"
 
@@ -471,6 +507,31 @@ class DonorStatsTikTok(Base):
     )
 
 
+class DonorDailyStatsTikTok(Base):
+    """Дневные корзины донатов (streamer, donor, day) для скользящих окон 7d/30d.
+
+    Пишется вместе с gift_events_tt; корзины старше самого длинного окна удаляет
+    compact_donor_daily_tt (tools/compact_donor_daily.py, раз в сутки).
+    """
+
+    __tablename__ = "donor_daily_stats_tt"
+
+    id = Column(String, primary_key=True, default=_uuid)
+    streamer_tiktok_username = Column(String(64), nullable=False)
+    donor_username = Column(String(64), nullable=False)
+    day = Column(Date, index=True, nullable=False)
+
+    coins = Column(Integer, default=0, nullable=False)
+    gifts = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("streamer_tiktok_username", "donor_username", "day", name="uq_donor_daily_tt_streamer_donor_day"),
+        Index("ix_donor_daily_tt_streamer_day", "streamer_tiktok_username", "day"),
+    )
+
+
 class StreamerStatsTikTok(Base):
     __tablename__ = "streamer_stats_tt"
 
@@ -119,6 +119,12 @@ if not _log_handler_exists:
     logging.getLogger().setLevel(logging.INFO)
     logging.getLogger(__name__).info(f"Файловый лог активирован: {LOG_FILE}")
 
+# Запись логов в файл из отдельного потока (по умолчанию включено в режиме HOT_LOG_MODE=sampled)
+from app.services import hot_log as _hot_log
+if os.getenv("LOG_QUEUE", "1" if _hot_log.SAMPLED else "0").strip().lower() in ("1", "true", "yes", "on"):
+    if _hot_log.install_queue_logging():
+        logging.getLogger(__name__).info("Логи пишутся через QueueHandler (HOT_LOG_MODE=%s)", "sampled" if _hot_log.SAMPLED else "full")
+
 ALLOW_LOGS = os.getenv("ALLOW_LOGS", "0")  # Если 1, разрешаем /logs
 
 @app.middleware("http")
@@ -222,6 +228,69 @@ async def _startup_tts_cleanup_loop():
     except Exception:
         pass
 
+
+@app.on_event("startup")
+async def _startup_host_metrics():
+    # Фоновый сэмплер CPU/памяти/диска/лага для /v2/admin/server/status.
+    try:
+        from app.services.host_metrics import HOST_METRICS
+        from app.routes_v2 import ws_v2 as _ws_v2
+
+        HOST_METRICS.register_counter("ws_connections", lambda: _ws_v2.ACTIVE_WS_CONNECTIONS)
+        HOST_METRICS.register_counter(
+            "tiktok_clients",
+            lambda: max(
+                len(getattr(tiktok_service, "_clients", {})),
+                len(getattr(tiktok_service, "_desired_usernames", {})),
+            ),
+        )
+        HOST_METRICS.start()
+    except Exception:
+        logging.getLogger(__name__).exception("host metrics sampler failed to start")
+
+
+@app.on_event("startup")
+async def _startup_loop_monitor():
+    # Лаг event loop + стеки блокирующего кода (GET /v2/admin/server/loop, /metrics). LOOP_MONITOR=0 — выключить.
+    try:
+        from app.services.loop_monitor import LOOP_MONITOR, LOOP_MONITOR_ENABLED
+
+        if LOOP_MONITOR_ENABLED:
+            LOOP_MONITOR.start()
+    except Exception:
+        logging.getLogger(__name__).exception("loop monitor failed to start")
+
+
+@app.on_event("startup")
+async def _startup_supabase_jwks():
+    # Supabase JWKS обновляется в фоне до истечения TTL, чтобы /v2/auth/supabase/exchange не ждал сеть.
+    try:
+        from app.services.supabase_jwt import JWKS
+
+        JWKS.start()
+    except Exception:
+        logging.getLogger(__name__).exception("supabase JWKS refresher failed to start")
+
+
+@app.on_event("shutdown")
+async def _shutdown_host_metrics():
+    try:
+        from app.services.host_metrics import HOST_METRICS
+        from app.services.loop_monitor import LOOP_MONITOR
+        from app.services.supabase_jwt import JWKS
+
+        HOST_METRICS.stop()
+        LOOP_MONITOR.stop()
+        JWKS.stop()
+    except Exception:
+        pass
+
+
+@app.on_event("shutdown")
+async def _shutdown_queue_logging():
+    # Дописываем хвост очереди логов в файл
+    _hot_log.stop_queue_logging()
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(tts.router, prefix="/tts", tags=["tts"])
 app.include_router(voices.router, prefix="/voices", tags=["voices"])
@@ -232,7 +301,8 @@ app.include_router(triggers.router, prefix="/triggers", tags=["triggers"])
 app.include_router(ws.router, tags=["ws"])
 
 # v2 API (логин/пароль, Bearer JWT, хранение в БД)
-init_db()
+# init_db() + авто-ALTER + индексы запускаются ниже одним шагом (_run_schema_bootstrap),
+# и пропускаются, если отпечаток схемы в БД совпадает с текущим кодом.
 
 # Простая попытка авто-ALTER для добавления новых полей.
 # На managed Postgres/VPS может перегружать pooler ещё до старта приложения,
@@ -414,6 +484,33 @@ def _bootstrap_legacy_schema() -> None:
         )
         insp = _refresh_insp()
 
+    if not _has_column(insp, "users", "last_live_at"):
+        _try_exec(
+            "[DB] Added column users.last_live_at",
+            "ALTER TABLE users ADD COLUMN last_live_at TIMESTAMP",
+        )
+        _try_exec(
+            "[DB] Added column users.last_live_tiktok_username",
+            "ALTER TABLE users ADD COLUMN last_live_tiktok_username VARCHAR(64)",
+        )
+        # Однократно заполняем из stream_sessions; дальше колонки пишет ws_v2 при старте эфира.
+        _try_exec(
+            "[DB] Backfilled users.last_live_at/last_live_tiktok_username",
+            """
+            UPDATE users SET
+                last_live_at = (
+                    SELECT s.started_at FROM stream_sessions s
+                    WHERE s.user_id = users.id ORDER BY s.started_at DESC LIMIT 1
+                ),
+                last_live_tiktok_username = (
+                    SELECT s.tiktok_username FROM stream_sessions s
+                    WHERE s.user_id = users.id ORDER BY s.started_at DESC LIMIT 1
+                )
+            WHERE EXISTS (SELECT 1 FROM stream_sessions s WHERE s.user_id = users.id)
+            """.strip(),
+        )
+        insp = _refresh_insp()
+
     if not _has_column(insp, "users", "supabase_uid"):
         _try_exec(
             "[DB] Added column users.supabase_uid",
@@ -508,10 +605,7 @@ def _bootstrap_legacy_schema() -> None:
             )
             """.strip(),
         )
-        _try_exec(
-            "[DB] Created index idx_gift_events_tt_streamer_day",
-            "CREATE INDEX IF NOT EXISTS idx_gift_events_tt_streamer_day ON gift_events_tt(streamer_tiktok_username, day)",
-        )
+        # (streamer_tiktok_username, day) — покрывающий ix_gift_events_tt_streamer_day из index_migrations.
         _try_exec(
             "[DB] Created index idx_gift_events_tt_streamer_donor_day",
             "CREATE INDEX IF NOT EXISTS idx_gift_events_tt_streamer_donor_day ON gift_events_tt(streamer_tiktok_username, donor_username, day)",
@@ -653,8 +747,87 @@ def _bootstrap_legacy_schema() -> None:
             "CREATE INDEX IF NOT EXISTS idx_streamer_stats_tt_total ON streamer_stats_tt(total_coins)",
         )
 
+    # Итоги эфира (app/services/stream_summary.py), пишутся при отключении.
+    insp = _refresh_insp()
+    for column, ddl in (
+        ("total_coins", "INTEGER"),
+        ("total_gifts", "INTEGER"),
+        ("unique_donors", "INTEGER"),
+        ("peak_viewers", "INTEGER"),
+        ("avg_viewers", "INTEGER"),
+        ("chat_messages", "INTEGER"),
+        ("chat_per_min", "DOUBLE PRECISION"),
+        ("top_gifts", "JSON"),
+        ("summary_updated_at", "TIMESTAMP"),
+    ):
+        if not _has_column(insp, "stream_sessions", column):
+            _try_exec(
+                f"[DB] Added column stream_sessions.{column}",
+                f"ALTER TABLE stream_sessions ADD COLUMN {column} {ddl}",
+            )
+
+
+def _run_schema_bootstrap() -> None:
+    if not should_bootstrap_schema():
+        return
+    import inspect as _pyinspect
+    from app.db.database import (
+        DB_BOOTSTRAP_FORCE,
+        schema_fingerprint,
+        store_schema_fingerprint,
+        stored_schema_fingerprint,
+    )
+    from app.db.index_migrations import INDEXES, OBSOLETE_INDEXES, ensure_indexes
+
+    # Отпечаток: модели + миграции database.py + этот bootstrap + спецификации индексов.
+    fingerprint = schema_fingerprint(_pyinspect.getsource(_bootstrap_legacy_schema), repr(INDEXES), repr(OBSOLETE_INDEXES))
+    if not DB_BOOTSTRAP_FORCE and stored_schema_fingerprint() == fingerprint:
+        print("[DB] Schema fingerprint matches, bootstrap skipped")
+    else:
+        init_db()
+        _bootstrap_legacy_schema()
+        ensure_indexes()
+        store_schema_fingerprint(fingerprint)
+        print(f"[DB] Schema bootstrap done, fingerprint {fingerprint[:12]}")
+    _run_rollup_backfills()
+
+
+def _rollup_backfills() -> list[tuple[str, object]]:
+    """(метка в app_schema_meta, функция(db) -> число строк) для rollup-таблиц из сырых событий."""
+    from app.services import gift_stats_service
+
+    return [
+        ("backfill:donor_daily_stats_tt", gift_stats_service.backfill_donor_daily_tt),
+        ("backfill:gift_daily_stats", gift_stats_service.rebuild_gift_daily_stats),
+    ]
+
 
-_bootstrap_legacy_schema()
+def _run_rollup_backfills() -> None:
+    # Rollup-таблицы появляются пустыми: один раз заполняем их из сырых событий, иначе окна
+    # today/7d/30d и аналитика пустые, пока кто-то не запустит tools/* вручную.
+    # Повторно не запускается (метка в app_schema_meta). DB_ROLLUP_BACKFILL=0 — пропустить.
+    if (os.getenv("DB_ROLLUP_BACKFILL") or "1").strip().lower() in {"0", "false", "no", "off"}:
+        return
+    from app.db.database import SessionLocal, get_schema_meta, set_schema_meta
+
+    for key, backfill in _rollup_backfills():
+        if get_schema_meta(key):
+            continue
+        db = SessionLocal()
+        try:
+            t0 = datetime.utcnow()
+            n = backfill(db)
+            set_schema_meta(key, t0.isoformat())
+            print(f"[DB] {key}: {n} rows in {(datetime.utcnow() - t0).total_seconds():.1f}s")
+        except Exception as e:
+            # Например, параллельный воркер делает то же самое — метку поставит он.
+            db.rollback()
+            print(f"[DB] {key} failed: {e}")
+        finally:
+            db.close()
+
+
+_run_schema_bootstrap()
 app.include_router(auth_v2.router, prefix="/v2/auth", tags=["v2-auth"])
 app.include_router(settings_v2.router, prefix="/v2/settings", tags=["v2-settings"])
 app.include_router(sounds_v2.router, prefix="/v2/sounds", tags=["v2-sounds"])
@@ -712,6 +885,29 @@ async def status():
         clients_cnt = 0
         max_gift_lag_sec = None
     uptime_sec = (datetime.utcnow() - START_TIME).total_seconds()
+    try:
+        bridges = tiktok_service.bridge_stats() if hasattr(tiktok_service, "bridge_stats") else None
+    except Exception:
+        bridges = None
+    try:
+        from app.db.database import pool_stats
+        db_pool = pool_stats()
+    except Exception:
+        db_pool = None
+    try:
+        from app.services.leaderboard import LEADERBOARDS
+        leaderboards = LEADERBOARDS.snapshot()
+    except Exception:
+        leaderboards = None
+    throttle_totals = None
+    try:
+        if hasattr(tiktok_service, "throttle_stats"):
+            throttle_totals = {}
+            for snap in tiktok_service.throttle_stats().values():
+                for key in ("viewer_in", "viewer_out", "viewer_dropped", "like_in", "like_out", "like_merged"):
+                    throttle_totals[key] = throttle_totals.get(key, 0) + int(snap.get(key, 0))
+    except Exception:
+        throttle_totals = None
     return {
         "status": "ok" if db_ok else "degraded",
         "service": "ttboost-backend",
@@ -720,10 +916,15 @@ async def status():
         "uptime_sec": int(uptime_sec),
         "db_ok": db_ok,
         "db_error": db_error,
+        "db_pool": db_pool,
+        "leaderboards": leaderboards,
         "tiktok_clients": clients_cnt,
         "allowed_origins": allowed_origins,
         "allow_localhost_dev": os.getenv("ALLOW_LOCALHOST_DEV", "1"),
         "max_gift_event_lag_sec": int(max_gift_lag_sec) if max_gift_lag_sec is not None else None,
+        "tiktok_bridges": bridges,
+        "tiktok_event_throttle": throttle_totals,
+        "log_queue": _hot_log.queue_stats(),
     }
 
 @app.get("/health")
@@ -731,6 +932,64 @@ async def health():
     """Алиас /health для внешних мониторингов (HEAD/GET). Возвращает тот же JSON что /status."""
     return await status()
 
+# ==== МЕТРИКИ (Prometheus text format) =====
+from app.services import metrics as _metrics
+from app.services import sql_profiler as _sql_profiler
+
+_sql_profiler.install()
+
+
+def _send_queue_depth() -> int:
+    # События, ждущие обработчиков ws_v2 в очередях JS-бриджа (у python-коннектора очереди нет).
+    queues = getattr(tiktok_service, "_dispatch_queues", None) or {}
+    return sum(q.pending() if hasattr(q, "pending") else q.qsize() for q in list(queues.values()))
+
+
+_metrics.REGISTRY.gauge("ttboost_ws_connections", "Открытые WebSocket /v2/ws.", fn=lambda: ws_v2.ACTIVE_WS_CONNECTIONS)
+_metrics.REGISTRY.gauge(
+    "ttboost_tiktok_clients",
+    "Активные TikTok-клиенты.",
+    fn=lambda: max(len(getattr(tiktok_service, "_clients", {})), len(getattr(tiktok_service, "_desired_usernames", {}))),
+)
+_metrics.REGISTRY.gauge("ttboost_send_queue_depth", "Глубина очереди событий к обработчикам ws_v2.", fn=_send_queue_depth)
+METRICS_TOKEN = (os.getenv("METRICS_TOKEN") or "").strip()
+_LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+@app.middleware("http")
+async def _metrics_unit(request: Request, call_next):
+    # SQL внутри запроса (в т.ч. sync-роуты в threadpool — contextvar копируется) считается как scope=http.
+    token, unit = _metrics.begin_unit("http")
+    try:
+        return await call_next(request)
+    finally:
+        if unit.profile is not None:
+            # Для профайлера — шаблон роута, а не конкретный URL (иначе /users/<id> размножит ключи).
+            route = request.scope.get("route")
+            unit.name = f"{request.method} {getattr(route, 'path', None) or 'unmatched'}"
+        _metrics.end_unit(token, unit)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    import hmac
+
+    if METRICS_TOKEN:
+        # Только заголовок: ?token= оседает в access-логах прокси и uvicorn.
+        auth = request.headers.get("Authorization") or ""
+        if not hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=403, detail="metrics token required")
+    else:
+        # Без токена — только локальный скрейпер. Запрос через reverse proxy (X-Forwarded-For)
+        # тоже приходит с 127.0.0.1, поэтому его не считаем локальным.
+        host = request.client.host if request.client else ""
+        if host not in _LOCAL_HOSTS or request.headers.get("X-Forwarded-For"):
+            raise HTTPException(status_code=403, detail="metrics token required")
+    from fastapi.responses import PlainTextResponse
+
+    return PlainTextResponse(_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def _tail_log(path: str, lines: int) -> list[str]:
     try:
         with open(path, "r", encoding="utf-8", errors="ignore") as f:
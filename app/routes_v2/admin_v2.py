@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+import base64
+import json
 import logging
 import os
 import shutil
@@ -6,7 +8,8 @@ import socket
 import time
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import case, func, or_, tuple_
+from sqlalchemy import text as sql_text
 from datetime import datetime, timedelta, date
 
 from app.db.database import SessionLocal
@@ -21,6 +24,9 @@ from app.services.plans import (
 )
 
 from app.services.admin_state import STATE as ADMIN_STATE
+from app.services.host_metrics import HOST_METRICS, HOST_METRICS_HISTORY
+from app.services.loop_monitor import LOOP_MONITOR
+from app.services.sql_profiler import SQL_PROFILER
 from app.routes_v2 import ws_v2
 
 
@@ -28,87 +34,6 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-def _try_import_psutil():
-    try:
-        import psutil  # type: ignore
-        return psutil
-    except Exception:
-        return None
-
-
-def _read_proc_uptime_sec() -> int | None:
-    try:
-        with open("/proc/uptime", "r", encoding="utf-8", errors="ignore") as f:
-            raw = (f.read() or "").strip().split()
-        if not raw:
-            return None
-        return int(float(raw[0]))
-    except Exception:
-        return None
-
-
-def _read_meminfo_bytes() -> tuple[int | None, int | None]:
-    """Returns (total_bytes, available_bytes) best-effort."""
-    try:
-        mem_total_kb = None
-        mem_avail_kb = None
-        with open("/proc/meminfo", "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                if line.startswith("MemTotal:"):
-                    mem_total_kb = int(line.split()[1])
-                elif line.startswith("MemAvailable:"):
-                    mem_avail_kb = int(line.split()[1])
-                if mem_total_kb is not None and mem_avail_kb is not None:
-                    break
-        if mem_total_kb is None or mem_avail_kb is None:
-            return (None, None)
-        return (mem_total_kb * 1024, mem_avail_kb * 1024)
-    except Exception:
-        return (None, None)
-
-
-def _read_proc_cpu_percent(interval_sec: float = 0.1) -> float | None:
-    """Best-effort CPU usage percent on Linux via /proc/stat.
-
-    We sample twice and compute usage over the interval.
-    """
-
-    def _read_cpu_line() -> tuple[int, int] | None:
-        try:
-            with open("/proc/stat", "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    if line.startswith("cpu "):
-                        parts = line.strip().split()
-                        nums = [int(x) for x in parts[1:] if x.isdigit()]
-                        if len(nums) < 4:
-                            return None
-                        total = sum(nums)
-                        idle = nums[3] + (nums[4] if len(nums) > 4 else 0)
-                        return (total, idle)
-            return None
-        except Exception:
-            return None
-
-    a = _read_cpu_line()
-    if a is None:
-        return None
-    try:
-        time.sleep(max(0.0, float(interval_sec)))
-    except Exception:
-        pass
-    b = _read_cpu_line()
-    if b is None:
-        return None
-
-    total_delta = b[0] - a[0]
-    idle_delta = b[1] - a[1]
-    if total_delta <= 0:
-        return None
-    usage = (1.0 - (idle_delta / total_delta)) * 100.0
-    # clamp just in case of clock/tick anomalies
-    return float(max(0.0, min(100.0, usage)))
-
-
 ROLES_ORDER = [
     "user",
     "support",
@@ -248,93 +173,67 @@ class AdminServerStatusResponse(BaseModel):
     # Uptime
     uptime_sec: int | None = None
 
+    # Процесс
+    loop_lag_ms: float | None = None
+    ws_connections: int | None = None
+    tiktok_clients: int | None = None
 
-@router.get("/server/status", response_model=AdminServerStatusResponse)
-def get_server_status(_user: models.User = Depends(require_staff_user)):
-    psutil = _try_import_psutil()
+    # Фоновый сэмплер: время последнего снимка и история для графиков (старые -> новые)
+    sampled_at: str | None = None
+    sample_interval_sec: float | None = None
+    history: list[dict] = []
 
-    # loadavg
-    load1 = load5 = load15 = None
-    try:
-        la = os.getloadavg()
-        load1, load5, load15 = float(la[0]), float(la[1]), float(la[2])
-    except Exception:
-        pass
 
-    cpu_percent = None
-    cpu_count = None
-    try:
-        if psutil is not None:
-            cpu_count = int(psutil.cpu_count(logical=True) or 0) or None
-            cpu_percent = float(psutil.cpu_percent(interval=0.1))
-        else:
-            cpu_count = int(os.cpu_count() or 0) or None
-            cpu_percent = _read_proc_cpu_percent(0.1)
-    except Exception:
-        cpu_percent = None
-
-    mem_total_mb = mem_used_mb = None
-    mem_used_percent = None
-    try:
-        if psutil is not None:
-            vm = psutil.virtual_memory()
-            mem_total_mb = int(vm.total // (1024 * 1024))
-            mem_used_mb = int(vm.used // (1024 * 1024))
-            mem_used_percent = float(vm.percent)
-        else:
-            total_b, avail_b = _read_meminfo_bytes()
-            if total_b is not None and avail_b is not None:
-                used_b = max(0, total_b - avail_b)
-                mem_total_mb = int(total_b // (1024 * 1024))
-                mem_used_mb = int(used_b // (1024 * 1024))
-                if total_b > 0:
-                    mem_used_percent = round((used_b / total_b) * 100.0, 2)
-    except Exception:
-        pass
-
-    disk_path = os.getenv("TT_DISK_PATH", "/") or "/"
-    disk_total_gb = disk_used_gb = None
-    disk_used_percent = None
-    try:
-        du = shutil.disk_usage(disk_path)
-        disk_total_gb = int(du.total // (1024 ** 3))
-        disk_used_gb = int(du.used // (1024 ** 3))
-        if du.total > 0:
-            disk_used_percent = round((du.used / du.total) * 100.0, 2)
-    except Exception:
-        pass
+_HOST_SAMPLE_FIELDS = (
+    "load1", "load5", "load15",
+    "cpu_percent", "cpu_count",
+    "mem_total_mb", "mem_used_mb", "mem_used_percent",
+    "disk_total_gb", "disk_used_gb", "disk_used_percent", "disk_path",
+    "uptime_sec", "loop_lag_ms", "ws_connections", "tiktok_clients",
+)
 
-    uptime_sec = None
-    try:
-        if psutil is not None:
-            boot_time = float(psutil.boot_time())
-            uptime_sec = int(time.time() - boot_time)
-        else:
-            uptime_sec = _read_proc_uptime_sec()
-    except Exception:
-        uptime_sec = None
 
+@router.get("/server/status", response_model=AdminServerStatusResponse)
+def get_server_status(
+    history: int = Query(60, ge=0, le=HOST_METRICS_HISTORY),
+    _user: models.User = Depends(require_staff_user),
+):
+    # Снимки делает фоновый HOST_METRICS (main.py startup); здесь только чтение буфера.
+    sample = HOST_METRICS.latest() or HOST_METRICS.sample_now()
     return AdminServerStatusResponse(
         status="ok",
         now=datetime.utcnow().isoformat() + "Z",
         hostname=(socket.gethostname() or None),
         pid=int(os.getpid()),
-        load1=load1,
-        load5=load5,
-        load15=load15,
-        cpu_percent=cpu_percent,
-        cpu_count=cpu_count,
-        mem_total_mb=mem_total_mb,
-        mem_used_mb=mem_used_mb,
-        mem_used_percent=mem_used_percent,
-        disk_total_gb=disk_total_gb,
-        disk_used_gb=disk_used_gb,
-        disk_used_percent=disk_used_percent,
-        disk_path=disk_path,
-        uptime_sec=uptime_sec,
+        sampled_at=sample.get("ts"),
+        sample_interval_sec=HOST_METRICS.interval_sec,
+        history=HOST_METRICS.series(history),
+        **{k: sample[k] for k in _HOST_SAMPLE_FIELDS if k in sample},
     )
 
 
+@router.get("/server/loop")
+def get_event_loop_status(
+    limit: int = Query(20, ge=0, le=200),
+    _user: models.User = Depends(require_staff_user),
+):
+    """Лаг event loop и последние зависания со стеком блокирующего кода."""
+    return LOOP_MONITOR.snapshot(limit)
+
+
+@router.get("/server/sql-profile")
+def get_sql_profile(
+    limit: int = Query(50, ge=1, le=500),
+    reset: bool = Query(False),
+    _user: models.User = Depends(require_staff_user),
+):
+    """SQL на HTTP-роут / событие WS (SQL_PROFILE=1): среднее/максимум запросов, топ запросов, превышения бюджета."""
+    snap = SQL_PROFILER.snapshot(limit)
+    if reset:
+        SQL_PROFILER.reset()
+    return snap
+
+
 @router.get("/roles", response_model=RolesResponse)
 def list_roles(_user: models.User = Depends(require_staff_user)):
     return RolesResponse(items=[RoleItem(id=r) for r in ROLES_ORDER])
@@ -430,69 +329,103 @@ def _top_donors_by_metric(db: Session, user_ids: list[str], metric_attr: str) ->
     return out
 
 
-def _top_gifts(db: Session, user_ids: list[str], *, since_day: date | None) -> dict[str, list[dict]]:
-    if not user_ids:
-        return {}
-
-    coins_expr = func.sum(models.GiftEvent.gift_coins * models.GiftEvent.gift_count).label("coins")
-    count_expr = func.sum(models.GiftEvent.gift_count).label("count")
-
-    q = (
-        db.query(
-            models.GiftEvent.streamer_id.label("streamer_id"),
-            models.GiftEvent.gift_name.label("gift_name"),
-            count_expr,
-            coins_expr,
-        )
-        .filter(models.GiftEvent.streamer_id.in_(user_ids))
-        .filter(models.GiftEvent.gift_name.is_not(None))
-    )
-    if since_day is not None:
-        q = q.filter(models.GiftEvent.day >= since_day)
-
-    agg = q.group_by(models.GiftEvent.streamer_id, models.GiftEvent.gift_name).subquery()
-
-    rn = func.row_number().over(
-        partition_by=agg.c.streamer_id,
-        order_by=agg.c.coins.desc(),
-    ).label("rn")
+def _top_gifts_by_period(db: Session, user_ids: list[str], *, today: date, top_n: int = 3) -> dict[str, dict[str, list[dict]]]:
+    """Top gifts за all/today/7d/30d одним запросом по rollup gift_daily_stats.
 
-    ranked = (
-        db.query(
-            agg.c.streamer_id.label("streamer_id"),
-            agg.c.gift_name.label("gift_name"),
-            agg.c.count.label("count"),
-            agg.c.coins.label("coins"),
-            rn,
-        )
-        .subquery()
-    )
+    Возвращает {period: {user_id: [{name, coins, count}, ...]}}.
+    """
+    periods = {"all": None, "today": today, "7d": today - timedelta(days=6), "30d": today - timedelta(days=29)}
+    out: dict[str, dict[str, list[dict]]] = {p: {str(uid): [] for uid in user_ids} for p in periods}
+    if not user_ids:
+        return out
 
+    g = models.GiftDailyStats
+    cols = []
+    for period, since in periods.items():
+        if since is None:
+            cols += [func.sum(g.count).label(f"count_{period}"), func.sum(g.coins).label(f"coins_{period}")]
+        else:
+            cols += [
+                func.sum(case((g.day >= since, g.count), else_=0)).label(f"count_{period}"),
+                func.sum(case((g.day >= since, g.coins), else_=0)).label(f"coins_{period}"),
+            ]
     rows = (
-        db.query(ranked)
-        .filter(ranked.c.rn <= 3)
-        .order_by(ranked.c.streamer_id.asc(), ranked.c.coins.desc())
+        db.query(g.streamer_id.label("streamer_id"), g.gift_name.label("gift_name"), *cols)
+        .filter(g.streamer_id.in_(user_ids))
+        .group_by(g.streamer_id, g.gift_name)
         .all()
     )
 
-    out: dict[str, list[dict]] = {str(uid): [] for uid in user_ids}
-    for r in rows:
-        sid = str(getattr(r, "streamer_id", "") or "")
-        if not sid:
-            continue
-        out.setdefault(sid, []).append(
-            {
-                "name": getattr(r, "gift_name", None),
-                "coins": int(getattr(r, "coins", 0) or 0),
-                "count": int(getattr(r, "count", 0) or 0),
-            }
-        )
+    # Видов подарков у стримера немного — top-N по периоду считаем в Python.
+    for period in periods:
+        candidates: dict[str, list[tuple[int, int, str]]] = {}
+        for r in rows:
+            coins = int(getattr(r, f"coins_{period}") or 0)
+            count = int(getattr(r, f"count_{period}") or 0)
+            if count <= 0:
+                continue
+            candidates.setdefault(str(r.streamer_id), []).append((coins, count, r.gift_name))
+        for sid, items in candidates.items():
+            items.sort(key=lambda x: x[0], reverse=True)
+            out[period][sid] = [{"name": name, "coins": coins, "count": count} for coins, count, name in items[:top_n]]
     return out
 
 
 class ListUsersResponse(BaseModel):
     items: list[AdminUserItem]
     total: int
+    # total — оценка (reltuples / кэш), если не запрошен exact_total=true
+    total_is_estimate: bool = False
+    # Keyset-курсор следующей страницы (передать как ?cursor=...), None — страниц больше нет.
+    next_cursor: str | None = None
+
+
+ADMIN_COUNT_CACHE_SEC = float(os.getenv("ADMIN_COUNT_CACHE_SEC") or 60)
+_users_count_cache: dict[tuple, tuple[float, int]] = {}
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _estimated_users_total(db: Session) -> int | None:
+    """Postgres: оценка числа строк users из pg_class.reltuples (без скана). None — оценки нет."""
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            return None
+        from app.db.database import DB_SCHEMA
+
+        table = f"{DB_SCHEMA}.users" if DB_SCHEMA else "users"
+        value = db.execute(sql_text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table}).scalar()
+    except Exception:
+        return None
+    # -1 — таблица ещё ни разу не анализировалась
+    return int(value) if value is not None and int(value) >= 0 else None
+
+
+def _cached_users_count(key: tuple, count_fn) -> int:
+    now = time.monotonic()
+    hit = _users_count_cache.get(key)
+    if hit is not None and now - hit[0] < ADMIN_COUNT_CACHE_SEC:
+        return hit[1]
+    value = int(count_fn())
+    if len(_users_count_cache) > 1000:
+        _users_count_cache.clear()
+    _users_count_cache[key] = (now, value)
+    return value
+
+
+def _encode_users_cursor(sort_by: str, sort_dir: str, key, created_at: datetime, user_id: str) -> str:
+    if isinstance(key, datetime):
+        key_enc = {"dt": key.isoformat()}
+    else:
+        key_enc = {"n": int(key or 0)}
+    raw = json.dumps([sort_by, sort_dir, key_enc, created_at.isoformat(), str(user_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_users_cursor(cursor: str) -> tuple[str, str, object, datetime, str]:
+    raw = base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode("ascii")).decode("utf-8")
+    sort_by, sort_dir, key_enc, created_at, user_id = json.loads(raw)
+    key = datetime.fromisoformat(key_enc["dt"]) if "dt" in key_enc else int(key_enc["n"])
+    return str(sort_by), str(sort_dir), key, datetime.fromisoformat(created_at), str(user_id)
 
 
 def _tariff_from_license_plan(plan: str | None):
@@ -547,6 +480,8 @@ def list_users(
     sort_dir: str | None = None,  # asc|desc
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    exact_total: bool = False,
     _user: models.User = Depends(require_staff_user),
     db: Session = Depends(get_db),
 ):
@@ -559,6 +494,7 @@ def list_users(
 
     query = db.query(models.User)
     if q:
+        # ILIKE '%q%' на Postgres обслуживается trigram GIN-индексами (app/db/index_migrations.py).
         qq = q.strip().lower()
         query = query.filter(
             or_(
@@ -655,17 +591,53 @@ def list_users(
         "last_7d_coins": models.StreamerStats.last_7d_coins,
         "last_30d_coins": models.StreamerStats.last_30d_coins,
     }
-    col = sort_map.get(sb, models.User.created_at)
-    if sd == "asc":
-        order_expr = col.asc()
+    if sb not in sort_map:
+        sb = "created_at"
+    col = sort_map[sb]
+    # NULL -> 0/epoch: keyset-сравнение одинаково работает на Postgres и SQLite.
+    if sb == "created_at":
+        sort_key = col
+    elif sb == "last_login_at":
+        sort_key = func.coalesce(col, _EPOCH)
     else:
-        order_expr = col.desc()
+        sort_key = func.coalesce(col, 0)
 
-    # Stable secondary sort.
-    query = query.order_by(order_expr, models.User.created_at.desc())
+    count_query = query
+    filters_key = (q, tariff_id, activity, inactive_days, platform, region, has_donations)
+    if exact_total:
+        total = count_query.count()
+        total_is_estimate = False
+    else:
+        total = _estimated_users_total(db) if not any(v not in (None, "") for v in filters_key) else None
+        if total is None:
+            total = _cached_users_count(filters_key, count_query.count)
+        total_is_estimate = True
+
+    # Keyset по (sort_key, created_at, id); offset — только для старых клиентов без cursor.
+    keys = (sort_key, models.User.created_at, models.User.id)
+    if cursor:
+        try:
+            c_sb, c_sd, c_key, c_created, c_id = _decode_users_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        if (c_sb, c_sd) != (sb, sd):
+            raise HTTPException(status_code=400, detail="cursor does not match sort")
+        after = tuple_(*keys) > tuple_(c_key, c_created, c_id) if sd == "asc" else tuple_(*keys) < tuple_(c_key, c_created, c_id)
+        query = query.filter(after)
+        offset = 0
 
-    total = query.count()
-    rows = query.offset(offset).limit(limit).all()
+    if sd == "asc":
+        query = query.order_by(*(k.asc() for k in keys))
+    else:
+        query = query.order_by(*(k.desc() for k in keys))
+
+    page = query.add_columns(sort_key.label("_sort_key")).offset(offset).limit(limit + 1).all()
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last_user, last_key = page[-1]
+        next_cursor = _encode_users_cursor(sb, sd, last_key, last_user.created_at, last_user.id)
+    rows = [u for u, _ in page]
 
     user_ids = [u.id for u in rows]
     best_lic = _get_active_licenses_for_users(db, user_ids)
@@ -695,23 +667,6 @@ def list_users(
         )
     }
 
-    # Last LIVE session per user
-    last_live: dict[str, tuple[datetime | None, str | None]] = {}
-    try:
-        ss_rows = (
-            db.query(models.StreamSession)
-            .filter(models.StreamSession.user_id.in_(user_ids))
-            .order_by(models.StreamSession.started_at.desc())
-            .all()
-        )
-        for ss in ss_rows:
-            uid = getattr(ss, "user_id", None)
-            if not uid or uid in last_live:
-                continue
-            last_live[str(uid)] = (getattr(ss, "started_at", None), getattr(ss, "tiktok_username", None))
-    except Exception:
-        last_live = {}
-
     # Streamer gift stats
     streamer_stats: dict[str, models.StreamerStats] = {}
     try:
@@ -736,13 +691,14 @@ def list_users(
         top_donors_7d_by_user = {str(uid): [] for uid in user_ids}
         top_donors_30d_by_user = {str(uid): [] for uid in user_ids}
 
-    # Gift analytics (top-3) by coins, based on raw gift_events
+    # Gift analytics (top-3) by coins, based on the gift_daily_stats rollup
     today = date.today()
     try:
-        top_gifts_all_by_user = _top_gifts(db, user_ids, since_day=None)
-        top_gifts_today_by_user = _top_gifts(db, user_ids, since_day=today)
-        top_gifts_7d_by_user = _top_gifts(db, user_ids, since_day=(today - timedelta(days=6)))
-        top_gifts_30d_by_user = _top_gifts(db, user_ids, since_day=(today - timedelta(days=29)))
+        top_gifts = _top_gifts_by_period(db, user_ids, today=today)
+        top_gifts_all_by_user = top_gifts["all"]
+        top_gifts_today_by_user = top_gifts["today"]
+        top_gifts_7d_by_user = top_gifts["7d"]
+        top_gifts_30d_by_user = top_gifts["30d"]
     except Exception:
         top_gifts_all_by_user = {str(uid): [] for uid in user_ids}
         top_gifts_today_by_user = {str(uid): [] for uid in user_ids}
@@ -758,6 +714,8 @@ def list_users(
 
     return ListUsersResponse(
         total=total,
+        total_is_estimate=total_is_estimate,
+        next_cursor=next_cursor,
         items=[
             AdminUserItem(
                 id=u.id,
@@ -790,8 +748,8 @@ def list_users(
                 client_os=getattr(u, "last_client_os", None),
                 region=getattr(u, "region", None),
                 last_login_at=(getattr(u, "last_login_at", None).isoformat() if getattr(u, "last_login_at", None) else None),
-                last_live_at=(last_live.get(u.id)[0].isoformat() if (last_live.get(u.id) and last_live.get(u.id)[0]) else None),
-                last_live_tiktok_username=(last_live.get(u.id)[1] if last_live.get(u.id) else None),
+                last_live_at=(u.last_live_at.isoformat() if getattr(u, "last_live_at", None) else None),
+                last_live_tiktok_username=getattr(u, "last_live_tiktok_username", None),
                 online_now=_is_online(getattr(u, "last_ws_at", None), ttl_seconds=90),
                 tiktok_accounts_count=int(tiktok_counts.get(u.id, 0)),
                 total_gifts=int(getattr(streamer_stats.get(u.id), "total_gifts", 0) or 0),
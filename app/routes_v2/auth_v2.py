@@ -16,9 +16,11 @@ import hmac
 import re
 from app.services.plans import resolve_tariff
 import secrets
+from functools import lru_cache
 
 from app.services.email_resend import send_email, ResendError
 from app.services.supabase_jwt import verify_supabase_access_token, SupabaseJwtError
+from app.services.principal_cache import PRINCIPALS, attach as attach_principal
 
 
 router = APIRouter()
@@ -611,6 +613,11 @@ def redeem_license(req: RedeemLicenseRequest, db: Session = Depends(get_db)):
     return RedeemLicenseResponse(access_token=token, license_expires_at=lic.expires_at.isoformat() if lic.expires_at else None, plan=lic.plan)
 
 
+@lru_cache(maxsize=8)
+def _superadmin_usernames(raw: str) -> frozenset[str]:
+    return frozenset(u.strip().lower() for u in raw.split(",") if u.strip())
+
+
 def get_current_user(authorization: str | None = Header(default=None), db: Session = Depends(get_db)) -> models.User:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="missing bearer token")
@@ -618,6 +625,16 @@ def get_current_user(authorization: str | None = Header(default=None), db: Sessi
     sub = decode_token(token)
     if not sub:
         raise HTTPException(status_code=401, detail="invalid token")
+
+    # Горячий путь: снимок пользователя из кэша (см. app/services/principal_cache.py), без SELECT.
+    snap = PRINCIPALS.get(token, sub)
+    if snap is not None:
+        user = attach_principal(db, snap)
+        if getattr(user, "is_banned", False):
+            raise HTTPException(status_code=403, detail="user banned")
+        return user
+
+    generation = PRINCIPALS.generation(sub)
     user = db.get(models.User, sub)
     if not user:
         raise HTTPException(status_code=401, detail="user not found")
@@ -629,10 +646,11 @@ def get_current_user(authorization: str | None = Header(default=None), db: Sessi
     # Example: SUPERADMIN_USERNAMES=novaboost,owner
     superadmins_raw = (os.getenv("SUPERADMIN_USERNAMES") or "").strip()
     if superadmins_raw:
-        superadmins = {u.strip().lower() for u in superadmins_raw.split(",") if u.strip()}
+        superadmins = _superadmin_usernames(superadmins_raw)
         if user.username.lower() in superadmins and (user.role or "user") != "superadmin":
             user.role = "superadmin"
             db.commit()
+    PRINCIPALS.put(token, user, generation)
     return user
 
 
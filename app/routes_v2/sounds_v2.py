@@ -8,7 +8,6 @@ from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
-from mutagen import File as MutagenFile
 
 from app.db.database import SessionLocal
 from app.db import models
@@ -85,6 +84,8 @@ def _store_sound_bytes(db: Session, user: models.User, filename: str, content: b
         tmp_path = os.path.join(root, "._tmp_" + filename)
         with open(tmp_path, "wb") as tmp:
             tmp.write(content)
+        from mutagen import File as MutagenFile  # лениво: нужен только при загрузке звука
+
         mf = MutagenFile(tmp_path)
         if mf and mf.info and getattr(mf.info, 'length', None):
             duration_sec = float(mf.info.length)
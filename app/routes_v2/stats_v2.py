@@ -1,10 +1,16 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 
 from app.db.database import SessionLocal
 from app.db import models
+from app.services.gift_stats_service import rolling_donor_coins_tt
+from app.services.gift_export import EXPORT_SLOTS, decode_cursor, stream_export
+from app.services.leaderboard import LEADERBOARDS
+from app.services.stats_timeseries import BUCKET_SECONDS, DEFAULT_SPAN, gift_timeseries
 from .auth_v2 import get_current_user
 
 router = APIRouter()
@@ -36,6 +42,14 @@ def _period_to_column(period: str) -> tuple[str, date | None]:
     raise HTTPException(status_code=400, detail="invalid period")
 
 
+_LEADERBOARD_PERIODS = {
+    "today_coins": "today",
+    "last_7d_coins": "7d",
+    "last_30d_coins": "30d",
+    "total_coins": "all",
+}
+
+
 def _active_streamer_tiktok_username(db: Session, user_id: str) -> str | None:
     """Resolve current stats scope: TikTok username (most recently used)."""
     try:
@@ -120,17 +134,31 @@ def stats_top_donors(
             "donors": [],
         }
 
+    board_period = _LEADERBOARD_PERIODS.get(col_name)
+    if board_period is not None:
+        # In-memory лидерборд (app/services/leaderboard.py): без ORDER BY по donor_stats_tt,
+        # пока стример в памяти. 7d/30d — скользящие окна по дневным корзинам.
+        top = LEADERBOARDS.top(db, streamer_key, board_period, limit)
+        totals = LEADERBOARDS.totals(db, streamer_key, [d for d, _ in top]) if top else {}
+        return {
+            "period": period,
+            "limit": limit,
+            "donors": [
+                {
+                    "donor_username": donor,
+                    "coins": coins,
+                    "total_coins": totals.get(donor, (0, 0))[0],
+                    "total_gifts": totals.get(donor, (0, 0))[1],
+                }
+                for donor, coins in top
+            ],
+        }
+
     q = db.query(models.DonorStatsTikTok).filter(models.DonorStatsTikTok.streamer_tiktok_username == streamer_key)
 
-    # Для today/yesterday используем date-колонки, чтобы не показывать устаревшие значения.
-    if col_name == "today_coins":
-        q = q.filter(models.DonorStatsTikTok.today_date == datetime.utcnow().date())
-    elif col_name == "yesterday_coins":
+    # Для yesterday используем date-колонку, чтобы не показывать устаревшие значения.
+    if col_name == "yesterday_coins":
         q = q.filter(models.DonorStatsTikTok.yesterday_date == (datetime.utcnow().date() - timedelta(days=1)))
-    elif col_name == "last_7d_coins":
-        q = q.filter(models.DonorStatsTikTok.last_7d_anchor == (anchor or datetime.utcnow().date()))
-    elif col_name == "last_30d_coins":
-        q = q.filter(models.DonorStatsTikTok.last_30d_anchor == (anchor or datetime.utcnow().date()))
 
     col = getattr(models.DonorStatsTikTok, col_name)
     rows = q.order_by(col.desc()).limit(limit).all()
@@ -153,6 +181,90 @@ def stats_top_donors(
     }
 
 
+def _parse_utc(raw: str | None, name: str) -> datetime | None:
+    if not raw:
+        return None
+    try:
+        dt = datetime.fromisoformat(raw.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid {name}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+@router.get("/stats/timeseries")
+def stats_timeseries(
+    bucket: str = "hour",
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+    max_points: int = 500,
+    user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    bucket = (bucket or "").strip().lower()
+    if bucket not in BUCKET_SECONDS:
+        raise HTTPException(status_code=400, detail="bucket must be minute|hour|day")
+    max_points = max(1, min(2000, int(max_points)))
+
+    end = _parse_utc(to, "to") or datetime.utcnow()
+    start = _parse_utc(from_, "from") or (end - DEFAULT_SPAN[bucket])
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be < to")
+
+    streamer_key = _active_streamer_tiktok_username(db, str(user.id))
+    if not streamer_key:
+        return {"bucket": bucket, "points": []}
+
+    return gift_timeseries(
+        db,
+        streamer_tiktok_username=streamer_key,
+        bucket=bucket,
+        start=start,
+        end=end,
+        max_points=max_points,
+    )
+
+
+@router.get("/stats/export")
+def stats_export(
+    fmt: str = Query("ndjson", alias="format"),
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+    cursor: str | None = None,
+    user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    fmt = (fmt or "").strip().lower()
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson|csv")
+    start = _parse_utc(from_, "from")
+    end = _parse_utc(to, "to")
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+
+    streamer_key = _active_streamer_tiktok_username(db, str(user.id))
+    if not streamer_key:
+        raise HTTPException(status_code=404, detail="no tiktok account")
+
+    slot = EXPORT_SLOTS.acquire(str(user.id))
+    if slot is None:
+        raise HTTPException(status_code=429, detail="too many exports in progress")
+
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    filename = f"gifts-{streamer_key}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream_export(fmt, streamer_tiktok_username=streamer_key, start=start, end=end, after=after, slot=slot),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(slot.release),
+    )
+
+
 @router.get("/stats/donor/{donor_username}")
 def stats_donor(
     donor_username: str,
@@ -177,13 +289,15 @@ def stats_donor(
     if not r:
         raise HTTPException(status_code=404, detail="donor not found")
 
+    rolling = rolling_donor_coins_tt(db, streamer_tiktok_username=streamer_key, donor_username=key)
+
     return {
         "donor_username": r.donor_username,
         "total_coins": int(r.total_coins or 0),
         "total_gifts": int(r.total_gifts or 0),
         "today_utc": int(r.today_coins or 0) if r.today_date == datetime.utcnow().date() else int(r.today_coins or 0),
         "yesterday_utc": int(r.yesterday_coins or 0),
-        "last_7d": int(r.last_7d_coins or 0),
-        "last_30d": int(r.last_30d_coins or 0),
+        "last_7d": rolling.get(7, 0),
+        "last_30d": rolling.get(30, 0),
         "updated_at": r.updated_at.isoformat() if r.updated_at else None,
     }
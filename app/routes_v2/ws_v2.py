@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import re
+import sys
 import time
 import asyncio
 from datetime import datetime
@@ -18,30 +19,66 @@ from app.services.gift_sounds import get_global_gift_sound_path
 from app.services.plans import TARIFF_FREE, resolve_tariff, normalize_platform
 from app.services.limits import FREE_MAX_TRIGGERS
 from app.services.gift_stats_service import record_gift_and_update_stats
+from app.services.leaderboard import LEADERBOARDS, PERIOD_DAYS, leaderboard_delta
 from app.services.admin_state import STATE as ADMIN_STATE
+from app.services.hot_log import HotLog
+from app.services.stream_summary import StreamSummary
+from app.services.metrics import WS_EVENT_ERRORS, WS_EVENT_SECONDS, begin_unit, end_unit
 
 
 ACTIVE_WS_CONNECTIONS = 0
 
-try:
-    # В новых версиях TikTokLive есть отдельное исключение, дающее понятный текст
-    from TikTokLive.client.errors import UserNotFoundError  # type: ignore
-except Exception:  # pragma: no cover
-    # Фолбэк, если используем стараую версию библиотеки без этого класса
+# Исключения TikTokLive берём, только если библиотеку уже загрузил python-коннектор:
+# с js/synthetic/replay backend они не возникают, и тянуть TikTokLive ради них незачем.
+UserNotFoundError = None
+WebcastBlocked200Error = None
+if "TikTokLive" in sys.modules:
+    try:
+        # В новых версиях TikTokLive есть отдельное исключение, дающее понятный текст
+        from TikTokLive.client.errors import UserNotFoundError  # type: ignore
+    except Exception:  # pragma: no cover
+        pass
+    try:
+        from TikTokLive.client.errors import WebcastBlocked200Error  # type: ignore
+    except Exception:  # pragma: no cover
+        WebcastBlocked200Error = None  # type: ignore
+if UserNotFoundError is None:
+    # Фолбэк, если используем стараую версию библиотеки без этого класса (или TikTokLive не загружен)
     class UserNotFoundError(Exception):  # type: ignore
         pass
 
-try:
-    from TikTokLive.client.errors import WebcastBlocked200Error  # type: ignore
-except Exception:  # pragma: no cover
-    WebcastBlocked200Error = None  # type: ignore
-
 logger = logging.getLogger(__name__)
+hot_log = HotLog(logger)
 router = APIRouter()
 
 WS_DEBUG = str(os.getenv("WS_DEBUG", "")).strip() in ("1", "true", "yes", "on")
 
 
+_WS_EVENTS = ("comment", "gift", "like", "join", "follow", "subscribe", "share", "viewer")
+_WS_EVENT_METRICS = {
+    name: (WS_EVENT_SECONDS.labels(name), WS_EVENT_ERRORS.labels(name), f"ws:{name}") for name in _WS_EVENTS
+}
+
+
+def _instrumented(event: str, cb):
+    """Латентность обработчика события TikTok и SQL на событие — в /metrics."""
+    seconds, errors, scope = _WS_EVENT_METRICS[event]
+
+    async def _wrapper(*args, **kwargs):
+        token, unit = begin_unit(scope)
+        t0 = time.perf_counter()
+        try:
+            return await cb(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - t0)
+            end_unit(token, unit)
+
+    return _wrapper
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -185,13 +222,18 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
     seen_viewers = set()  # Отслеживание зрителей, которых уже «видели» в этой сессии (join или first_message)
     _cooldown = {}  # (scope, trigger_id, username_or_star) -> last_time_monotonic
     active_tiktok_username: str | None = None
+    leaderboard_pinned: str | None = None  # стример, закреплённый в LEADERBOARDS этим WS
     active_stream_session_id: str | None = None
+    stream_summary: StreamSummary | None = None  # итоги текущего эфира, см. _save_stream_summary
     _last_ws_touch_at = 0.0
     last_chat_at = time.monotonic()
     last_silence_emit_at = 0.0
     greeted_in_silence: set[str] = set()
     recent_silence_phrases: list[str] = []
     donor_diamonds_total: dict[str, int] = {}
+    # Подписка на лидерборд (subscribe_leaderboard): period -> последний отправленный top-N
+    leaderboard_sent: dict[str, list[tuple[str, int]]] = {}
+    leaderboard_limit = 10
     _allowed_trigger_ids_cache: set[str] | None = None
     _allowed_trigger_ids_cache_at: float = 0.0
 
@@ -408,6 +450,9 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
     async def on_comment(u: str, text: str):
         nonlocal last_chat_at
         last_chat_at = time.monotonic()
+        if stream_summary is not None:
+            stream_summary.chat()
+            _stream_summary_tick()
         s = get_current_settings()
         voice_id = s["voice_id"]
         sanitized_text = _remove_emojis(text)
@@ -462,7 +507,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             # Важно: не дублируем, если join уже был обработан.
             if u_key not in seen_viewers:
                 if WS_DEBUG:
-                    logger.debug("First message from '%s' -> treat as viewer_join (first seen in session)", u)
+                    hot_log.debug("ws", "First message -> treat as viewer_join (first seen in session)", user=u)
                 await on_join(u)
             
             # Также проверяем viewer_first_message триггеры
@@ -500,6 +545,65 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     break
             _db_release(db)
 
+    def _save_stream_summary(end: bool = False) -> None:
+        """Пишет снимок StreamSummary в StreamSession (чекпоинт или финал с ended_at)."""
+        if not active_stream_session_id:
+            return
+        try:
+            ss = db.get(models.StreamSession, active_stream_session_id)
+            if ss is not None:
+                if stream_summary is not None:
+                    for key, value in stream_summary.columns().items():
+                        setattr(ss, key, value)
+                if end and getattr(ss, "ended_at", None) is None:
+                    ss.ended_at = datetime.utcnow()
+                    ss.status = "ended"
+                db.add(ss)
+                db.commit()
+        except Exception:
+            try:
+                db.rollback()
+            except Exception:
+                pass
+        _db_release(db)
+
+    def _stream_summary_tick() -> None:
+        if stream_summary is not None and stream_summary.checkpoint_due():
+            _save_stream_summary()
+
+    async def _push_leaderboard(full: bool = False) -> None:
+        """Кадры `leaderboard`: полный top-N (full) или только изменения мест/coins с прошлой отправки."""
+        if not leaderboard_sent or not active_tiktok_username:
+            return
+        for period in list(leaderboard_sent):
+            try:
+                cur = LEADERBOARDS.top(db, active_tiktok_username, period, leaderboard_limit)
+            except Exception as e:
+                logger.warning("leaderboard %s for %s failed: %s", period, active_tiktok_username, e)
+                continue
+            frame = {"type": "leaderboard", "period": period, "limit": leaderboard_limit, "full": full}
+            if full:
+                frame["donors"] = [{"donor_username": d, "rank": i + 1, "coins": c} for i, (d, c) in enumerate(cur)]
+            else:
+                delta = leaderboard_delta(leaderboard_sent.get(period) or [], cur)
+                if delta is None:
+                    continue
+                frame.update(delta)
+            leaderboard_sent[period] = cur
+            await websocket.send_text(json.dumps(frame, ensure_ascii=False))
+        _db_release(db)
+
+    def _pin_leaderboard(username: str | None) -> None:
+        """Пока эфир идёт через этот WS, подарки стримера применяются здесь — таблицы из БД не пересеиваются."""
+        nonlocal leaderboard_pinned
+        if username == leaderboard_pinned:
+            return
+        if leaderboard_pinned:
+            LEADERBOARDS.unpin(leaderboard_pinned)
+        leaderboard_pinned = username
+        if username:
+            LEADERBOARDS.pin(username)
+
     async def on_gift(u: str, gift_id: str, gift_name: str, count: int, diamonds: int = 0):
         s = get_current_settings()
         # JoinEvent от TikTok может отсутствовать. Если впервые видим зрителя по подарку — трактуем как viewer_join.
@@ -520,7 +624,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
         except Exception:
             pass
         if WS_DEBUG:
-            logger.debug("on_gift: user=%s gift_id=%s gift_name=%s count=%s diamonds=%s", u, gift_id, gift_name, count, diamonds)
+            hot_log.debug("ws", "on_gift:", user=u, gift_id=gift_id, gift_name=gift_name, count=count, diamonds=diamonds)
         # Ищем триггер для подарка (только звуковые файлы, НЕ TTS!)
         allowed_ids = _get_allowed_trigger_ids()
         q = (
@@ -536,12 +640,12 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             q = q.filter(models.Trigger.id.in_(allowed_ids))
         trig = q.all()
         if WS_DEBUG:
-            logger.debug("on_gift: triggers=%d", len(trig))
+            hot_log.debug("ws", "on_gift:", triggers=len(trig))
         sound_url = None
         for t in trig:
             if WS_DEBUG:
-                logger.debug(
-                    "on_gift: check trigger=%s key=%s val=%r enabled=%s", t.id, t.condition_key, t.condition_value, t.enabled
+                hot_log.debug(
+                    "ws", "on_gift: check", trigger=t.id, key=t.condition_key, val=t.condition_value, enabled=t.enabled
                 )
             
             # Проверяем по gift_id (строгое сравнение строк)
@@ -558,7 +662,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     if fn and s["gift_sounds_enabled"] and _cooldown_allows(t.id, (t.action_params or {}).get("cooldown_seconds")):
                         sound_url = _abs_url(f"/static/sounds/{user_id}/{fn}")
                         if WS_DEBUG:
-                            logger.debug("on_gift: matched by gift_id trigger=%s sound=%s", t.id, fn)
+                            hot_log.debug("ws", "on_gift: matched by gift_id", trigger=t.id, sound=fn)
                         try:
                             t.executed_count += 1
                             db.add(t)
@@ -568,7 +672,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                         break
                 else:
                     if WS_DEBUG:
-                        logger.debug("on_gift: no match gift_id trigger=%s %r != %r", t.id, condition_value, gift_id)
+                        hot_log.debug("ws", "on_gift: no match gift_id", trigger=t.id, expected=condition_value, got=gift_id)
 
             # Проверяем по gift_name (регистронезависимое сравнение)
             elif condition_key == "gift_name" and condition_value:
@@ -579,7 +683,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     if fn and s["gift_sounds_enabled"] and _cooldown_allows(t.id, (t.action_params or {}).get("cooldown_seconds")):
                         sound_url = _abs_url(f"/static/sounds/{user_id}/{fn}")
                         if WS_DEBUG:
-                            logger.debug("on_gift: matched by gift_name trigger=%s sound=%s", t.id, fn)
+                            hot_log.debug("ws", "on_gift: matched by gift_name", trigger=t.id, sound=fn)
                         try:
                             t.executed_count += 1
                             db.add(t)
@@ -589,7 +693,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                         break
                 else:
                     if WS_DEBUG:
-                        logger.debug("on_gift: no match gift_name trigger=%s %r != %r", t.id, condition_value, gift_name)
+                        hot_log.debug("ws", "on_gift: no match gift_name", trigger=t.id, expected=condition_value, got=gift_name)
 
         _db_release(db)
 
@@ -622,9 +726,16 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             # record_gift_and_update_stats сам логирует/rollback'ает, но держим WS стабильным
             pass
         _db_release(db)
+        if stream_summary is not None:
+            stream_summary.gift(_norm_tiktok_login(u), gift_name, int(count or 0), int(diamonds or 0))
+            _stream_summary_tick()
+        raw = json.dumps(payload, ensure_ascii=False)
         if WS_DEBUG:
-            logger.debug("on_gift: send payload=%s", payload)
-        await websocket.send_text(json.dumps(payload, ensure_ascii=False))
+            # Готовая JSON-строка: dict payload пришлось бы форматировать сразу, в event loop.
+            hot_log.debug("ws", "on_gift: send", payload=raw)
+        await websocket.send_text(raw)
+        if leaderboard_sent:
+            await _push_leaderboard()
 
     async def on_like(u: str, count: int):
         # JoinEvent от TikTok может отсутствовать. Если впервые видим зрителя по лайку — трактуем как viewer_join.
@@ -660,13 +771,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             seen_viewers.add(viewer_key)
 
         if WS_DEBUG:
-            logger.debug(
-                "on_join: login=%s nickname=%s key=%s first_time=%s",
-                login_norm,
-                nick_norm,
-                viewer_key,
-                first_time,
-            )
+            hot_log.debug("ws", "on_join:", login=login_norm, nickname=nick_norm, key=viewer_key, first_time=first_time)
         
         s = get_current_settings()
         sound_url = None
@@ -687,12 +792,12 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             q = q.filter(models.Trigger.id.in_(allowed_ids))
         trig = q.all()
         if WS_DEBUG:
-            logger.debug("on_join: triggers=%d", len(trig))
+            hot_log.debug("ws", "on_join:", triggers=len(trig))
         
         autoplay_sound: bool | None = None
         for t in trig:
             if WS_DEBUG:
-                logger.debug("on_join: check trigger=%s key=%s val=%r", t.id, t.condition_key, t.condition_value)
+                hot_log.debug("ws", "on_join: check", trigger=t.id, key=t.condition_key, val=t.condition_value)
 
             ap = t.action_params or {}
             once_per_stream = ap.get("once_per_stream", True)
@@ -715,7 +820,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     if fn and s["viewer_sounds_enabled"] and _cooldown_allows(t.id, (t.action_params or {}).get("cooldown_seconds"), username=viewer_key):
                         sound_url = _abs_url(f"/static/sounds/{user_id}/{fn}")
                         if WS_DEBUG:
-                            logger.debug("on_join: matched trigger=%s sound=%s", t.id, fn)
+                            hot_log.debug("ws", "on_join: matched", trigger=t.id, sound=fn)
                         try:
                             t.executed_count += 1
                             db.add(t)
@@ -737,7 +842,7 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     voice_id = s["voice_id"]
                     tts_url = await generate_tts(phrase, voice_id, user_id=str(user.id))
                     if WS_DEBUG:
-                        logger.debug("on_join: matched tts trigger=%s", t.id)
+                        hot_log.debug("ws", "on_join: matched tts", trigger=t.id)
                     try:
                         t.executed_count += 1
                         db.add(t)
@@ -763,9 +868,10 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
         if tts_url:
             payload["tts_url"] = tts_url
         
+        raw = json.dumps(payload, ensure_ascii=False)
         if WS_DEBUG:
-            logger.debug("on_join: send payload=%s", payload)
-        await websocket.send_text(json.dumps(payload, ensure_ascii=False))
+            hot_log.debug("ws", "on_join: send", payload=raw)
+        await websocket.send_text(raw)
 
         # Silence mode: greet new viewers if chat is already silent
         try:
@@ -875,10 +981,22 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
         await websocket.send_text(json.dumps({"type": "share", "user": u}, ensure_ascii=False))
 
     async def on_viewer(current: int, total: int):
+        if stream_summary is not None:
+            stream_summary.viewers(current)
+            _stream_summary_tick()
         if WS_DEBUG:
-            logger.debug("on_viewer: current=%s total=%s", current, total)
+            hot_log.debug("ws", "on_viewer:", current=current, total=total)
         await websocket.send_text(json.dumps({"type": "viewer", "current": current, "total": total}, ensure_ascii=False))
 
+    on_comment = _instrumented("comment", on_comment)
+    on_gift = _instrumented("gift", on_gift)
+    on_like = _instrumented("like", on_like)
+    on_join = _instrumented("join", on_join)
+    on_follow = _instrumented("follow", on_follow)
+    on_subscribe = _instrumented("subscribe", on_subscribe)
+    on_share = _instrumented("share", on_share)
+    on_viewer = _instrumented("viewer", on_viewer)
+
     # WS control loop
     try:
         async def _safe_send(payload: dict):
@@ -927,10 +1045,14 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
         async def _on_tiktok_connect(username: str):
             nonlocal active_tiktok_username
             active_tiktok_username = username
+            _pin_leaderboard(username)
 
             # Persist LIVE session (best-effort).
             try:
-                nonlocal active_stream_session_id
+                nonlocal active_stream_session_id, stream_summary
+                if active_stream_session_id:
+                    # Переподключение без disconnect: закрываем прошлый эфир с его итогами.
+                    _save_stream_summary(end=True)
                 ss = models.StreamSession(
                     user_id=user_id,
                     tiktok_username=username,
@@ -940,7 +1062,12 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                 db.add(ss)
                 db.flush()
                 active_stream_session_id = getattr(ss, "id", None)
+                db.query(models.User).filter(models.User.id == user_id).update(
+                    {"last_live_at": ss.started_at, "last_live_tiktok_username": username},
+                    synchronize_session=False,
+                )
                 db.commit()
+                stream_summary = StreamSummary(started_at=ss.started_at)
             except Exception:
                 try:
                     db.rollback()
@@ -958,24 +1085,13 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
             nonlocal active_tiktok_username
             if active_tiktok_username == username:
                 active_tiktok_username = None
+                _pin_leaderboard(None)
 
-            # Close LIVE session (best-effort).
-            try:
-                nonlocal active_stream_session_id
-                if active_stream_session_id:
-                    ss = db.get(models.StreamSession, active_stream_session_id)
-                    if ss and getattr(ss, "ended_at", None) is None:
-                        ss.ended_at = datetime.utcnow()
-                        ss.status = "ended"
-                        db.add(ss)
-                        db.commit()
-                active_stream_session_id = None
-            except Exception:
-                try:
-                    db.rollback()
-                except Exception:
-                    pass
-            _db_release(db)
+            # Close LIVE session with its summary (best-effort).
+            nonlocal active_stream_session_id, stream_summary
+            _save_stream_summary(end=True)
+            active_stream_session_id = None
+            stream_summary = None
             auto_reconnect = str(os.getenv("TT_AUTO_RECONNECT", "1")).strip().lower() in ("1", "true", "yes", "on")
             await _safe_send({
                 "type": "status",
@@ -1155,6 +1271,31 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                         "type": "error",
                         "message": _friendly_tiktok_error(e, username),
                     })
+                else:
+                    if leaderboard_sent:
+                        await _push_leaderboard(full=True)
+
+            elif action == "subscribe_leaderboard":
+                # {"action":"subscribe_leaderboard","periods":["today","7d"],"limit":10}
+                raw_periods = data.get("periods") or ["today"]
+                if isinstance(raw_periods, str):
+                    raw_periods = [raw_periods]
+                periods = [str(p).strip().lower() for p in raw_periods if str(p).strip().lower() in PERIOD_DAYS]
+                if not periods:
+                    await _safe_send({"type": "error", "message": f"periods: {', '.join(PERIOD_DAYS)}"})
+                    continue
+                try:
+                    leaderboard_limit = max(1, min(50, int(data.get("limit") or 10)))
+                except Exception:
+                    leaderboard_limit = 10
+                leaderboard_sent.clear()
+                leaderboard_sent.update({p: [] for p in periods})
+                await _safe_send({"type": "leaderboard_subscribed", "periods": periods, "limit": leaderboard_limit})
+                await _push_leaderboard(full=True)
+
+            elif action == "unsubscribe_leaderboard":
+                leaderboard_sent.clear()
+                await _safe_send({"type": "leaderboard_subscribed", "periods": [], "limit": leaderboard_limit})
 
             elif action == "disconnect_tiktok":
                 if tiktok_service.is_running(user_id):
@@ -1163,23 +1304,12 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
                     except Exception:
                         pass
                 active_tiktok_username = None
+                _pin_leaderboard(None)
 
                 # Close session if disconnect callback did not fire.
-                try:
-                    if active_stream_session_id:
-                        ss = db.get(models.StreamSession, active_stream_session_id)
-                        if ss and getattr(ss, "ended_at", None) is None:
-                            ss.ended_at = datetime.utcnow()
-                            ss.status = "ended"
-                            db.add(ss)
-                            db.commit()
-                    active_stream_session_id = None
-                except Exception:
-                    try:
-                        db.rollback()
-                    except Exception:
-                        pass
-                _db_release(db)
+                _save_stream_summary(end=True)
+                active_stream_session_id = None
+                stream_summary = None
                 await _safe_send({
                     "type": "status",
                     "message": "Отключено от TikTok Live",
@@ -1212,8 +1342,11 @@ async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db), autho
         except Exception:
             pass
     finally:
+        _pin_leaderboard(None)
         if tiktok_service.is_running(user_id):
             await tiktok_service.stop_client(user_id)
+        # Итоги на момент закрытия WS (сам эфир мог продолжиться — ended_at не трогаем).
+        _save_stream_summary()
 
         try:
             ACTIVE_WS_CONNECTIONS = max(0, int(ACTIVE_WS_CONNECTIONS) - 1)
@@ -0,0 +1,252 @@
+"""
+Запись и воспроизведение потока событий TikTok-коннектора.
+
+Запись (TIKTOK_RECORD_DIR=/path): любой backend оборачивается в RecordingTikTokService,
+и каждое событие, которое коннектор отдаёт в ws_v2, дописывается в файл
+`<dir>/<username>-<YYYYmmdd-HHMMSS>.ttrec`. Формат — JSON Lines:
+    1-я строка: заголовок {"v":1,"username":...,"started_at":...,"source":...}
+    далее: [dt_ms, kind, *args] — смещение от начала записи и аргументы callback как есть.
+
+Воспроизведение (TIKTOK_CONNECTOR_BACKEND=replay, TIKTOK_REPLAY_FILE=..., TIKTOK_REPLAY_SPEED=1):
+ReplayTikTokService подаёт записанные события в те же callbacks ws_v2 с исходными
+интервалами, ускоренно (N×) или без пауз (0 = максимально быстро) и считает время каждого handler.
+См. tools/replay_events.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+
+# callback-параметр start_client -> короткое имя события в файле
+CALLBACK_KINDS = {
+    "on_comment_callback": "comment",
+    "on_gift_callback": "gift",
+    "on_like_callback": "like",
+    "on_join_callback": "join",
+    "on_follow_callback": "follow",
+    "on_subscribe_callback": "subscribe",
+    "on_share_callback": "share",
+    "on_viewer_callback": "viewer",
+    "on_connect_callback": "connect",
+    "on_disconnect_callback": "disconnect",
+}
+
+# Имя handler, который сейчас выполняется при replay (для атрибуции SQL-запросов).
+current_handler: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tt_replay_handler", default=None)
+
+
+class EventRecorder:
+    """Append-only запись событий одного подключения."""
+
+    def __init__(self, path: str, username: str, source: str = ""):
+        self.path = path
+        self.events = 0
+        self._t0 = time.monotonic()
+        self._last_flush = self._t0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+        self._write({
+            "v": RECORDING_VERSION,
+            "username": username,
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "source": source,
+        })
+
+    def record(self, kind: str, *args: Any) -> None:
+        if self._fh is None:
+            return
+        self.events += 1
+        now = time.monotonic()
+        self._write([int((now - self._t0) * 1000), kind, *args])
+        if now - self._last_flush >= 1.0:
+            self._last_flush = now
+            self._fh.flush()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            finally:
+                self._fh = None
+
+    def _write(self, obj: Any) -> None:
+        try:
+            self._fh.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str))
+            self._fh.write("\n")
+        except Exception as exc:
+            logger.warning("Event recorder %s write failed, recording stopped: %s", self.path, exc)
+            self.close()
+
+
+def read_recording(path: str) -> tuple[dict[str, Any], Iterator[list[Any]]]:
+    """Возвращает (заголовок, итератор событий [dt_ms, kind, *args])."""
+    fh = open(path, "r", encoding="utf-8")
+    header = json.loads(fh.readline() or "{}")
+    if not isinstance(header, dict) or header.get("v") != RECORDING_VERSION:
+        fh.close()
+        raise ValueError(f"Unsupported recording format: {path}")
+
+    def _events() -> Iterator[list[Any]]:
+        with fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except Exception:
+                    # Хвост файла мог оборваться при аварийной остановке.
+                    continue
+                if isinstance(item, list) and len(item) >= 2:
+                    yield item
+
+    return header, _events()
+
+
+class RecordingTikTokService:
+    """Обёртка над любым backend: записывает события, которые тот отдаёт в callbacks."""
+
+    def __init__(self, inner, directory: str):
+        self._inner = inner
+        self._directory = directory
+        self._recorders: dict[str, EventRecorder] = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._inner, name)
+
+    async def start_client(self, user_id: str, tiktok_username: str, **callbacks):
+        uid = str(user_id)
+        old = self._recorders.pop(uid, None)
+        if old is not None:
+            old.close()
+        username = str(tiktok_username or "").strip().lstrip("@").lower() or "unknown"
+        safe = re.sub(r"[^a-z0-9_.-]+", "_", username)
+        path = os.path.join(self._directory, f"{safe}-{datetime.utcnow():%Y%m%d-%H%M%S}.ttrec")
+        recorder = EventRecorder(path, username, source=type(self._inner).__module__)
+        self._recorders[uid] = recorder
+        logger.info("Recording TikTok events for %s to %s", uid, path)
+
+        wrapped = {
+            name: self._wrap(recorder, CALLBACK_KINDS[name], cb) if name in CALLBACK_KINDS and cb is not None else cb
+            for name, cb in callbacks.items()
+        }
+        try:
+            return await self._inner.start_client(user_id, tiktok_username, **wrapped)
+        except Exception:
+            recorder.close()
+            self._recorders.pop(uid, None)
+            raise
+
+    async def stop_client(self, user_id: str):
+        try:
+            return await self._inner.stop_client(user_id)
+        finally:
+            recorder = self._recorders.pop(str(user_id), None)
+            if recorder is not None:
+                logger.info("Recording for %s closed: %s events", user_id, recorder.events)
+                recorder.close()
+
+    def is_running(self, user_id: str) -> bool:
+        return self._inner.is_running(user_id)
+
+    @staticmethod
+    def _wrap(recorder: EventRecorder, kind: str, cb: Callable):
+        async def _recorded(*args):
+            recorder.record(kind, *args)
+            return await cb(*args)
+
+        return _recorded
+
+
+class ReplayTikTokService:
+    """Backend, который проигрывает записанный файл вместо подключения к TikTok."""
+
+    def __init__(self, path: str | None = None, speed: float | None = None):
+        self.path = path or (os.getenv("TIKTOK_REPLAY_FILE") or "").strip()
+        try:
+            self.speed = float(os.getenv("TIKTOK_REPLAY_SPEED") or 1) if speed is None else float(speed)
+        except ValueError:
+            self.speed = 1.0
+        self._clients: dict[str, asyncio.Task] = {}
+        self._desired_usernames: dict[str, str] = {}
+        self.handler_stats: dict[str, dict[str, Any]] = {}
+        self.done = asyncio.Event()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    async def start_client(self, user_id: str, tiktok_username: str, **callbacks):
+        uid = str(user_id)
+        if not self.path:
+            raise RuntimeError("TIKTOK_REPLAY_FILE is not set")
+        header, events = read_recording(self.path)
+        await self.stop_client(uid)
+        self.done.clear()
+        self._desired_usernames[uid] = str(tiktok_username or header.get("username") or "")
+        handlers = {CALLBACK_KINDS[name]: cb for name, cb in callbacks.items() if name in CALLBACK_KINDS and cb is not None}
+        logger.info("Replaying %s (@%s) at speed=%s", self.path, header.get("username"), self.speed or "max")
+
+        connect_cb = handlers.get("connect")
+        if connect_cb is not None:
+            await self._timed("connect", connect_cb, self._desired_usernames[uid])
+        self._clients[uid] = asyncio.create_task(self._play(uid, events, handlers))
+
+    async def stop_client(self, user_id: str):
+        uid = str(user_id)
+        task = self._clients.pop(uid, None)
+        if task is not None and not task.done():
+            task.cancel()
+        self._desired_usernames.pop(uid, None)
+
+    def is_running(self, user_id: str) -> bool:
+        task = self._clients.get(str(user_id))
+        return task is not None and not task.done()
+
+    async def _play(self, uid: str, events: Iterator[list[Any]], handlers: dict[str, Callable]) -> None:
+        self.started_at = time.monotonic()
+        try:
+            for item in events:
+                dt_ms, kind, args = item[0], str(item[1]), item[2:]
+                if kind == "connect":
+                    continue
+                if self.speed > 0:
+                    due = self.started_at + float(dt_ms) / 1000.0 / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                cb = handlers.get(kind)
+                if cb is None:
+                    continue
+                await self._timed(kind, cb, *args)
+                if self.speed <= 0:
+                    # Даём циклу обработать отправку кадров.
+                    await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.finished_at = time.monotonic()
+            self.done.set()
+
+    async def _timed(self, kind: str, cb: Callable, *args) -> None:
+        stat = self.handler_stats.setdefault(kind, {"count": 0, "errors": 0, "durations_ms": []})
+        token = current_handler.set(kind)
+        t0 = time.perf_counter()
+        try:
+            await cb(*args)
+        except Exception as e:
+            stat["errors"] += 1
+            logger.error(f"Ошибка в replay {kind} callback: {e}")
+        finally:
+            stat["durations_ms"].append((time.perf_counter() - t0) * 1000.0)
+            stat["count"] += 1
+            current_handler.reset(token)
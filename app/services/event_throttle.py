@@ -0,0 +1,156 @@
+"""
+Троттлинг «шумных» событий TikTok на уровне коннектора.
+
+Счётчик зрителей: не чаще одного раза в TT_VIEWER_THROTTLE_SEC, последнее значение побеждает
+(промежуточные значения отбрасываются, последнее досылается в конце окна).
+Лайки: суммируются по зрителю в окне TT_LIKE_AGGREGATE_SEC и уходят одним callback.
+0 в любой переменной отключает троттлинг для этого типа событий.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+class EventThrottle:
+    """Троттлинг viewer/like для одного подключения (одного стримера)."""
+
+    def __init__(
+        self,
+        name: str,
+        on_viewer: Callable[[int, int], Awaitable[Any]] | None = None,
+        on_like: Callable[[str, int], Awaitable[Any]] | None = None,
+        viewer_interval: float | None = None,
+        like_window: float | None = None,
+    ):
+        self.name = name
+        self._on_viewer = on_viewer
+        self._on_like = on_like
+        self.viewer_interval = _env_float("TT_VIEWER_THROTTLE_SEC", 2.0) if viewer_interval is None else viewer_interval
+        self.like_window = _env_float("TT_LIKE_AGGREGATE_SEC", 1.0) if like_window is None else like_window
+
+        self._viewer_last_emit = 0.0
+        self._viewer_pending: tuple[int, int] | None = None
+        self._viewer_task: asyncio.Task | None = None
+
+        self._likes_pending: dict[str, int] = {}
+        self._likes_task: asyncio.Task | None = None
+
+        self.stats = {
+            "viewer_in": 0,
+            "viewer_out": 0,
+            "viewer_dropped": 0,
+            "like_in": 0,
+            "like_out": 0,
+            "like_merged": 0,
+        }
+
+    async def viewer(self, current: int, total: int) -> None:
+        if self._on_viewer is None:
+            return
+        self.stats["viewer_in"] += 1
+        now = time.monotonic()
+        if self.viewer_interval <= 0 or (
+            self._viewer_task is None and now - self._viewer_last_emit >= self.viewer_interval
+        ):
+            await self._emit_viewer(current, total)
+            return
+
+        if self._viewer_pending is not None:
+            self.stats["viewer_dropped"] += 1
+        self._viewer_pending = (current, total)
+        if self._viewer_task is None:
+            delay = max(0.0, self.viewer_interval - (now - self._viewer_last_emit))
+            self._viewer_task = asyncio.create_task(self._flush_viewer_later(delay))
+
+    async def like(self, username: str, count: int) -> None:
+        if self._on_like is None:
+            return
+        self.stats["like_in"] += 1
+        if self.like_window <= 0:
+            self.stats["like_out"] += 1
+            await self._call(self._on_like, username, count)
+            return
+
+        if username in self._likes_pending:
+            self.stats["like_merged"] += 1
+        self._likes_pending[username] = self._likes_pending.get(username, 0) + max(0, int(count or 0))
+        if self._likes_task is None:
+            self._likes_task = asyncio.create_task(self._flush_likes_later(self.like_window))
+
+    async def flush(self) -> None:
+        """Досылает накопленное немедленно (например, перед отключением)."""
+        for task in (self._viewer_task, self._likes_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._viewer_task = None
+        self._likes_task = None
+        await self._flush_viewer()
+        await self._flush_likes()
+
+    def close(self) -> None:
+        """Отменяет таймеры без досылки накопленного."""
+        for task in (self._viewer_task, self._likes_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._viewer_task = None
+        self._likes_task = None
+        self._viewer_pending = None
+        self._likes_pending.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            **self.stats,
+            "viewer_interval_sec": self.viewer_interval,
+            "like_window_sec": self.like_window,
+        }
+
+    async def _flush_viewer_later(self, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._viewer_task = None
+        await self._flush_viewer()
+
+    async def _flush_viewer(self) -> None:
+        pending, self._viewer_pending = self._viewer_pending, None
+        if pending is not None:
+            await self._emit_viewer(*pending)
+
+    async def _emit_viewer(self, current: int, total: int) -> None:
+        self._viewer_last_emit = time.monotonic()
+        self.stats["viewer_out"] += 1
+        await self._call(self._on_viewer, current, total)
+
+    async def _flush_likes_later(self, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._likes_task = None
+        await self._flush_likes()
+
+    async def _flush_likes(self) -> None:
+        pending, self._likes_pending = self._likes_pending, {}
+        for username, count in pending.items():
+            self.stats["like_out"] += 1
+            await self._call(self._on_like, username, count)
+
+    async def _call(self, cb, *args) -> None:
+        try:
+            await cb(*args)
+        except Exception as e:
+            logger.error(f"Ошибка в throttled callback ({self.name}): {e}")
@@ -0,0 +1,163 @@
+"""
+Потоковый экспорт истории подарков (gift_events_tt) в NDJSON / CSV.
+
+- Строки читаются серверным курсором (yield_per), память не зависит от объёма истории.
+- Порядок (created_at, id); у каждой строки есть `cursor` — продолжить экспорт после
+  обрыва: ?cursor=<последний полученный>.
+- Своя сессия БД внутри генератора: зависимость get_db закрывается раньше, чем
+  StreamingResponse дочитает тело.
+- Не больше EXPORT_MAX_CONCURRENT_PER_USER одновременных выгрузок на пользователя.
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import and_, or_, select
+
+from app.db import models
+from app.db.database import SessionLocal
+
+EXPORT_COLUMNS = ("created_at", "donor_username", "gift_id", "gift_name", "gift_count", "gift_coins", "cursor")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+EXPORT_MAX_CONCURRENT_PER_USER = _env_int("EXPORT_MAX_CONCURRENT_PER_USER", 2)
+EXPORT_YIELD_PER = _env_int("EXPORT_YIELD_PER", 1000)
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """ValueError, если курсор битый."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, row_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+    return datetime.fromisoformat(created_at), row_id
+
+
+class ExportSlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id: str) -> "_Slot | None":
+        with self._lock:
+            n = self._active.get(user_id, 0)
+            if self.limit > 0 and n >= self.limit:
+                return None
+            self._active[user_id] = n + 1
+        return _Slot(self, user_id)
+
+    def _release(self, slot: "_Slot") -> None:
+        user_id = slot.user_id
+        with self._lock:
+            # Флаг проверяется под тем же lock: release() зовут и из потока threadpool, и из loop.
+            if slot.released:
+                return
+            slot.released = True
+            n = self._active.get(user_id, 0) - 1
+            if n > 0:
+                self._active[user_id] = n
+            else:
+                self._active.pop(user_id, None)
+
+
+class _Slot:
+    """Освобождение идемпотентно: из finally генератора и из background задачи ответа."""
+
+    def __init__(self, owner: ExportSlots, user_id: str):
+        self._owner = owner
+        self.user_id = user_id
+        self.released = False
+
+    def release(self) -> None:
+        self._owner._release(self)
+
+
+EXPORT_SLOTS = ExportSlots(EXPORT_MAX_CONCURRENT_PER_USER)
+
+
+def _iter_rows(
+    streamer_tiktok_username: str,
+    start: datetime | None,
+    end: datetime | None,
+    after: tuple[datetime, str] | None,
+) -> Iterator[dict]:
+    ev = models.GiftEventTikTok
+    stmt = select(
+        ev.id, ev.created_at, ev.donor_username, ev.gift_id, ev.gift_name, ev.gift_count, ev.gift_coins
+    ).where(ev.streamer_tiktok_username == streamer_tiktok_username)
+    if start is not None:
+        stmt = stmt.where(ev.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(ev.created_at < end)
+    if after is not None:
+        stmt = stmt.where(or_(ev.created_at > after[0], and_(ev.created_at == after[0], ev.id > after[1])))
+    stmt = stmt.order_by(ev.created_at, ev.id).execution_options(yield_per=max(1, EXPORT_YIELD_PER))
+
+    db = SessionLocal()
+    try:
+        for r in db.execute(stmt):
+            yield {
+                "created_at": r.created_at.isoformat() + "Z",
+                "donor_username": r.donor_username,
+                "gift_id": r.gift_id,
+                "gift_name": r.gift_name,
+                "gift_count": int(r.gift_count or 0),
+                "gift_coins": int(r.gift_coins or 0),
+                "cursor": encode_cursor(r.created_at, r.id),
+            }
+    finally:
+        db.close()
+
+
+def stream_export(
+    fmt: str,
+    *,
+    streamer_tiktok_username: str,
+    start: datetime | None,
+    end: datetime | None,
+    after: tuple[datetime, str] | None,
+    slot: _Slot,
+    chunk_rows: int = 500,
+) -> Iterator[str]:
+    """Тело ответа кусками по chunk_rows строк."""
+    try:
+        buf = io.StringIO()
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+            writer.writeheader()
+        n = 0
+        for row in _iter_rows(streamer_tiktok_username, start, end, after):
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                buf.write(json.dumps(row, ensure_ascii=False))
+                buf.write("\n")
+            n += 1
+            if n % chunk_rows == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        tail = buf.getvalue()
+        if tail:
+            yield tail
+    finally:
+        slot.release()
@@ -1,10 +1,12 @@
 import logging
 from datetime import datetime, timedelta, date
 
-from sqlalchemy import case
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
 from app.db import models
+from app.services import stats_timeseries
+from app.services.leaderboard import LEADERBOARDS
 
 logger = logging.getLogger(__name__)
 
@@ -243,6 +245,242 @@ def _upsert_donor_stats_tt(
         db.add(models.DonorStatsTikTok(**values))
 
 
+ROLLING_WINDOWS_DAYS = (7, 30)
+DONOR_DAILY_RETENTION_DAYS = max(ROLLING_WINDOWS_DAYS)
+
+
+def _dialect_insert(db: Session, table, values: dict):
+    dialect = _dialect_name(db)
+    try:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+            return pg_insert(table).values(**values)
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+            return sqlite_insert(table).values(**values)
+    except Exception:
+        pass
+    from sqlalchemy import insert
+
+    return insert(table).values(**values)
+
+
+def _upsert_donor_daily_tt(
+    db: Session,
+    *,
+    streamer_tiktok_username: str,
+    donor_username: str,
+    day_utc: date,
+    gift_coins: int,
+    gift_count: int,
+) -> None:
+    """+coins/+gifts в корзину (streamer, donor, day)."""
+    table = models.DonorDailyStatsTikTok.__table__
+    values = {
+        "streamer_tiktok_username": streamer_tiktok_username,
+        "donor_username": donor_username,
+        "day": day_utc,
+        "coins": int(gift_coins),
+        "gifts": int(gift_count),
+        "updated_at": datetime.utcnow(),
+    }
+    insert_stmt = _dialect_insert(db, table, values)
+
+    if hasattr(insert_stmt, "on_conflict_do_update"):
+        excluded = insert_stmt.excluded
+        stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[table.c.streamer_tiktok_username, table.c.donor_username, table.c.day],
+            set_={
+                "coins": table.c.coins + excluded.coins,
+                "gifts": table.c.gifts + excluded.gifts,
+                "updated_at": excluded.updated_at,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    row = (
+        db.query(models.DonorDailyStatsTikTok)
+        .filter(models.DonorDailyStatsTikTok.streamer_tiktok_username == streamer_tiktok_username)
+        .filter(models.DonorDailyStatsTikTok.donor_username == donor_username)
+        .filter(models.DonorDailyStatsTikTok.day == day_utc)
+        .first()
+    )
+    if row:
+        row.coins += int(gift_coins)
+        row.gifts += int(gift_count)
+        row.updated_at = values["updated_at"]
+        db.add(row)
+    else:
+        db.add(models.DonorDailyStatsTikTok(**values))
+
+
+def _upsert_gift_daily_stats(
+    db: Session,
+    *,
+    streamer_id: str,
+    gift_name: str | None,
+    day_utc: date,
+    gift_coins: int,
+    gift_count: int,
+) -> None:
+    """+count/+coins в rollup (streamer_id, gift_name, day) для админской аналитики top gifts."""
+    if not gift_name:
+        return
+    table = models.GiftDailyStats.__table__
+    values = {
+        "streamer_id": streamer_id,
+        "gift_name": str(gift_name),
+        "day": day_utc,
+        "count": int(gift_count),
+        "coins": int(gift_coins) * int(gift_count),
+    }
+    insert_stmt = _dialect_insert(db, table, values)
+
+    if hasattr(insert_stmt, "on_conflict_do_update"):
+        excluded = insert_stmt.excluded
+        stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[table.c.streamer_id, table.c.gift_name, table.c.day],
+            set_={"count": table.c.count + excluded.count, "coins": table.c.coins + excluded.coins},
+        )
+        db.execute(stmt)
+        return
+
+    row = (
+        db.query(models.GiftDailyStats)
+        .filter(models.GiftDailyStats.streamer_id == streamer_id)
+        .filter(models.GiftDailyStats.gift_name == values["gift_name"])
+        .filter(models.GiftDailyStats.day == day_utc)
+        .first()
+    )
+    if row:
+        row.count += values["count"]
+        row.coins += values["coins"]
+        db.add(row)
+    else:
+        db.add(models.GiftDailyStats(**values))
+
+
+def rebuild_gift_daily_stats(db: Session) -> int:
+    """Пересобирает gift_daily_stats целиком из gift_events (один раз после появления таблицы)."""
+    ev = models.GiftEvent
+    rows = (
+        db.query(
+            ev.streamer_id,
+            ev.gift_name,
+            ev.day,
+            func.coalesce(func.sum(ev.gift_count), 0).label("count"),
+            func.coalesce(func.sum(ev.gift_coins * ev.gift_count), 0).label("coins"),
+        )
+        .filter(ev.gift_name.is_not(None))
+        .group_by(ev.streamer_id, ev.gift_name, ev.day)
+        .all()
+    )
+    db.query(models.GiftDailyStats).delete(synchronize_session=False)
+    db.add_all(
+        [
+            models.GiftDailyStats(
+                streamer_id=r.streamer_id,
+                gift_name=r.gift_name,
+                day=r.day,
+                count=int(r.count or 0),
+                coins=int(r.coins or 0),
+            )
+            for r in rows
+        ]
+    )
+    db.commit()
+    return len(rows)
+
+
+def _window_start(days: int, today: date | None = None) -> date:
+    today = today or datetime.utcnow().date()
+    return today - timedelta(days=int(days) - 1)
+
+
+def rolling_donor_coins_tt(
+    db: Session,
+    *,
+    streamer_tiktok_username: str,
+    donor_username: str,
+    today: date | None = None,
+) -> dict[int, int]:
+    """{days: coins} по всем ROLLING_WINDOWS_DAYS для одного донора (≤30 строк)."""
+    t = models.DonorDailyStatsTikTok
+    today = today or datetime.utcnow().date()
+    rows = (
+        db.query(t.day, t.coins)
+        .filter(t.streamer_tiktok_username == _norm_username(streamer_tiktok_username))
+        .filter(t.donor_username == _norm_username(donor_username))
+        .filter(t.day >= _window_start(DONOR_DAILY_RETENTION_DAYS, today))
+        .all()
+    )
+    out = {}
+    for days in ROLLING_WINDOWS_DAYS:
+        start = _window_start(days, today)
+        out[days] = sum(int(r.coins or 0) for r in rows if r.day >= start)
+    return out
+
+
+def compact_donor_daily_tt(
+    db: Session,
+    *,
+    keep_days: int = DONOR_DAILY_RETENTION_DAYS,
+    batch_size: int = 5000,
+    today: date | None = None,
+) -> int:
+    """Удаляет корзины старше самого длинного окна пачками (короткие транзакции). Возвращает число строк."""
+    t = models.DonorDailyStatsTikTok
+    cutoff = _window_start(keep_days, today)
+    deleted = 0
+    while True:
+        ids = [r.id for r in db.query(t.id).filter(t.day < cutoff).limit(int(batch_size)).all()]
+        if not ids:
+            return deleted
+        db.query(t).filter(t.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+
+
+def backfill_donor_daily_tt(db: Session, *, days: int = DONOR_DAILY_RETENTION_DAYS, today: date | None = None) -> int:
+    """Пересобирает корзины за последние `days` дней из gift_events_tt (один раз после деплоя)."""
+    t = models.DonorDailyStatsTikTok
+    ev = models.GiftEventTikTok
+    start = _window_start(days, today)
+    now = datetime.utcnow()
+
+    db.query(t).filter(t.day >= start).delete(synchronize_session=False)
+    rows = (
+        db.query(
+            ev.streamer_tiktok_username,
+            ev.donor_username,
+            ev.day,
+            func.coalesce(func.sum(ev.gift_coins), 0).label("coins"),
+            func.coalesce(func.sum(ev.gift_count), 0).label("gifts"),
+        )
+        .filter(ev.day >= start)
+        .group_by(ev.streamer_tiktok_username, ev.donor_username, ev.day)
+        .all()
+    )
+    db.add_all(
+        [
+            t(
+                streamer_tiktok_username=r.streamer_tiktok_username,
+                donor_username=r.donor_username,
+                day=r.day,
+                coins=int(r.coins),
+                gifts=int(r.gifts),
+                updated_at=now,
+            )
+            for r in rows
+        ]
+    )
+    db.commit()
+    return len(rows)
+
+
 def _upsert_streamer_stats(
     db: Session,
     *,
@@ -491,6 +729,14 @@ def record_gift_and_update_stats(
                 gift_coins=int(gift_coins or 0),
                 gift_count=int(gift_count or 0),
             )
+            _upsert_donor_daily_tt(
+                db,
+                streamer_tiktok_username=streamer_tt,
+                donor_username=donor_username_norm,
+                day_utc=day_utc,
+                gift_coins=int(gift_coins or 0),
+                gift_count=int(gift_count or 0),
+            )
             _upsert_streamer_stats_tt(
                 db,
                 streamer_tiktok_username=streamer_tt,
@@ -520,6 +766,14 @@ def record_gift_and_update_stats(
                 gift_coins=int(gift_coins or 0),
                 gift_count=int(gift_count or 0),
             )
+            _upsert_gift_daily_stats(
+                db,
+                streamer_id=streamer_id,
+                gift_name=str(gift_name) if gift_name is not None else None,
+                day_utc=day_utc,
+                gift_coins=int(gift_coins or 0),
+                gift_count=int(gift_count or 0),
+            )
             _upsert_streamer_stats(
                 db,
                 streamer_id=streamer_id,
@@ -532,3 +786,20 @@ def record_gift_and_update_stats(
     except Exception:
         db.rollback()
         logger.exception("Failed to record gift stats")
+        return
+
+    if streamer_tt:
+        try:
+            LEADERBOARDS.record_gift(
+                db,
+                streamer_tiktok_username=streamer_tt,
+                donor_username=donor_username_norm,
+                gift_coins=int(gift_coins or 0),
+                gift_count=int(gift_count or 0),
+                day_utc=day_utc,
+            )
+        except Exception:
+            logger.exception("Failed to update in-memory leaderboard")
+        if stats_timeseries.is_backdated(created_at_utc):
+            # Запись задним числом (replay): закэшированные корзины таймсерий её не видели.
+            stats_timeseries.invalidate_streamer(streamer_tt, since=created_at_utc)
@@ -0,0 +1,239 @@
+"""
+Фоновый сэмплер метрик хоста для /v2/admin/server/status.
+
+Раз в HOST_METRICS_INTERVAL_SEC снимает CPU, память, диск, load average, лаг event loop,
+число открытых WS и TikTok-клиентов и кладёт снимок в кольцевой буфер
+(HOST_METRICS_HISTORY точек). Эндпойнт отдаёт последний снимок и хвост истории сразу,
+без блокирующего cpu_percent(interval=0.1) на каждый запрос.
+
+CPU считается по разнице счётчиков /proc/stat (или psutil.cpu_percent(None)) между
+соседними снимками — без sleep. Чтение /proc и statvfs идёт в thread pool, чтобы
+медленная ФС не тормозила event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+HOST_METRICS_INTERVAL_SEC = max(0.5, _env_float("HOST_METRICS_INTERVAL_SEC", 5.0))
+HOST_METRICS_HISTORY = max(1, int(_env_float("HOST_METRICS_HISTORY", 360)))
+
+
+def _try_import_psutil():
+    try:
+        import psutil  # type: ignore
+        return psutil
+    except Exception:
+        return None
+
+
+def _read_proc_uptime_sec() -> int | None:
+    try:
+        with open("/proc/uptime", "r", encoding="utf-8", errors="ignore") as f:
+            raw = (f.read() or "").strip().split()
+        if not raw:
+            return None
+        return int(float(raw[0]))
+    except Exception:
+        return None
+
+
+def _read_meminfo_bytes() -> tuple[int | None, int | None]:
+    """Returns (total_bytes, available_bytes) best-effort."""
+    try:
+        mem_total_kb = None
+        mem_avail_kb = None
+        with open("/proc/meminfo", "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    mem_total_kb = int(line.split()[1])
+                elif line.startswith("MemAvailable:"):
+                    mem_avail_kb = int(line.split()[1])
+                if mem_total_kb is not None and mem_avail_kb is not None:
+                    break
+        if mem_total_kb is None or mem_avail_kb is None:
+            return (None, None)
+        return (mem_total_kb * 1024, mem_avail_kb * 1024)
+    except Exception:
+        return (None, None)
+
+
+def _read_proc_cpu_times() -> tuple[int, int] | None:
+    """(total, idle) jiffies из строки `cpu` в /proc/stat."""
+    try:
+        with open("/proc/stat", "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("cpu "):
+                    parts = line.strip().split()
+                    nums = [int(x) for x in parts[1:] if x.isdigit()]
+                    if len(nums) < 4:
+                        return None
+                    total = sum(nums)
+                    idle = nums[3] + (nums[4] if len(nums) > 4 else 0)
+                    return (total, idle)
+        return None
+    except Exception:
+        return None
+
+
+class HostMetricsSampler:
+    def __init__(self, interval_sec: float, history: int):
+        self.interval_sec = interval_sec
+        self.history: deque[dict] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._psutil = _try_import_psutil()
+        self._prev_cpu: tuple[int, int] | None = None
+        self._task: asyncio.Task | None = None
+        # Источники счётчиков регистрируются снаружи (ws_v2, tiktok runtime), чтобы не тянуть импорты сюда.
+        self._counters: dict[str, Callable[[], int]] = {}
+        if self._psutil is not None:
+            try:
+                self._psutil.cpu_percent(interval=None)  # первый вызов всегда 0.0 — «заводим» базу
+            except Exception:
+                pass
+        else:
+            self._prev_cpu = _read_proc_cpu_times()
+
+    def register_counter(self, name: str, fn: Callable[[], int]) -> None:
+        self._counters[name] = fn
+
+    def _cpu_percent(self) -> float | None:
+        if self._psutil is not None:
+            try:
+                return float(self._psutil.cpu_percent(interval=None))
+            except Exception:
+                return None
+        cur = _read_proc_cpu_times()
+        prev, self._prev_cpu = self._prev_cpu, cur
+        if cur is None or prev is None:
+            return None
+        total_delta = cur[0] - prev[0]
+        idle_delta = cur[1] - prev[1]
+        if total_delta <= 0:
+            return None
+        usage = (1.0 - (idle_delta / total_delta)) * 100.0
+        return round(float(max(0.0, min(100.0, usage))), 2)
+
+    def _host_sample(self) -> dict:
+        """Блокирующая часть (файлы /proc, statvfs) — вызывается из thread pool."""
+        psutil = self._psutil
+        s: dict = {}
+
+        try:
+            la = os.getloadavg()
+            s["load1"], s["load5"], s["load15"] = float(la[0]), float(la[1]), float(la[2])
+        except Exception:
+            pass
+
+        s["cpu_percent"] = self._cpu_percent()
+        try:
+            s["cpu_count"] = int((psutil.cpu_count(logical=True) if psutil is not None else os.cpu_count()) or 0) or None
+        except Exception:
+            s["cpu_count"] = None
+
+        try:
+            if psutil is not None:
+                vm = psutil.virtual_memory()
+                s["mem_total_mb"] = int(vm.total // (1024 * 1024))
+                s["mem_used_mb"] = int(vm.used // (1024 * 1024))
+                s["mem_used_percent"] = float(vm.percent)
+            else:
+                total_b, avail_b = _read_meminfo_bytes()
+                if total_b is not None and avail_b is not None:
+                    used_b = max(0, total_b - avail_b)
+                    s["mem_total_mb"] = int(total_b // (1024 * 1024))
+                    s["mem_used_mb"] = int(used_b // (1024 * 1024))
+                    if total_b > 0:
+                        s["mem_used_percent"] = round((used_b / total_b) * 100.0, 2)
+        except Exception:
+            pass
+
+        disk_path = os.getenv("TT_DISK_PATH", "/") or "/"
+        s["disk_path"] = disk_path
+        try:
+            du = shutil.disk_usage(disk_path)
+            s["disk_total_gb"] = int(du.total // (1024 ** 3))
+            s["disk_used_gb"] = int(du.used // (1024 ** 3))
+            if du.total > 0:
+                s["disk_used_percent"] = round((du.used / du.total) * 100.0, 2)
+        except Exception:
+            pass
+
+        try:
+            if psutil is not None:
+                s["uptime_sec"] = int(time.time() - float(psutil.boot_time()))
+            else:
+                s["uptime_sec"] = _read_proc_uptime_sec()
+        except Exception:
+            s["uptime_sec"] = None
+        return s
+
+    def _record(self, host: dict, loop_lag_ms: float | None) -> dict:
+        sample = {"ts": datetime.utcnow().isoformat() + "Z", **host, "loop_lag_ms": loop_lag_ms}
+        for name, fn in self._counters.items():
+            try:
+                sample[name] = int(fn())
+            except Exception:
+                sample[name] = None
+        with self._lock:
+            self.history.append(sample)
+        return sample
+
+    def sample_now(self) -> dict:
+        """Синхронный снимок (если фоновый цикл ещё не успел/не запущен)."""
+        return self._record(self._host_sample(), None)
+
+    def latest(self) -> dict | None:
+        with self._lock:
+            return self.history[-1] if self.history else None
+
+    def series(self, points: int) -> list[dict]:
+        if points <= 0:
+            return []
+        with self._lock:
+            items = list(self.history)
+        return items[-points:]
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                t0 = loop.time()
+                await asyncio.sleep(self.interval_sec)
+                # Лаг: насколько позже заказанного нас разбудили.
+                lag_ms = max(0.0, (loop.time() - t0 - self.interval_sec) * 1000.0)
+                host = await asyncio.to_thread(self._host_sample)
+                self._record(host, round(lag_ms, 2))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("host metrics sample failed")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+HOST_METRICS = HostMetricsSampler(HOST_METRICS_INTERVAL_SEC, HOST_METRICS_HISTORY)
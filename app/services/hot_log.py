@@ -0,0 +1,213 @@
+"""
+Логирование горячего пути (события TikTok, ws_v2) с сэмплированием.
+
+HOT_LOG_MODE=full (по умолчанию) — пишем всё, как раньше.
+HOT_LOG_MODE=sampled — по категориям пишем только долю сообщений:
+    HOT_LOG_SAMPLE="comment=0.01,gift=1,dedup=0.1,viewer=0,like=0,join=0.05,ws=0.01"
+    HOT_LOG_SAMPLE_DEFAULT=1 — доля для категорий, не указанных явно
+    HOT_LOG_SUMMARY_SEC=30 — не чаще этого пишем «N similar messages suppressed»
+Поля передаются структурно (user=..., count=...) и форматируются только при реальной записи.
+
+install_queue_logging() переносит обработчики root-логгера за QueueHandler:
+форматирование и запись в файл идут в отдельном потоке, а не в event loop.
+Если очередь переполнена, INFO/DEBUG отбрасываются (счётчики — queue_stats(), в /status),
+а WARNING и выше пишутся синхронно в вызывающем потоке.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+
+def _parse_rates(raw: str) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for part in (raw or "").replace(";", ",").split(","):
+        if "=" not in part:
+            continue
+        key, _, value = part.partition("=")
+        try:
+            rates[key.strip().lower()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+SAMPLED = (os.getenv("HOT_LOG_MODE") or "full").strip().lower() == "sampled"
+_RATES = _parse_rates(os.getenv("HOT_LOG_SAMPLE") or "")
+try:
+    _DEFAULT_RATE = min(1.0, max(0.0, float(os.getenv("HOT_LOG_SAMPLE_DEFAULT") or 1)))
+except ValueError:
+    _DEFAULT_RATE = 1.0
+try:
+    _SUMMARY_SEC = max(1.0, float(os.getenv("HOT_LOG_SUMMARY_SEC") or 30))
+except ValueError:
+    _SUMMARY_SEC = 30.0
+
+
+class _Fields:
+    """key=value хвост сообщения; строится только если запись реально форматируется."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict[str, Any]):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return " ".join(f"{k}={v}" for k, v in self.fields.items())
+
+
+class HotLog:
+    """Обёртка над модульным логгером для событий горячего пути."""
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._suppressed: dict[str, int] = {}
+        self._last_summary: dict[str, float] = {}
+
+    def sample(self, category: str) -> bool:
+        """True — сообщение этой категории нужно писать."""
+        if not SAMPLED:
+            return True
+        rate = _RATES.get(category, _DEFAULT_RATE)
+        if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+            return True
+        self._suppressed[category] = self._suppressed.get(category, 0) + 1
+        now = time.monotonic()
+        last = self._last_summary.setdefault(category, now)
+        if now - last >= _SUMMARY_SEC:
+            count = self._suppressed.pop(category, 0)
+            self._last_summary[category] = now
+            self.logger.info("[hot-log] %s: %d similar messages suppressed in last %.0fs", category, count, now - last)
+        return False
+
+    def log(self, level: int, category: str, msg: str, **fields: Any) -> None:
+        if not self.logger.isEnabledFor(level) or not self.sample(category):
+            return
+        if fields:
+            self.logger.log(level, "%s %s", msg, _Fields(fields))
+        else:
+            self.logger.log(level, msg)
+
+    def info(self, category: str, msg: str, **fields: Any) -> None:
+        self.log(logging.INFO, category, msg, **fields)
+
+    def debug(self, category: str, msg: str, **fields: Any) -> None:
+        self.log(logging.DEBUG, category, msg, **fields)
+
+    def suppressed(self) -> dict[str, int]:
+        return dict(self._suppressed)
+
+
+_STABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def _is_stable(value: Any) -> bool:
+    if isinstance(value, _STABLE_TYPES):
+        return True
+    if isinstance(value, _Fields):
+        return all(isinstance(v, _STABLE_TYPES) for v in value.fields.values())
+    return False
+
+
+_QUEUE_STATS: dict[str, int] = {"dropped": 0, "sync_fallback": 0}
+_QUEUE_STATS_LOCK = threading.Lock()
+
+
+def queue_stats() -> dict[str, Any]:
+    with _QUEUE_STATS_LOCK:
+        stats: dict[str, Any] = dict(_QUEUE_STATS)
+    stats["enabled"] = _listener is not None
+    stats["queued"] = _listener.queue.qsize() if _listener is not None else 0
+    return stats
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.listener: QueueListener | None = None
+
+    # Стандартный prepare() форматирует запись в вызывающем потоке; нам нужно наоборот —
+    # кроме аргументов, которые к моменту записи могут измениться (dict/list payload,
+    # ORM-объекты с ленивой загрузкой через чужую сессию): такие сообщения собираем сразу.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args:
+            # Один dict-аргумент logging кладёт в args как есть — он может быть и самим payload.
+            if isinstance(args, dict) or not all(_is_stable(v) for v in args):
+                record.msg = record.getMessage()
+                record.args = None
+        elif not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        listener = self.listener
+        if record.levelno >= logging.WARNING and listener is not None:
+            # Предупреждения и ошибки не теряем: пишем сами, обработчики потокобезопасны.
+            with _QUEUE_STATS_LOCK:
+                _QUEUE_STATS["sync_fallback"] += 1
+            listener.handle(record)
+            return
+        with _QUEUE_STATS_LOCK:
+            _QUEUE_STATS["dropped"] += 1
+
+
+_listener: QueueListener | None = None
+_extra_listeners: list[QueueListener] = []
+_listener_lock = threading.Lock()
+
+
+def install_queue_logging(max_queue: int = 10000) -> bool:
+    """Переводит обработчики root-логгера на фоновый поток. Идемпотентно."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return False
+        root = logging.getLogger()
+        handlers = [h for h in root.handlers if not isinstance(h, QueueHandler)]
+        if not handlers:
+            return False
+        q: queue.Queue = queue.Queue(max_queue)
+        handler = _DeferredQueueHandler(q)
+        for h in handlers:
+            root.removeHandler(h)
+        root.addHandler(handler)
+        _listener = QueueListener(q, *handlers, respect_handler_level=True)
+        handler.listener = _listener
+        _listener.start()
+        return True
+
+
+def queued_handler(*handlers: logging.Handler, max_queue: int = 10000) -> QueueHandler:
+    """Обработчики за собственной очередью и фоновым потоком — для логгеров с propagate=False
+    (отдельный файл отчётов), которые не проходят через очередь root-логгера."""
+    q: queue.Queue = queue.Queue(max_queue)
+    handler = _DeferredQueueHandler(q)
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    handler.listener = listener
+    with _listener_lock:
+        _extra_listeners.append(listener)
+    listener.start()
+    return handler
+
+
+def stop_queue_logging() -> None:
+    global _listener
+    with _listener_lock:
+        while _extra_listeners:
+            _extra_listeners.pop().stop()
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,356 @@
+"""
+In-memory лидерборды доноров по стримеру (TikTok username).
+
+Для каждого стримера держим отсортированные таблицы по периодам today / 7d / 30d / all:
+список ключей (-coins, donor) под bisect + dict donor -> coins. top-N — срез списка
+(O(log n + N)), обновление — bisect + вставка в список.
+
+- Обновляются из record_gift_and_update_stats после commit (только если стример уже в памяти).
+- Засеваются из БД при первом обращении: today/7d/30d из donor_daily_stats_tt (все доноры окна),
+  all — из donor_stats_tt (top LEADERBOARD_SEED_LIMIT; для неизвестного донора в усечённой
+  таблице итог читается точечно из donor_stats_tt).
+- Смена UTC-дня сбрасывает стримера (7d/30d сдвигаются на день) — пересев при следующем обращении.
+- Подарки применяются только в воркере, где открыт WS стримера: ws_v2 закрепляет стримера
+  (pin/unpin) на время LIVE-подключения, и в эфире такой стример из БД не перечитывается.
+  В остальных воркерах (uvicorn --workers N) таблицы не обновляются, поэтому незакреплённый
+  стример пересеивается, если с засева и с последнего подарка прошло больше
+  LEADERBOARD_MAX_SEED_AGE_SEC.
+- Неактивные незакреплённые стримеры (нет чтений/подарков LEADERBOARD_IDLE_SEC) выгружаются.
+
+Best-effort: подарок, закоммиченный ровно во время засева, может посчитаться дважды
+или потеряться — расхождение живёт до конца UTC-дня / выгрузки.
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+logger = logging.getLogger(__name__)
+
+PERIOD_DAYS = {"today": 1, "7d": 7, "30d": 30, "all": None}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+LEADERBOARD_IDLE_SEC = _env_int("LEADERBOARD_IDLE_SEC", 900)
+LEADERBOARD_SEED_LIMIT = _env_int("LEADERBOARD_SEED_LIMIT", 2000)
+LEADERBOARD_MAX_SEED_AGE_SEC = _env_int("LEADERBOARD_MAX_SEED_AGE_SEC", 30)
+
+
+def _norm(s: str | None) -> str:
+    return (s or "").strip().lstrip("@").lower()
+
+
+class DonorLeaderboard:
+    """Отсортированная таблица donor -> coins одного периода."""
+
+    __slots__ = ("_keys", "_coins", "gifts", "truncated")
+
+    def __init__(self, coins: dict[str, int] | None = None, gifts: dict[str, int] | None = None, truncated: bool = False):
+        self._coins: dict[str, int] = dict(coins or {})
+        self._keys: list[tuple[int, str]] = sorted((-c, d) for d, c in self._coins.items())
+        self.gifts: dict[str, int] = dict(gifts or {})
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self._coins)
+
+    def __contains__(self, donor: str) -> bool:
+        return donor in self._coins
+
+    def get(self, donor: str) -> int | None:
+        return self._coins.get(donor)
+
+    def set(self, donor: str, coins: int) -> None:
+        old = self._coins.get(donor)
+        if old is not None:
+            i = bisect.bisect_left(self._keys, (-old, donor))
+            del self._keys[i]
+        self._coins[donor] = int(coins)
+        bisect.insort(self._keys, (-int(coins), donor))
+
+    def add(self, donor: str, coins: int) -> int:
+        value = (self._coins.get(donor) or 0) + int(coins)
+        self.set(donor, value)
+        return value
+
+    def rank(self, donor: str) -> int | None:
+        """1-based место донора или None."""
+        coins = self._coins.get(donor)
+        if coins is None:
+            return None
+        return bisect.bisect_left(self._keys, (-coins, donor)) + 1
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        return [(d, -c) for c, d in self._keys[: max(0, int(n))]]
+
+
+def leaderboard_delta(prev: list[tuple[str, int]], cur: list[tuple[str, int]]) -> dict | None:
+    """Разница двух top-N: вошёл / сменил место / изменились coins, и кто выпал. None — без изменений."""
+    prev_pos = {d: (i + 1, c) for i, (d, c) in enumerate(prev)}
+    changes = []
+    for i, (donor, coins) in enumerate(cur):
+        rank = i + 1
+        old = prev_pos.get(donor)
+        if old is None:
+            changes.append({"donor_username": donor, "rank": rank, "coins": coins, "prev_rank": None, "change": "entered"})
+        elif old[0] != rank:
+            changes.append({"donor_username": donor, "rank": rank, "coins": coins, "prev_rank": old[0], "change": "moved"})
+        elif old[1] != coins:
+            changes.append({"donor_username": donor, "rank": rank, "coins": coins, "prev_rank": rank, "change": "coins"})
+    cur_donors = {d for d, _ in cur}
+    left = [d for d, _ in prev if d not in cur_donors]
+    if not changes and not left:
+        return None
+    return {"changes": changes, "left": left}
+
+
+class _StreamerBoards:
+    __slots__ = ("streamer", "day", "boards", "last_access", "fresh_at", "lock")
+
+    def __init__(self, streamer: str, day: date, boards: dict[str, DonorLeaderboard]):
+        self.streamer = streamer
+        self.day = day
+        self.boards = boards
+        self.last_access = time.monotonic()
+        self.fresh_at = self.last_access  # засев или последний подарок, применённый в этом воркере
+        self.lock = threading.Lock()
+
+
+def _seed(db: Session, streamer: str, today: date) -> dict[str, DonorLeaderboard]:
+    boards: dict[str, DonorLeaderboard] = {}
+    t = models.DonorDailyStatsTikTok
+    rows = (
+        db.query(t.donor_username, t.day, t.coins)
+        .filter(t.streamer_tiktok_username == streamer)
+        .filter(t.day >= today - timedelta(days=29))
+        .all()
+    )
+    for period, days in PERIOD_DAYS.items():
+        if days is None:
+            continue
+        start = today - timedelta(days=days - 1)
+        acc: dict[str, int] = {}
+        for r in rows:
+            if r.day >= start:
+                acc[r.donor_username] = acc.get(r.donor_username, 0) + int(r.coins or 0)
+        boards[period] = DonorLeaderboard(acc)
+
+    s = models.DonorStatsTikTok
+    limit = max(1, LEADERBOARD_SEED_LIMIT)
+    top_all = (
+        db.query(s.donor_username, s.total_coins, s.total_gifts)
+        .filter(s.streamer_tiktok_username == streamer)
+        .order_by(s.total_coins.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    truncated = len(top_all) > limit
+    top_all = top_all[:limit]
+    boards["all"] = DonorLeaderboard(
+        {r.donor_username: int(r.total_coins or 0) for r in top_all},
+        gifts={r.donor_username: int(r.total_gifts or 0) for r in top_all},
+        truncated=truncated,
+    )
+    return boards
+
+
+class LeaderboardRegistry:
+    def __init__(self, idle_sec: int | None = None, max_seed_age_sec: int | None = None):
+        self.idle_sec = LEADERBOARD_IDLE_SEC if idle_sec is None else idle_sec
+        self.max_seed_age_sec = LEADERBOARD_MAX_SEED_AGE_SEC if max_seed_age_sec is None else max_seed_age_sec
+        self._streamers: dict[str, _StreamerBoards] = {}
+        self._pins: dict[str, int] = {}  # streamer -> число LIVE-подключений в этом воркере
+        self._lock = threading.Lock()
+        self._last_evict = time.monotonic()
+        self.stats = {"hits": 0, "seeds": 0, "updates": 0, "evictions": 0, "reseeds": 0, "point_lookups": 0}
+
+    def _get(self, streamer: str, today: date) -> _StreamerBoards | None:
+        entry = self._streamers.get(streamer)
+        if entry is None:
+            return None
+        if entry.day != today:
+            self._streamers.pop(streamer, None)
+            return None
+        if (
+            self.max_seed_age_sec > 0
+            and streamer not in self._pins
+            and time.monotonic() - entry.fresh_at > self.max_seed_age_sec
+        ):
+            # Подарки этого стримера идут мимо нас (WS в другом воркере) — таблицы могли отстать.
+            self._streamers.pop(streamer, None)
+            self.stats["reseeds"] += 1
+            return None
+        return entry
+
+    def _ensure(self, db: Session, streamer: str) -> _StreamerBoards:
+        today = datetime.utcnow().date()
+        self._maybe_evict()
+        with self._lock:
+            entry = self._get(streamer, today)
+        if entry is not None:
+            self.stats["hits"] += 1
+            entry.last_access = time.monotonic()
+            return entry
+
+        boards = _seed(db, streamer, today)
+        with self._lock:
+            entry = self._get(streamer, today)
+            if entry is None:
+                entry = _StreamerBoards(streamer, today, boards)
+                self._streamers[streamer] = entry
+                self.stats["seeds"] += 1
+        entry.last_access = time.monotonic()
+        return entry
+
+    def top(self, db: Session, streamer_tiktok_username: str, period: str, n: int) -> list[tuple[str, int]]:
+        streamer = _norm(streamer_tiktok_username)
+        if period not in PERIOD_DAYS:
+            raise ValueError(f"unknown period {period!r}")
+        entry = self._ensure(db, streamer)
+        with entry.lock:
+            return entry.boards[period].top(n)
+
+    def totals(self, db: Session, streamer_tiktok_username: str, donors: list[str]) -> dict[str, tuple[int, int]]:
+        """{donor: (total_coins, total_gifts)} из таблицы all; отсутствующих — из donor_stats_tt."""
+        streamer = _norm(streamer_tiktok_username)
+        entry = self._ensure(db, streamer)
+        out: dict[str, tuple[int, int]] = {}
+        with entry.lock:
+            board = entry.boards["all"]
+            for d in donors:
+                coins = board.get(d)
+                if coins is not None:
+                    out[d] = (coins, board.gifts.get(d, 0))
+        missing = [d for d in donors if d not in out]
+        if missing:
+            s = models.DonorStatsTikTok
+            for r in (
+                db.query(s.donor_username, s.total_coins, s.total_gifts)
+                .filter(s.streamer_tiktok_username == streamer)
+                .filter(s.donor_username.in_(missing))
+                .all()
+            ):
+                out[r.donor_username] = (int(r.total_coins or 0), int(r.total_gifts or 0))
+        return out
+
+    def record_gift(
+        self,
+        db: Session,
+        *,
+        streamer_tiktok_username: str,
+        donor_username: str,
+        gift_coins: int,
+        gift_count: int,
+        day_utc: date,
+    ) -> None:
+        """Вызывается после commit подарка. Стримеры не в памяти пропускаются (засеются из БД)."""
+        streamer = _norm(streamer_tiktok_username)
+        donor = _norm(donor_username)
+        if not streamer or not donor:
+            return
+        with self._lock:
+            entry = self._get(streamer, day_utc)
+        if entry is None:
+            return
+
+        all_total: tuple[int, int] | None = None
+        with entry.lock:
+            need_lookup = entry.boards["all"].truncated and donor not in entry.boards["all"]
+        if need_lookup:
+            # Подарок уже закоммичен — в donor_stats_tt итог с ним.
+            self.stats["point_lookups"] += 1
+            s = models.DonorStatsTikTok
+            row = (
+                db.query(s.total_coins, s.total_gifts)
+                .filter(s.streamer_tiktok_username == streamer)
+                .filter(s.donor_username == donor)
+                .first()
+            )
+            all_total = (int(row.total_coins or 0), int(row.total_gifts or 0)) if row else (int(gift_coins), int(gift_count))
+
+        with entry.lock:
+            for period, board in entry.boards.items():
+                if period == "all":
+                    if all_total is not None and donor not in board:
+                        board.set(donor, all_total[0])
+                        board.gifts[donor] = all_total[1]
+                    else:
+                        board.add(donor, gift_coins)
+                        board.gifts[donor] = board.gifts.get(donor, 0) + int(gift_count)
+                else:
+                    board.add(donor, gift_coins)
+        entry.last_access = entry.fresh_at = time.monotonic()
+        self.stats["updates"] += 1
+
+    def pin(self, streamer_tiktok_username: str) -> None:
+        """Стример в LIVE в этом воркере: все его подарки проходят через record_gift."""
+        streamer = _norm(streamer_tiktok_username)
+        if not streamer:
+            return
+        with self._lock:
+            if streamer not in self._pins:
+                # Пока стример не был закреплён, таблицы могли отстать — проверяем возраст сейчас.
+                self._get(streamer, datetime.utcnow().date())
+            self._pins[streamer] = self._pins.get(streamer, 0) + 1
+
+    def unpin(self, streamer_tiktok_username: str) -> None:
+        streamer = _norm(streamer_tiktok_username)
+        with self._lock:
+            left = self._pins.get(streamer, 0) - 1
+            if left > 0:
+                self._pins[streamer] = left
+            else:
+                self._pins.pop(streamer, None)
+                entry = self._streamers.get(streamer)
+                if entry is not None:
+                    # Отсчёт LEADERBOARD_MAX_SEED_AGE_SEC — с конца эфира, а не с последнего подарка.
+                    entry.fresh_at = time.monotonic()
+
+    def touch(self, streamer_tiktok_username: str) -> None:
+        entry = self._streamers.get(_norm(streamer_tiktok_username))
+        if entry is not None:
+            entry.last_access = time.monotonic()
+
+    def evict(self, streamer_tiktok_username: str) -> None:
+        with self._lock:
+            self._streamers.pop(_norm(streamer_tiktok_username), None)
+
+    def _maybe_evict(self) -> None:
+        now = time.monotonic()
+        if self.idle_sec <= 0 or now - self._last_evict < min(60.0, self.idle_sec):
+            return
+        self._last_evict = now
+        with self._lock:
+            stale = [
+                k for k, e in self._streamers.items()
+                if k not in self._pins and now - e.last_access > self.idle_sec
+            ]
+            for k in stale:
+                self._streamers.pop(k, None)
+        if stale:
+            self.stats["evictions"] += len(stale)
+            logger.info("Leaderboards evicted (idle): %s", len(stale))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            streamers = len(self._streamers)
+            donors = sum(len(e.boards.get("30d") or ()) for e in self._streamers.values())
+            pinned = len(self._pins)
+        return {"streamers": streamers, "pinned": pinned, "donors_30d": donors, **self.stats}
+
+
+LEADERBOARDS = LeaderboardRegistry()
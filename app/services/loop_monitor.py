@@ -0,0 +1,210 @@
+"""
+Монитор лага event loop и детектор «тяжёлых» callback'ов.
+
+- Heartbeat-корутина раз в LOOP_MONITOR_INTERVAL_SEC засыпает и меряет, насколько позже
+  её разбудили (лаг планирования) -> гистограмма ttboost_event_loop_lag_seconds.
+- Сторожевой поток пингует loop через call_soon_threadsafe: как только предыдущий пинг
+  отвечен, отправляет следующий (не реже раза в LOOP_WATCHDOG_POLL_SEC). Отзывчивость
+  меряется по времени ответа на пинг и не зависит от периода heartbeat: блокировка
+  замечается через ~LOOP_STALL_THRESHOLD_MS (+ не больше POLL_SEC) после её начала.
+  Если пинг не отвечен дольше LOOP_STALL_THRESHOLD_MS, снимается стек потока loop
+  (sys._current_frames) — это и есть код, который блокирует loop (sync DB, файлы, CPU).
+  Пока зависание длится, стек досэмплируется, и считается, какие строки кода видны чаще.
+  Когда loop отвис — запись с длительностью уходит в кольцевой буфер (LOOP_STALL_HISTORY).
+
+Стоимость: один wakeup корутины и несколько коротких захватов GIL потоком в секунду;
+стек берётся только во время зависания.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Counter, deque
+from datetime import datetime, timedelta
+
+from app.services.metrics import LATENCY_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+LOOP_MONITOR_ENABLED = (os.getenv("LOOP_MONITOR", "1") or "1").strip().lower() in ("1", "true", "yes", "on")
+LOOP_MONITOR_INTERVAL_SEC = max(0.05, _env_float("LOOP_MONITOR_INTERVAL_SEC", 0.25))
+LOOP_WATCHDOG_POLL_SEC = max(0.01, _env_float("LOOP_WATCHDOG_POLL_SEC", 0.05))
+LOOP_STALL_THRESHOLD_MS = max(10.0, _env_float("LOOP_STALL_THRESHOLD_MS", 200))
+LOOP_STALL_HISTORY = max(1, int(_env_float("LOOP_STALL_HISTORY", 50)))
+_STACK_LIMIT = 30
+_MAX_SAMPLES_PER_STALL = 200
+
+LOOP_LAG = REGISTRY.histogram(
+    "ttboost_event_loop_lag_seconds", "Лаг планирования event loop (heartbeat).", buckets=LATENCY_BUCKETS
+)
+LOOP_STALLS = REGISTRY.counter("ttboost_event_loop_stalls_total", "Зависания event loop дольше LOOP_STALL_THRESHOLD_MS.")
+LOOP_STALL_SECONDS = REGISTRY.histogram(
+    "ttboost_event_loop_stall_seconds", "Длительность зависаний event loop.", buckets=LATENCY_BUCKETS
+)
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _where(stack: list[traceback.FrameSummary]) -> str:
+    """Самый глубокий кадр из кода приложения (а не SQLAlchemy/asyncio), иначе самый глубокий вообще."""
+    for fs in reversed(stack):
+        if fs.filename.startswith(_APP_ROOT) and not fs.filename.endswith("loop_monitor.py"):
+            return f"{os.path.relpath(fs.filename, os.path.dirname(_APP_ROOT))}:{fs.lineno} {fs.name}"
+    if stack:
+        fs = stack[-1]
+        return f"{fs.filename}:{fs.lineno} {fs.name}"
+    return "?"
+
+
+class LoopMonitor:
+    def __init__(self, interval_sec: float, poll_sec: float, threshold_ms: float, history: int):
+        self.interval_sec = interval_sec
+        self.poll_sec = poll_sec
+        self.threshold_sec = threshold_ms / 1000.0
+        self.stalls: deque[dict] = deque(maxlen=history)
+        self.lag_last_ms = 0.0
+        self.lag_max_ms = 0.0
+        self.stalls_total = 0
+
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        # Пинги сторожевого потока: номер последнего отправленного / отвеченного.
+        self._ping = 0
+        self._acked = 0
+        self._sent_at = 0.0
+        self._ack_at = 0.0
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._current: dict | None = None  # зависание, которое сейчас идёт
+
+    # --- loop side ---
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_sec)
+            lag = max(0.0, loop.time() - t0 - self.interval_sec)
+            LOOP_LAG.observe(lag)
+            self.lag_last_ms = round(lag * 1000.0, 2)
+            if self.lag_last_ms > self.lag_max_ms:
+                self.lag_max_ms = self.lag_last_ms
+
+    # --- watchdog thread ---
+    def _watchdog(self) -> None:
+        while not self._stop.wait(self.poll_sec):
+            try:
+                self._check()
+            except Exception:
+                logger.exception("loop watchdog check failed")
+
+    def _ack(self, ping: int) -> None:
+        # Выполняется в потоке loop: loop снова обрабатывает callback'и.
+        self._ack_at = time.monotonic()
+        self._acked = ping
+
+    def _check(self) -> None:
+        loop = self._loop
+        tid = self._loop_thread_id
+        if loop is None or tid is None or loop.is_closed():
+            return
+        cur = self._current
+        if self._acked == self._ping:
+            # Предыдущий пинг отвечен (или это первый) — шлём следующий.
+            if cur is not None:
+                self._finish(cur, self._ack_at - self._sent_at)
+            self._ping += 1
+            self._sent_at = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(self._ack, self._ping)
+            except RuntimeError:
+                # loop закрыт
+                self._loop = None
+            return
+
+        stalled_for = time.monotonic() - self._sent_at
+        if stalled_for < self.threshold_sec:
+            return
+
+        frame = sys._current_frames().get(tid)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame, limit=_STACK_LIMIT)
+        del frame
+        if cur is None:
+            cur = {
+                "started_at": (datetime.utcnow() - timedelta(seconds=stalled_for)).isoformat() + "Z",
+                "where": _where(stack),
+                "stack": [f'{fs.filename}:{fs.lineno} {fs.name}: {fs.line or ""}'.rstrip() for fs in stack],
+                "_samples": _Counter(),
+            }
+            self._current = cur
+            logger.warning("Event loop заблокирован > %.0f ms: %s", self.threshold_sec * 1000.0, cur["where"])
+        if sum(cur["_samples"].values()) < _MAX_SAMPLES_PER_STALL:
+            cur["_samples"][_where(stack)] += 1
+        cur["duration_ms"] = round(stalled_for * 1000.0, 1)
+
+    def _finish(self, cur: dict, duration: float) -> None:
+        self._current = None
+        # Полная длительность: от отправки пинга до ответа loop (занижение — не больше poll_sec).
+        duration = max(0.0, duration)
+        samples = cur.pop("_samples")
+        cur["duration_ms"] = round(duration * 1000.0, 1)
+        cur["samples"] = [{"where": w, "count": n} for w, n in samples.most_common(5)]
+        LOOP_STALLS.inc()
+        LOOP_STALL_SECONDS.observe(cur["duration_ms"] / 1000.0)
+        with self._lock:
+            self.stalls_total += 1
+            self.stalls.append(cur)
+
+    # --- control ---
+    def start(self) -> None:
+        # Вызывается из потока loop (startup-хук).
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._acked = self._ping
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self, limit: int = 20) -> dict:
+        with self._lock:
+            stalls = list(self.stalls)[-limit:] if limit > 0 else []
+            total = self.stalls_total
+        cur = self._current
+        return {
+            "enabled": self._task is not None,
+            "interval_sec": self.interval_sec,
+            "threshold_ms": round(self.threshold_sec * 1000.0, 1),
+            "lag_last_ms": self.lag_last_ms,
+            "lag_max_ms": self.lag_max_ms,
+            "stalls_total": total,
+            "stalled_now": ({"where": cur["where"], "duration_ms": cur.get("duration_ms")} if cur else None),
+            "stalls": list(reversed(stalls)),
+        }
+
+
+LOOP_MONITOR = LoopMonitor(LOOP_MONITOR_INTERVAL_SEC, LOOP_WATCHDOG_POLL_SEC, LOOP_STALL_THRESHOLD_MS, LOOP_STALL_HISTORY)
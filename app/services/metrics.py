@@ -0,0 +1,339 @@
+"""
+Реестр метрик в текстовом формате Prometheus (GET /metrics), без внешних зависимостей.
+
+Горячий путь: вызывающий код заранее берёт дочерний объект (`FAMILY.labels("gift")`)
+и дальше делает только `inc()` / `observe()` — это сложение в __slots__-полях и bisect
+по кортежу границ, без блокировок и новых объектов. Блокировка берётся только при
+создании нового набора лейблов и при рендеринге. Инкременты под GIL не атомарны
+между потоками в строгом смысле; редкая потеря единицы при вытеснении — приемлемая
+цена для счётчиков мониторинга.
+
+Гистограммы хранят некумулятивные счётчики по корзинам, кумулятивные `_bucket{le=…}`
+собираются при скрейпе.
+
+DB-запросы атрибутируются «единице работы» (HTTP-запрос, событие WS) через contextvar:
+begin_unit()/end_unit() в middleware и обёртке обработчиков ws_v2, db_statement() из
+after_cursor_execute (app/db/database.py).
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TTS_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 35.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int | float = 1) -> None:
+        self.value += n
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, v: int | float) -> None:
+        self.value = v
+
+    def inc(self, n: int | float = 1) -> None:
+        self.value += n
+
+    def dec(self, n: int | float = 1) -> None:
+        self.value -= n
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._default = None if self.labelnames else self._new_child()
+        if self._default is not None:
+            self._children[()] = self._default
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _items(self) -> list[tuple[tuple, object]]:
+        with self._lock:
+            return [(tuple(str(v) for v in key), child) for key, child in self._children.items()]
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list[str]:
+        return [f"{self.name}{self._label_str(k)} {_fmt(c.value)}" for k, c in self._items()]
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: int | float = 1) -> None:
+        self._default.inc(n)
+
+
+class Gauge(_Family):
+    """Gauge; с fn= значение вычисляется при скрейпе (fn() -> число или {label_values: число})."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), fn: Callable | None = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, v: int | float) -> None:
+        self._default.set(v)
+
+    def inc(self, n: int | float = 1) -> None:
+        self._default.inc(n)
+
+    def dec(self, n: int | float = 1) -> None:
+        self._default.dec(n)
+
+    def _render_samples(self) -> list[str]:
+        if self.fn is None:
+            return super()._render_samples()
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [
+                f"{self.name}{self._label_str(k if isinstance(k, tuple) else (k,))} {_fmt(v)}"
+                for k, v in value.items()
+            ]
+        return [f"{self.name} {_fmt(value)}"]
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v: float) -> None:
+        self._default.observe(v)
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, child in self._items():
+            counts = list(child.counts)
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_str(key, le)} {acc}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {_fmt(round(child.sum, 6))}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {acc}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families: dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def register(self, family: _Family) -> _Family:
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                return existing
+            self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), fn: Callable | None = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn=fn))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets=buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            families = list(self._families.values())
+        lines: list[str] = []
+        for fam in families:
+            lines.extend(fam.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- ws_v2 ---
+WS_EVENT_SECONDS = REGISTRY.histogram(
+    "ttboost_ws_event_handler_seconds", "Время обработки события TikTok в ws_v2 (по типу события).", ("event",)
+)
+WS_EVENT_ERRORS = REGISTRY.counter(
+    "ttboost_ws_event_handler_errors_total", "Исключения в обработчиках событий ws_v2.", ("event",)
+)
+
+# --- TTS ---
+TTS_SECONDS = REGISTRY.histogram(
+    "ttboost_tts_seconds", "Время генерации TTS по движку (включая неудачные попытки).", ("engine",), buckets=TTS_BUCKETS
+)
+TTS_ERRORS = REGISTRY.counter("ttboost_tts_errors_total", "Ошибки/пустой результат TTS по движку.", ("engine",))
+TTS_FALLBACKS = REGISTRY.counter("ttboost_tts_fallbacks_total", "Переходы на gTTS-фолбэк.")
+
+# --- DB ---
+DB_STATEMENTS = REGISTRY.counter("ttboost_db_statements_total", "SQL-запросы по единице работы.", ("scope",))
+DB_STATEMENT_SECONDS = REGISTRY.histogram(
+    "ttboost_db_statement_seconds", "Время одного SQL-запроса (cursor execute).", ("scope",)
+)
+DB_UNIT_STATEMENTS = REGISTRY.histogram(
+    "ttboost_db_statements_per_unit", "Число SQL-запросов на HTTP-запрос / событие WS.", ("scope",), buckets=COUNT_BUCKETS
+)
+DB_UNIT_SECONDS = REGISTRY.histogram(
+    "ttboost_db_seconds_per_unit", "Суммарное время SQL на HTTP-запрос / событие WS.", ("scope",)
+)
+
+# --- TikTok ---
+TIKTOK_CONNECTS = REGISTRY.counter("ttboost_tiktok_connects_total", "Успешные подключения к TikTok Live.", ("backend",))
+TIKTOK_RECONNECTS = REGISTRY.counter("ttboost_tiktok_reconnects_total", "Попытки авто-переподключения.", ("backend",))
+TIKTOK_FAILURES = REGISTRY.counter("ttboost_tiktok_connect_failures_total", "Неудачные подключения/ошибки коннектора.", ("backend",))
+GIFT_DEDUP = REGISTRY.counter("ttboost_gift_dedup_suppressed_total", "Подавленные дубликаты подарков по причине.", ("reason",))
+
+
+class _Unit:
+    __slots__ = ("scope", "name", "statements", "seconds", "stmt_counter", "stmt_hist", "profile")
+
+    def __init__(self, scope: str, profile: bool = False):
+        self.scope = scope
+        self.name = scope  # HTTP: уточняется до "METHOD /route" после роутинга (main.py)
+        self.statements = 0
+        self.seconds = 0.0
+        self.stmt_counter = DB_STATEMENTS.labels(scope)
+        self.stmt_hist = DB_STATEMENT_SECONDS.labels(scope)
+        # Только при включённом SQL-профайлере: {statement: [count, seconds]}
+        self.profile: dict[str, list] | None = {} if profile else None
+
+
+_UNIT: ContextVar[_Unit | None] = ContextVar("metrics_unit", default=None)
+_BACKGROUND = _Unit("background")
+_unit_end_hook: Callable[[_Unit], None] | None = None
+
+
+def set_unit_end_hook(fn: Callable[[_Unit], None] | None) -> None:
+    """Подписка на завершение единицы работы (app/services/sql_profiler.py)."""
+    global _unit_end_hook
+    _unit_end_hook = fn
+
+
+def begin_unit(scope: str):
+    """Начать единицу работы; вернуть токен для end_unit()."""
+    unit = _Unit(scope, profile=_unit_end_hook is not None)
+    return _UNIT.set(unit), unit
+
+
+def end_unit(token, unit: _Unit) -> None:
+    try:
+        _UNIT.reset(token)
+    except ValueError:
+        # токен из другого контекста (задача завершилась не там, где началась) — просто забываем
+        pass
+    DB_UNIT_STATEMENTS.labels(unit.scope).observe(unit.statements)
+    DB_UNIT_SECONDS.labels(unit.scope).observe(unit.seconds)
+    hook = _unit_end_hook
+    if hook is not None and unit.profile is not None:
+        try:
+            hook(unit)
+        except Exception:
+            pass
+
+
+def current_unit() -> _Unit | None:
+    return _UNIT.get()
+
+
+def db_statement(seconds: float, statement: str | None = None) -> None:
+    unit = _UNIT.get() or _BACKGROUND
+    unit.statements += 1
+    unit.seconds += seconds
+    unit.stmt_counter.inc()
+    unit.stmt_hist.observe(seconds)
+    profile = unit.profile
+    if profile is not None and statement is not None:
+        # Ключ — текст как его собрал SQLAlchemy (одинаковый для одного запроса), нормализация — в конце единицы.
+        rec = profile.get(statement)
+        if rec is None:
+            profile[statement] = [1, seconds]
+        else:
+            rec[0] += 1
+            rec[1] += seconds
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,164 @@
+"""
+Кэш аутентифицированного пользователя для auth_v2.get_current_user.
+
+По токену хранится снимок колонок users (на AUTH_PRINCIPAL_CACHE_SEC секунд). На попадании
+пользователь собирается из снимка и подключается к сессии запроса через
+Session.merge(load=False) — без SELECT; изменения и commit работают как обычно,
+ленивые связи (settings и т.п.) догружаются по обращению.
+
+Инвалидация по user_id — на любой ORM flush с UPDATE/DELETE строки users в этом процессе
+(mapper events: бан, смена роли, удаление в admin_v2, смена пароля/тарифа и т.п.) и ещё раз
+после commit этой сессии. Между flush и commit параллельный запрос может прочитать старую
+строку: такой снимок не попадёт в кэш — put() сверяет поколение пользователя, взятое до чтения
+из БД (generation()), а after_commit сдвигает поколение.
+Bulk query(...).update() событий не даёт — так обновляются только last_live_*, которые для
+авторизации не важны. Другие воркеры (uvicorn --workers N) видят бан/смену роли не позже чем
+через TTL, поэтому TTL по умолчанию короткий. 0 — кэш выключен.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app.db import models
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+AUTH_PRINCIPAL_CACHE_SEC = max(0.0, _env_float("AUTH_PRINCIPAL_CACHE_SEC", 5.0))
+AUTH_PRINCIPAL_CACHE_MAX = max(1, int(_env_float("AUTH_PRINCIPAL_CACHE_MAX", 20000)))
+
+_USER_COLUMNS = tuple(attr.key for attr in sa_inspect(models.User).column_attrs)
+
+
+class PrincipalCache:
+    def __init__(self, ttl_sec: float, max_tokens: int):
+        self.ttl_sec = ttl_sec
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens: OrderedDict[str, tuple[float, str]] = OrderedDict()  # token -> (expires_at, user_id)
+        self._users: dict[str, dict] = {}  # user_id -> снимок колонок
+        self._generations: dict[str, int] = {}  # user_id -> номер последней инвалидации
+        self._counter = 0  # глобальный счётчик инвалидаций
+        self._floor = 0  # поколение для пользователей без записи (после чистки _generations)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0
+
+    def get(self, token: str, user_id: str) -> dict | None:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tokens.get(token)
+            snap = self._users.get(user_id) if entry is not None else None
+            if entry is None or entry[1] != user_id or entry[0] < now or snap is None:
+                if entry is not None:
+                    self._tokens.pop(token, None)
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return snap
+
+    def generation(self, user_id: str) -> int:
+        """Снять до чтения пользователя из БД и передать в put()."""
+        with self._lock:
+            return self._generations.get(user_id, self._floor)
+
+    def put(self, token: str, user: models.User, generation: int) -> None:
+        if not self.enabled:
+            return
+        snap = {key: getattr(user, key) for key in _USER_COLUMNS}
+        with self._lock:
+            if self._generations.get(user.id, self._floor) != generation:
+                # Пользователя меняли, пока мы его читали, — снимок мог устареть.
+                return
+            self._users[user.id] = snap
+            self._tokens[token] = (time.monotonic() + self.ttl_sec, user.id)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+            if len(self._users) > self.max_tokens:
+                live = {uid for _, uid in self._tokens.values()}
+                for uid in [u for u in self._users if u not in live]:
+                    self._users.pop(uid, None)
+
+    def invalidate_user(self, user_id: str | None) -> None:
+        if not user_id:
+            return
+        uid = str(user_id)
+        with self._lock:
+            self._counter += 1
+            self._generations[uid] = self._counter
+            if self._users.pop(uid, None) is not None:
+                self.stats["invalidations"] += 1
+            if len(self._generations) > self.max_tokens:
+                # Забытые пользователи получают поколение _floor, большее любого выданного раньше:
+                # put() с номером, снятым до чистки, просто не закэширует.
+                self._generations = {uid: self._counter}
+                self._floor = self._counter
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+            self._generations.clear()
+            self._floor = self._counter
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"ttl_sec": self.ttl_sec, "tokens": len(self._tokens), "users": len(self._users), **self.stats}
+
+
+def attach(db: Session, snap: dict) -> models.User:
+    """Пользователь из снимка как persistent-объект сессии db, без запроса в БД."""
+    user = models.User(**snap)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+PRINCIPALS = PrincipalCache(AUTH_PRINCIPAL_CACHE_SEC, AUTH_PRINCIPAL_CACHE_MAX)
+
+
+_DIRTY_KEY = "principal_cache_dirty"
+
+
+def _on_user_flushed(target) -> None:
+    user_id = getattr(target, "id", None)
+    PRINCIPALS.invalidate_user(user_id)
+    session = object_session(target)
+    if session is not None and user_id:
+        session.info.setdefault(_DIRTY_KEY, set()).add(str(user_id))
+
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    _on_user_flushed(target)
+
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _on_user_flushed(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    for user_id in session.info.pop(_DIRTY_KEY, ()):
+        PRINCIPALS.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session):
+    session.info.pop(_DIRTY_KEY, None)
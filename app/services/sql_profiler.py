@@ -0,0 +1,213 @@
+"""
+Профайлер SQL по HTTP-роуту / событию WS (opt-in: SQL_PROFILE=1).
+
+Запросы собираются в единице работы app.services.metrics (after_cursor_execute ->
+db_statement), здесь — только обработка завершённой единицы:
+
+- агрегаты по имени единицы ("GET /v2/admin/users", "ws:gift"): число единиц,
+  запросов, время в БД, максимум запросов, топ нормализованных запросов;
+- бюджет запросов на единицу (SQL_PROFILE_BUDGET, переопределения в SQL_PROFILE_BUDGETS):
+  превышение -> warning в лог, счётчик ttboost_sql_budget_exceeded_total и отчёт;
+- отчёт (JSON-строка в логгер app.sql_profile, при SQL_PROFILE_LOG — в отдельный файл)
+  пишется для доли SQL_PROFILE_SAMPLE единиц и всегда — при превышении бюджета;
+- запрос, повторённый в одной единице >= SQL_PROFILE_REPEAT раз, помечается как
+  кандидат в N+1.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+from app.services import hot_log, metrics
+
+logger = logging.getLogger(__name__)
+report_logger = logging.getLogger("app.sql_profile")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+SQL_PROFILE_ENABLED = (os.getenv("SQL_PROFILE") or "0").strip().lower() in ("1", "true", "yes", "on")
+SQL_PROFILE_SAMPLE = min(1.0, max(0.0, _env_float("SQL_PROFILE_SAMPLE", 0.01)))
+SQL_PROFILE_BUDGET = int(_env_float("SQL_PROFILE_BUDGET", 30))
+SQL_PROFILE_REPEAT = max(2, int(_env_float("SQL_PROFILE_REPEAT", 5)))
+SQL_PROFILE_TOP = max(1, int(_env_float("SQL_PROFILE_TOP", 5)))
+SQL_PROFILE_LOG = (os.getenv("SQL_PROFILE_LOG") or "").strip()
+_MAX_STATEMENTS_PER_NAME = 50
+_MAX_NAMES = 500
+
+
+def _parse_budgets(raw: str) -> dict[str, int]:
+    """SQL_PROFILE_BUDGETS="GET /v2/admin/users=20;ws:gift=8" """
+    out: dict[str, int] = {}
+    for part in (raw or "").split(";"):
+        name, sep, value = part.rpartition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            out[name.strip()] = int(value)
+        except ValueError:
+            continue
+    return out
+
+
+SQL_PROFILE_BUDGETS = _parse_budgets(os.getenv("SQL_PROFILE_BUDGETS") or "")
+
+SQL_BUDGET_EXCEEDED = metrics.REGISTRY.counter(
+    "ttboost_sql_budget_exceeded_total", "Единицы работы, превысившие бюджет SQL-запросов.", ("unit",)
+)
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%\(\w+\)s|(?<!:):\w+|\$\d+|\?")
+_RE_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)|\bIN\s*\(__\[POSTCOMPILE_\w+\]\)", re.IGNORECASE)
+_RE_WS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement: str) -> str:
+    s = _RE_WS.sub(" ", statement).strip()
+    s = _RE_STRING.sub("?", s)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_IN_LIST.sub("IN (...)", s)
+    return s[:500]
+
+
+def budget_for(name: str) -> int:
+    return SQL_PROFILE_BUDGETS.get(name, SQL_PROFILE_BUDGET)
+
+
+class SqlProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def _top(self, unit) -> list[dict]:
+        merged: dict[str, list] = {}
+        for statement, (count, seconds) in unit.profile.items():
+            rec = merged.setdefault(normalize(statement), [0, 0.0])
+            rec[0] += count
+            rec[1] += seconds
+        ranked = sorted(merged.items(), key=lambda kv: (-kv[1][0], -kv[1][1]))
+        return [{"sql": sql, "count": c, "ms": round(sec * 1000.0, 2)} for sql, (c, sec) in ranked]
+
+    def on_unit_end(self, unit) -> None:
+        if unit.statements == 0:
+            return
+        name = unit.name
+        top = self._top(unit)
+        budget = budget_for(name)
+        over = budget > 0 and unit.statements > budget
+        repeated = [t["sql"] for t in top if t["count"] >= SQL_PROFILE_REPEAT]
+
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None and len(self._stats) < _MAX_NAMES:
+                st = self._stats[name] = {
+                    "units": 0, "statements": 0, "db_ms": 0.0, "max_statements": 0, "over_budget": 0, "top": {},
+                }
+            # Нет места под новое имя — агрегаты пропускаем, но бюджет и отчёт ниже работают.
+            if st is not None:
+                self._accumulate(st, unit, top, over)
+
+        if over:
+            SQL_BUDGET_EXCEEDED.labels(name).inc()
+            logger.warning(
+                "SQL budget exceeded: %s made %s statements (budget %s, %.1f ms in DB); top: %s",
+                name,
+                unit.statements,
+                budget,
+                unit.seconds * 1000.0,
+                "; ".join(f'{t["count"]}x {t["sql"][:120]}' for t in top[:3]),
+            )
+        if over or random.random() < SQL_PROFILE_SAMPLE:
+            report_logger.info(
+                json.dumps(
+                    {
+                        "unit": name,
+                        "statements": unit.statements,
+                        "db_ms": round(unit.seconds * 1000.0, 2),
+                        "budget": budget,
+                        "over_budget": over,
+                        "repeated": repeated,
+                        "top": top[:SQL_PROFILE_TOP],
+                    },
+                    ensure_ascii=False,
+                )
+            )
+
+    @staticmethod
+    def _accumulate(st: dict, unit, top: list[dict], over: bool) -> None:
+        st["units"] += 1
+        st["statements"] += unit.statements
+        st["db_ms"] += unit.seconds * 1000.0
+        st["max_statements"] = max(st["max_statements"], unit.statements)
+        st["over_budget"] += 1 if over else 0
+        agg = st["top"]
+        for t in top:
+            rec = agg.get(t["sql"])
+            if rec is None:
+                if len(agg) >= _MAX_STATEMENTS_PER_NAME:
+                    continue
+                rec = agg[t["sql"]] = [0, 0.0]
+            rec[0] += t["count"]
+            rec[1] += t["ms"]
+
+    def snapshot(self, limit: int = 50) -> dict:
+        with self._lock:
+            items = []
+            for name, st in self._stats.items():
+                top = sorted(st["top"].items(), key=lambda kv: -kv[1][0])[:SQL_PROFILE_TOP]
+                items.append({
+                    "unit": name,
+                    "units": st["units"],
+                    "statements_avg": round(st["statements"] / st["units"], 2) if st["units"] else 0.0,
+                    "statements_max": st["max_statements"],
+                    "db_ms_avg": round(st["db_ms"] / st["units"], 2) if st["units"] else 0.0,
+                    "over_budget": st["over_budget"],
+                    "budget": budget_for(name),
+                    "top": [{"sql": sql, "count": c, "ms": round(ms, 2)} for sql, (c, ms) in top],
+                })
+        items.sort(key=lambda it: (-it["statements_avg"], -it["units"]))
+        return {
+            "enabled": SQL_PROFILE_ENABLED,
+            "budget_default": SQL_PROFILE_BUDGET,
+            "sample": SQL_PROFILE_SAMPLE,
+            "items": items[:limit],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+SQL_PROFILER = SqlProfiler()
+
+
+def install() -> bool:
+    """Подключить профайлер к единицам работы metrics (если SQL_PROFILE=1)."""
+    if not SQL_PROFILE_ENABLED:
+        return False
+    if SQL_PROFILE_LOG and not any(getattr(h, "sql_profile_file", False) for h in report_logger.handlers):
+        handler = RotatingFileHandler(SQL_PROFILE_LOG, maxBytes=5_000_000, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+        # Отчёт пишется из HTTP-middleware в event loop — запись в файл уводим в фоновый поток.
+        queued = hot_log.queued_handler(handler)
+        queued.sql_profile_file = True
+        report_logger.addHandler(queued)
+        report_logger.propagate = False
+    report_logger.setLevel(logging.INFO)
+    metrics.set_unit_end_hook(SQL_PROFILER.on_unit_end)
+    logger.info("SQL profiler enabled (budget=%s, sample=%s)", SQL_PROFILE_BUDGET, SQL_PROFILE_SAMPLE)
+    return True
@@ -0,0 +1,202 @@
+"""
+Временные ряды донатов по gift_events_tt: coins / gifts / уникальные доноры на корзину.
+
+- Корзины считаются в SQL: floor(epoch / step) * step
+  (Postgres: EXTRACT(EPOCH ...), SQLite: strftime('%s', ...)), так что шаг может быть
+  любым кратным минуте/часу/дню — это и есть даунсэмплинг: если точек больше max_points,
+  шаг увеличивается в k раз, и уникальные доноры остаются точными для широкой корзины.
+- Закрытые корзины кэшируются в памяти процесса (в пределах TIMESERIES_CACHE_MAX_BUCKETS);
+  пересчитывается только то, чего ещё нет в кэше — одним запросом по диапазону.
+  Корзина считается закрытой не сразу после конца, а спустя max(шаг, TIMESERIES_CACHE_GRACE_SEC):
+  created_at ставится до commit, и подарок на границе может появиться в БД чуть позже.
+- Подарки, записанные задним числом (replay), сбрасывают кэш стримера начиная с их created_at
+  (invalidate_streamer, вызывается из record_gift_and_update_stats) — только в этом процессе.
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+DEFAULT_SPAN = {"minute": timedelta(hours=2), "hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+TIMESERIES_CACHE_MAX_BUCKETS = _env_int("TIMESERIES_CACHE_MAX_BUCKETS", 200_000)
+TIMESERIES_CACHE_GRACE_SEC = max(0, _env_int("TIMESERIES_CACHE_GRACE_SEC", 60))
+
+
+def _to_epoch(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds())
+
+
+def _from_epoch(sec: int) -> datetime:
+    return _EPOCH + timedelta(seconds=int(sec))
+
+
+def _bucket_expr(dialect: str, step: int):
+    col = f"{models.GiftEventTikTok.__tablename__}.created_at"
+    step = int(step)
+    if dialect == "postgresql":
+        return literal_column(f"FLOOR(EXTRACT(EPOCH FROM {col}) / {step}) * {step}")
+    # substr: без дробных секунд — strftime округляет .9995+ вверх, в следующую корзину.
+    return literal_column(f"(CAST(strftime('%s', substr({col}, 1, 19)) AS INTEGER) / {step}) * {step}")
+
+
+class _ClosedBucketCache:
+    """(streamer, step) -> {bucket_epoch: (coins, gifts, donors)}; LRU по ключам, лимит по числу корзин."""
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._data: OrderedDict[tuple[str, int], dict[int, tuple[int, int, int]]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hit_buckets": 0, "miss_buckets": 0, "queries": 0}
+
+    def get_many(self, key: tuple[str, int], buckets: list[int]) -> dict[int, tuple[int, int, int]]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                return {}
+            self._data.move_to_end(key)
+            return {b: data[b] for b in buckets if b in data}
+
+    def put_many(self, key: tuple[str, int], values: dict[int, tuple[int, int, int]]) -> None:
+        if not values or self.max_buckets <= 0:
+            return
+        with self._lock:
+            data = self._data.setdefault(key, {})
+            self._data.move_to_end(key)
+            before = len(data)
+            data.update(values)
+            self._size += len(data) - before
+            while self._size > self.max_buckets and len(self._data) > 1:
+                _, dropped = self._data.popitem(last=False)
+                self._size -= len(dropped)
+
+    def invalidate(self, streamer: str, since_epoch: int | None = None) -> int:
+        """Сбросить корзины стримера (всех шагов), заканчивающиеся после since_epoch (None — все)."""
+        dropped = 0
+        with self._lock:
+            for key in [k for k in self._data if k[0] == streamer]:
+                data = self._data[key]
+                if since_epoch is None:
+                    stale = list(data)
+                else:
+                    stale = [b for b in data if b + key[1] > since_epoch]
+                for b in stale:
+                    del data[b]
+                dropped += len(stale)
+                if not data:
+                    del self._data[key]
+            self._size -= dropped
+        return dropped
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._data), "buckets": self._size, **self.stats}
+
+
+CACHE = _ClosedBucketCache(TIMESERIES_CACHE_MAX_BUCKETS)
+
+
+def invalidate_streamer(streamer_tiktok_username: str, since: datetime | None = None) -> int:
+    streamer = (streamer_tiktok_username or "").strip().lstrip("@").lower()
+    if not streamer:
+        return 0
+    return CACHE.invalidate(streamer, _to_epoch(since) if since is not None else None)
+
+
+def is_backdated(created_at: datetime, now: datetime | None = None) -> bool:
+    """Запись старше окна, в котором корзины ещё не кэшируются (её корзина могла уже закэшироваться)."""
+    now = now or datetime.utcnow()
+    return created_at < now - timedelta(seconds=TIMESERIES_CACHE_GRACE_SEC)
+
+
+def _query(db: Session, streamer: str, step: int, start: datetime, end: datetime, dialect: str) -> dict[int, tuple[int, int, int]]:
+    ev = models.GiftEventTikTok
+    bucket = _bucket_expr(dialect, step).label("bucket")
+    rows = (
+        db.query(
+            bucket,
+            func.coalesce(func.sum(ev.gift_coins), 0),
+            func.coalesce(func.sum(ev.gift_count), 0),
+            func.count(func.distinct(ev.donor_username)),
+        )
+        .filter(ev.streamer_tiktok_username == streamer)
+        # day — для индекса (streamer_tiktok_username, day)
+        .filter(ev.day >= start.date(), ev.day <= end.date())
+        .filter(ev.created_at >= start, ev.created_at < end)
+        .group_by(bucket)
+        .all()
+    )
+    CACHE.stats["queries"] += 1
+    return {int(b): (int(c or 0), int(g or 0), int(d or 0)) for b, c, g, d in rows}
+
+
+def gift_timeseries(
+    db: Session,
+    *,
+    streamer_tiktok_username: str,
+    bucket: str,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    now: datetime | None = None,
+) -> dict:
+    base = BUCKET_SECONDS[bucket]
+    now = now or datetime.utcnow()
+    start_s = _to_epoch(start) // base * base
+    end_s = _to_epoch(end)
+    if end_s <= start_s:
+        end_s = start_s + base
+
+    # Даунсэмплинг: шаг кратен базовому, чтобы точек было не больше max_points.
+    k = max(1, math.ceil((end_s - start_s) / base / max(1, max_points)))
+    step = base * k
+    start_s = start_s // step * step
+    buckets = list(range(start_s, end_s, step))
+
+    # Закрытой (кэшируемой) корзина становится спустя grace после конца.
+    closed_before = _to_epoch(now) - max(step, TIMESERIES_CACHE_GRACE_SEC)
+    closed = [b for b in buckets if b + step <= closed_before]
+    key = (streamer_tiktok_username, step)
+    cached = CACHE.get_many(key, closed)
+    CACHE.stats["hit_buckets"] += len(cached)
+
+    missing = [b for b in buckets if b not in cached]
+    fresh: dict[int, tuple[int, int, int]] = {}
+    if missing:
+        CACHE.stats["miss_buckets"] += len(missing)
+        dialect = getattr(getattr(db.get_bind(), "dialect", None), "name", "") or ""
+        fresh = _query(db, streamer_tiktok_username, step, _from_epoch(missing[0]), _from_epoch(missing[-1] + step), dialect)
+        CACHE.put_many(key, {b: fresh.get(b, (0, 0, 0)) for b in missing if b + step <= closed_before})
+
+    points = []
+    for b in buckets:
+        coins, gifts, donors = cached.get(b) or fresh.get(b) or (0, 0, 0)
+        points.append({"ts": _from_epoch(b).isoformat() + "Z", "coins": coins, "gifts": gifts, "donors": donors})
+    return {
+        "bucket": bucket,
+        "step_sec": step,
+        "downsample_factor": k,
+        "from": _from_epoch(start_s).isoformat() + "Z",
+        "to": _from_epoch(end_s).isoformat() + "Z",
+        "points": points,
+    }
@@ -0,0 +1,114 @@
+"""
+Итоги одного эфира (StreamSession), накапливаемые в памяти по ходу стрима.
+
+Каждое событие — O(1): монеты/подарки, уникальные доноры (HyperLogLog, ~1.6% ошибки
+при 4096 регистрах), пик и средневзвешенное по времени число зрителей, сообщения чата,
+монеты по подаркам. В БД пишется только снимок (columns()): периодически
+(STREAM_SUMMARY_CHECKPOINT_SEC, чтобы не потерять итоги при падении) и финально при отключении.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import time
+from datetime import datetime
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+STREAM_SUMMARY_CHECKPOINT_SEC = _env_float("STREAM_SUMMARY_CHECKPOINT_SEC", 60.0)
+TOP_GIFTS_N = 5
+
+
+class HyperLogLog:
+    """Оценка числа уникальных строк, 2**p однобайтовых регистров."""
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        x = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        idx = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        z = sum(2.0 ** -r for r in self.registers)
+        estimate = alpha * m * m / z
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting для малых кардинальностей
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class StreamSummary:
+    def __init__(self, started_at: datetime | None = None):
+        self.started_at = started_at or datetime.utcnow()
+        self._t0 = time.monotonic()
+        self.total_coins = 0
+        self.total_gifts = 0
+        self.donors = HyperLogLog()
+        self.chat_messages = 0
+        self.peak_viewers = 0
+        self._viewers = 0
+        self._viewers_at = self._t0
+        self._viewer_seconds = 0.0
+        self._gift_coins: dict[str, list[int]] = {}
+        self._last_checkpoint = self._t0
+
+    def gift(self, donor: str, gift_name: str | None, count: int, coins: int) -> None:
+        self.total_coins += int(coins or 0)
+        self.total_gifts += int(count or 0)
+        if donor:
+            self.donors.add(donor)
+        stat = self._gift_coins.setdefault(str(gift_name or "?"), [0, 0])
+        stat[0] += int(coins or 0)
+        stat[1] += int(count or 0)
+
+    def chat(self) -> None:
+        self.chat_messages += 1
+
+    def viewers(self, current: int) -> None:
+        now = time.monotonic()
+        self._viewer_seconds += self._viewers * (now - self._viewers_at)
+        self._viewers = max(0, int(current or 0))
+        self._viewers_at = now
+        if self._viewers > self.peak_viewers:
+            self.peak_viewers = self._viewers
+
+    def checkpoint_due(self) -> bool:
+        return time.monotonic() - self._last_checkpoint >= STREAM_SUMMARY_CHECKPOINT_SEC
+
+    def columns(self) -> dict:
+        """Значения колонок StreamSession.summary_* на текущий момент."""
+        now = time.monotonic()
+        self._last_checkpoint = now
+        elapsed = max(0.0, now - self._t0)
+        viewer_seconds = self._viewer_seconds + self._viewers * (now - self._viewers_at)
+        top = sorted(self._gift_coins.items(), key=lambda kv: (-kv[1][0], -kv[1][1]))[:TOP_GIFTS_N]
+        return {
+            "total_coins": self.total_coins,
+            "total_gifts": self.total_gifts,
+            "unique_donors": self.donors.count(),
+            "peak_viewers": self.peak_viewers,
+            "avg_viewers": int(round(viewer_seconds / elapsed)) if elapsed > 0 else self._viewers,
+            "chat_messages": self.chat_messages,
+            "chat_per_min": round(self.chat_messages / (elapsed / 60.0), 2) if elapsed >= 1 else 0.0,
+            "top_gifts": [{"gift_name": name, "coins": c, "count": n} for name, (c, n) in top],
+            "summary_updated_at": datetime.utcnow(),
+        }
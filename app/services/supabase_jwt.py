@@ -1,12 +1,19 @@
+import asyncio
+import logging
 import os
 from functools import lru_cache
 import json
+import threading
 import time
 
 import httpx
 import jwt
 from jwt import algorithms
 
+from app.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
 
 class SupabaseJwtError(Exception):
     pass
@@ -48,22 +55,28 @@ def _get_supabase_apikey() -> str:
     return (os.getenv("SUPABASE_ANON_KEY") or os.getenv("SUPABASE_KEY") or "").strip()
 
 
-_JWKS_CACHE: dict = {"ts": 0.0, "jwks": None, "src": None}
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+JWKS_REFRESH = REGISTRY.counter(
+    "ttboost_supabase_jwks_refresh_total", "Обновления Supabase JWKS по результату (ok/error).", ("result",)
+)
+_M_REFRESH_OK = JWKS_REFRESH.labels("ok")
+_M_REFRESH_ERR = JWKS_REFRESH.labels("error")
 
 
-def _fetch_supabase_jwks() -> dict:
+def _download_jwks() -> tuple[dict, str]:
+    """Blocking fetch of JWKS from the first candidate URL that answers. Returns (jwks, url)."""
     base = _get_supabase_url()
     jwks_url = _get_jwks_url()
     if not base and not jwks_url:
         raise SupabaseJwtError("SUPABASE_URL or SUPABASE_JWKS_URL is not configured")
 
-    ttl_s = float((os.getenv("SUPABASE_JWKS_CACHE_TTL_SECONDS") or "600").strip() or "600")
-    now = time.time()
-    cached = _JWKS_CACHE.get("jwks")
-    if cached is not None and (now - float(_JWKS_CACHE.get("ts") or 0.0)) < ttl_s:
-        return cached
-
-    timeout_s = float((os.getenv("SUPABASE_JWKS_TIMEOUT_SECONDS") or "8").strip() or "8")
+    timeout_s = _env_float("SUPABASE_JWKS_TIMEOUT_SECONDS", 8)
     apikey = _get_supabase_apikey()
     headers = {"apikey": apikey} if apikey else {}
 
@@ -82,7 +95,7 @@ def _fetch_supabase_jwks() -> dict:
 
     last_status = None
     last_body = None
-    for url in candidates:
+    for url in dict.fromkeys(candidates):
         try:
             r = httpx.get(url, headers=headers, timeout=timeout_s)
         except Exception as e:
@@ -112,41 +125,21 @@ def _fetch_supabase_jwks() -> dict:
         else:
             normalized = jwks
 
-        _JWKS_CACHE["ts"] = now
-        _JWKS_CACHE["jwks"] = normalized
-        _JWKS_CACHE["src"] = url
-        return normalized
+        keys = normalized.get("keys") if isinstance(normalized, dict) else None
+        if not isinstance(keys, list) or not keys:
+            last_body = "JWKS has no keys"
+            continue
+        return normalized, url
 
     raise SupabaseJwtError(f"unable to fetch JWKS (status={last_status}, body={last_body})")
 
 
-def _select_key_for_token(token: str) -> object:
-    try:
-        hdr = jwt.get_unverified_header(token)
-    except Exception as e:
-        raise SupabaseJwtError(f"invalid token header: {e}")
-
-    kid = (hdr.get("kid") or "").strip()
-    jwks = _fetch_supabase_jwks()
-    keys = jwks.get("keys") if isinstance(jwks, dict) else None
-    if not isinstance(keys, list) or not keys:
-        raise SupabaseJwtError("JWKS has no keys")
-
-    chosen = None
-    if kid:
-        for k in keys:
-            if isinstance(k, dict) and str(k.get("kid") or "").strip() == kid:
-                chosen = k
-                break
-    if chosen is None:
-        # Fallback: pick the first key if kid is absent/unmatched.
-        chosen = keys[0]
-
-    if not isinstance(chosen, dict):
+def _build_key(jwk: object) -> object:
+    if not isinstance(jwk, dict):
         raise SupabaseJwtError("invalid JWKS key format")
 
-    jwk_json = json.dumps(chosen)
-    kty = (chosen.get("kty") or "").upper()
+    jwk_json = json.dumps(jwk)
+    kty = (jwk.get("kty") or "").upper()
     try:
         if kty == "EC":
             return algorithms.ECAlgorithm.from_jwk(jwk_json)
@@ -158,6 +151,164 @@ def _select_key_for_token(token: str) -> object:
     raise SupabaseJwtError(f"unsupported jwk kty: {kty}")
 
 
+class JwksStore:
+    """Supabase JWKS cache with background refresh.
+
+    - Keys are built once per refresh and indexed by kid (object or SupabaseJwtError per kid).
+    - Refresh starts ahead of expiry (SUPABASE_JWKS_REFRESH_AHEAD share of the TTL) in a
+      background thread / the startup loop; requests keep using the current set meanwhile.
+    - On upstream failure the previous set is served (stale-while-revalidate) for up to
+      SUPABASE_JWKS_MAX_STALE_SECONDS past the TTL, retrying every SUPABASE_JWKS_RETRY_SECONDS.
+    - Only one refresh runs at a time; concurrent callers wait for it instead of fetching too.
+    - The request path blocks on the network only when there are no usable keys at all
+      (cold start / too stale) or for a token with an unknown kid (key rotation, rate-limited).
+    """
+
+    def __init__(self):
+        self.ttl_s = max(10.0, _env_float("SUPABASE_JWKS_CACHE_TTL_SECONDS", 600))
+        self.ahead = min(0.95, max(0.1, _env_float("SUPABASE_JWKS_REFRESH_AHEAD", 0.8)))
+        self.retry_s = max(1.0, _env_float("SUPABASE_JWKS_RETRY_SECONDS", 30))
+        self.max_stale_s = max(0.0, _env_float("SUPABASE_JWKS_MAX_STALE_SECONDS", 86400))
+
+        self._refresh_lock = threading.Lock()  # одна загрузка за раз
+        self._by_kid: dict[str, object] = {}
+        self._default: object = None  # first key: fallback when kid is absent/unmatched
+        self.fetched_at = 0.0  # monotonic, 0 — ещё не загружали
+        self.attempted_at = 0.0
+        self._attempts = 0  # завершённые попытки: ждавшие lock видят, что загрузка уже была
+        self.src: str | None = None
+        self.failures = 0  # подряд
+        self.last_error: str | None = None
+        self._task = None
+
+    # --- refresh ---
+    def _age(self) -> float:
+        return time.monotonic() - self.fetched_at if self.fetched_at else float("inf")
+
+    def _due_in(self) -> float:
+        """Seconds until the next refresh attempt should happen."""
+        now = time.monotonic()
+        if self.failures:
+            return max(0.0, self.attempted_at + self.retry_s - now)
+        if not self.fetched_at:
+            return 0.0
+        return max(0.0, self.fetched_at + self.ttl_s * self.ahead - now)
+
+    def refresh(self, min_interval: float = 0.0) -> bool:
+        """Blocking refresh. Coalesced: if another thread is refreshing, wait for its result."""
+        gen = self._attempts
+        with self._refresh_lock:
+            # Пока ждали lock, кто-то уже обновил (или попытался) — повторно не ходим.
+            if self._attempts != gen or (min_interval and time.monotonic() - self.attempted_at < min_interval):
+                return self.failures == 0
+            self.attempted_at = time.monotonic()
+            try:
+                jwks, src = _download_jwks()
+            except Exception as e:
+                self._attempts += 1
+                self.failures += 1
+                self.last_error = str(e)
+                _M_REFRESH_ERR.inc()
+                logger.warning("Supabase JWKS refresh failed (%s in a row): %s", self.failures, e)
+                return False
+
+            by_kid: dict[str, object] = {}
+            default: object = None
+            for i, jwk in enumerate(jwks["keys"]):
+                try:
+                    key: object = _build_key(jwk)
+                except SupabaseJwtError as e:
+                    key = e
+                if i == 0:
+                    default = key
+                kid = str(jwk.get("kid") or "").strip() if isinstance(jwk, dict) else ""
+                if kid and kid not in by_kid:
+                    by_kid[kid] = key
+            self._by_kid, self._default = by_kid, default
+            self.fetched_at = time.monotonic()
+            self.src = src
+            self.failures = 0
+            self.last_error = None
+            self._attempts += 1
+            _M_REFRESH_OK.inc()
+            return True
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.refresh, kwargs={"min_interval": self.retry_s if self.failures else 0.0},
+                         name="supabase-jwks-refresh", daemon=True).start()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self._due_in()))
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Supabase JWKS refresher failed")
+
+    def start(self) -> None:
+        if not (_get_supabase_url() or _get_jwks_url()):
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # --- lookup ---
+    def key_for(self, kid: str) -> object:
+        age = self._age()
+        if age > self.ttl_s + self.max_stale_s:
+            # Нечего отдавать (холодный старт) или ключи слишком старые — ждём загрузку.
+            self.refresh(min_interval=self.retry_s if self.failures else 0.0)
+            if self._age() > self.ttl_s + self.max_stale_s:
+                raise SupabaseJwtError(self.last_error or "unable to fetch JWKS")
+        elif age > self.ttl_s * self.ahead and self._due_in() <= 0.0:
+            # Фоновый refresher не успел/не запущен — обновим в фоне, сейчас отдаём текущие ключи.
+            self._refresh_in_background()
+
+        key = self._by_kid.get(kid) if kid else None
+        if key is None and kid:
+            # Неизвестный kid — вероятно, ротация ключей в Supabase: одна загрузка не чаще retry_s.
+            self.refresh(min_interval=self.retry_s)
+            key = self._by_kid.get(kid)
+        if key is None:
+            # Fallback: pick the first key if kid is absent/unmatched.
+            key = self._default
+        if key is None:
+            raise SupabaseJwtError("JWKS has no keys")
+        if isinstance(key, SupabaseJwtError):
+            raise key
+        return key
+
+    def snapshot(self) -> dict:
+        age = self._age()
+        return {
+            "src": self.src,
+            "kids": sorted(self._by_kid),
+            "age_sec": round(age, 1) if age != float("inf") else None,
+            "stale": age > self.ttl_s,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+JWKS = JwksStore()
+
+
+def _select_key_for_token(token: str) -> object:
+    try:
+        hdr = jwt.get_unverified_header(token)
+    except Exception as e:
+        raise SupabaseJwtError(f"invalid token header: {e}")
+
+    kid = (hdr.get("kid") or "").strip()
+    return JWKS.key_for(kid)
+
+
 def verify_supabase_access_token(token: str) -> dict:
     """Verifies Supabase RS256 access_token using JWKS.
 
@@ -102,6 +102,9 @@ import inspect
 from typing import Dict, Callable, Optional
 from datetime import datetime
 from TikTokLive.client.errors import SignAPIError, SignatureRateLimitError
+from app.services.event_throttle import EventThrottle
+from app.services.hot_log import HotLog
+from app.services.metrics import GIFT_DEDUP, TIKTOK_CONNECTS, TIKTOK_FAILURES, TIKTOK_RECONNECTS
 
 try:
     from TikTokLive.client.errors import WebcastBlocked200Error  # type: ignore
@@ -110,6 +113,14 @@ except Exception:  # pragma: no cover
 
 logger = logging.getLogger(__name__)
 
+_M_DEDUP_FULL = GIFT_DEDUP.labels("full_signature")
+_M_DEDUP_STREAK = GIFT_DEDUP.labels("streak_frame")
+_M_DEDUP_REPEAT = GIFT_DEDUP.labels("repeat")
+_M_CONNECTS = TIKTOK_CONNECTS.labels("python")
+_M_RECONNECTS = TIKTOK_RECONNECTS.labels("python")
+_M_FAILURES = TIKTOK_FAILURES.labels("python")
+hot_log = HotLog(logger)
+
 
 class TikTokService:
     """Сервис для управления подключениями к TikTok Live"""
@@ -131,6 +142,8 @@ class TikTokService:
         # Метрики зрителей
         self._viewer_current = {}
         self._viewer_total = {}
+        # Троттлинг viewer/like на подключение
+        self._throttles = {}  # type: Dict[str, EventThrottle]
         # Анти-дублирование подарков: (username+gift_id) -> (last_count, last_timestamp)
         self._recent_gifts = {}
         # Время последнего успешно полученного GiftEvent на клиента
@@ -308,6 +321,11 @@ class TikTokService:
                 "connect": on_connect_callback,
                 "disconnect": on_disconnect_callback,
             }
+            old_throttle = self._throttles.pop(user_id, None)
+            if old_throttle is not None:
+                old_throttle.close()
+            throttle = EventThrottle(tiktok_username, on_viewer=on_viewer_callback, on_like=on_like_callback)
+            self._throttles[user_id] = throttle
 
             # Для UX/диагностики: ждём реального ConnectEvent или явной ошибки запуска
             connect_event = asyncio.Event()
@@ -370,9 +388,9 @@ class TikTokService:
                                 gift_messages += 1
 
                         if type_counts:
-                            logger.debug(f"📦 RAW Frame decoded: types={type_counts}")
+                            hot_log.debug("raw", "📦 RAW Frame decoded", types=type_counts)
                         if gift_messages:
-                            logger.info(f"🎁 Обнаружены Gift-сообщения в RAW кадре: count={gift_messages}")
+                            hot_log.info("raw", "🎁 Обнаружены Gift-сообщения в RAW кадре", count=gift_messages)
                             last_evt = self._last_gift_event.get(user_id)
                             if not last_evt or (datetime.now() - last_evt).total_seconds() > 10:
                                 logger.warning("🎁 RAW содержит подарки, но GiftEvent не поступал >10s — возможно ограничение бесплатного ключа/отсутствие нужных cookies")
@@ -412,7 +430,7 @@ class TikTokService:
                 if on_comment_callback:
                     # Фильтрация: пропускаем события, которые были до подключения
                     # TikTokLive может отправить несколько старых событий при подключении
-                    logger.info(f"💬 TikTok комментарий от {username}: {text}")
+                    hot_log.info("comment", "💬 TikTok комментарий", user=username, text=text)
                     self._last_activity[user_id] = datetime.now()
                     try:
                         await on_comment_callback(username, text)
@@ -422,7 +440,7 @@ class TikTokService:
             @client.on(GiftEvent)
             async def on_gift(event: GiftEvent):
                 """Обработка подарков"""
-                logger.info(f"🎁 GiftEvent получен: raw={event.gift}")
+                hot_log.info("gift", "🎁 GiftEvent получен", raw=event.gift)
                 if not on_gift_callback:
                     logger.warning("on_gift_callback не установлен")
                     return
@@ -456,21 +474,31 @@ class TikTokService:
                 else:
                     # Если последний отправленный подарок идентичен и прошел недостаточный интервал — пропускаем
                     if last_sig and last_sig[0] == full_signature and (now - last_sig[1]).total_seconds() < dedup_delta_sec:
-                        logger.debug(f"🔁 Пропуск полного дубликата подарка (full_signature) delta={(now - last_sig[1]).total_seconds():.2f}s < {dedup_delta_sec}s")
+                        hot_log.debug("dedup", "🔁 Пропуск полного дубликата подарка (full_signature)", signature=full_signature, delta=(now - last_sig[1]).total_seconds(), limit=dedup_delta_sec)
+                        _M_DEDUP_FULL.inc()
                         return
                     # Если стриковый подарок в процессе streaking и число не изменилось — пропускаем
                     if streakable and streaking and prev and prev[0] == count:
-                        logger.debug(f"↺ Пропуск стрикового повторяющегося кадра подарка {signature} count={count}")
+                        hot_log.debug("dedup", "↺ Пропуск стрикового повторяющегося кадра подарка", signature=signature, count=count)
+                        _M_DEDUP_STREAK.inc()
                         return
                     # Если точный дубль (тот же count) приходит слишком быстро (<3s) — пропускаем
                     if prev and prev[0] == count and (now - prev[1]).total_seconds() < 3:
-                        logger.debug(f"⏱️ Пропуск дубликата подарка {signature} count={count} delta={(now - prev[1]).total_seconds():.2f}s")
+                        hot_log.debug("dedup", "⏱️ Пропуск дубликата подарка", signature=signature, count=count, delta=(now - prev[1]).total_seconds())
+                        _M_DEDUP_REPEAT.inc()
                         return
                 # Обновляем запись
                 gift_map[signature] = (count, now)
                 self._last_gift_signature[user_id] = (full_signature, now)
-                logger.info(
-                    f"TikTok подарок от {username}: {gift_name} (ID: {gift_id}) x{count} (единица {diamond_unit}, всего {diamonds} алмазов)"
+                hot_log.info(
+                    "gift",
+                    "TikTok подарок",
+                    user=username,
+                    gift=gift_name,
+                    gift_id=gift_id,
+                    count=count,
+                    unit=diamond_unit,
+                    diamonds=diamonds,
                 )
                 self._last_gift_event[user_id] = now
                 self._last_activity[user_id] = datetime.now()
@@ -486,20 +514,16 @@ class TikTokService:
                     login, nickname = _extract_user_identifiers(getattr(event, "user", None))
                     username = login or nickname or "anonymous"
                     count = getattr(event, "count", None) or 0
-                    logger.info(f"TikTok лайки от {username}: {count}")
+                    hot_log.debug("like", "TikTok лайки", user=username, count=count)
                     self._last_activity[user_id] = datetime.now()
-                    try:
-                        await on_like_callback(username, count)
-                    except Exception as e:
-                        logger.error(f"Ошибка в like callback: {e}")
+                    await throttle.like(username, count)
             
             @client.on(JoinEvent)
             async def on_join(event: JoinEvent):
                 """Обработка входа зрителя в стрим"""
                 login, nickname = _extract_user_identifiers(getattr(event, "user", None))
                 username = login or nickname
-                print(f"👤 JoinEvent: {username} присоединился к стриму")
-                logger.info(f"TikTok зритель присоединился: login={login} nickname={nickname}")
+                hot_log.info("join", "👤 TikTok зритель присоединился", login=login, nickname=nickname)
                 self._last_activity[user_id] = datetime.now()
                 if on_join_callback:
                     try:
@@ -513,7 +537,7 @@ class TikTokService:
                 @client.on(FollowEvent)
                 async def on_follow(event):  # type: ignore
                     username = getattr(event.user, 'unique_id', None) or getattr(event.user, 'nickname', '')
-                    logger.info(f"TikTok подписка: {username}")
+                    hot_log.info("social", "TikTok подписка", user=username)
                     try:
                         await on_follow_callback(username)
                     except Exception as e:
@@ -523,7 +547,7 @@ class TikTokService:
                 @client.on(SubscribeEvent)
                 async def on_subscribe(event):  # type: ignore
                     username = getattr(event.user, 'unique_id', None) or getattr(event.user, 'nickname', '')
-                    logger.info(f"TikTok супер-подписка: {username}")
+                    hot_log.info("social", "TikTok супер-подписка", user=username)
                     try:
                         await on_subscribe_callback(username)
                     except Exception as e:
@@ -534,7 +558,7 @@ class TikTokService:
             async def on_share(event: ShareEvent):
                 """Обработка события когда кто-то делится стримом"""
                 username = getattr(event.user, 'unique_id', None) or getattr(event.user, 'nickname', 'Unknown')
-                logger.info(f"📤 TikTok Share: {username} поделился стримом")
+                hot_log.info("social", "📤 TikTok Share", user=username)
                 self._last_activity[user_id] = datetime.now()
                 if on_share_callback:
                     try:
@@ -546,8 +570,6 @@ class TikTokService:
             @client.on(RoomUserSeqEvent)
             async def on_room_user_seq(event: RoomUserSeqEvent):
                 """Обработка счётчика зрителей"""
-                print(f"🔔 RoomUserSeqEvent received")
-                
                 prev_current = self._viewer_current.get(user_id, 0)
                 prev_total = self._viewer_total.get(user_id, 0)
                 
@@ -580,16 +602,12 @@ class TikTokService:
                 self._viewer_current[user_id] = current
                 self._viewer_total[user_id] = total
                 
-                print(f"📊 Viewers: current={current}, total={total} (prev: {prev_current}/{prev_total})")
-                logger.info(f"👥 Зрителей: current={current}, total={total}")
                 self._last_activity[user_id] = datetime.now()
                 
-                # Отправляем callback только если изменились
-                if (current != prev_current or total != prev_total) and on_viewer_callback:
-                    try:
-                        await on_viewer_callback(current, total)
-                    except Exception as e:
-                        logger.error(f"Ошибка в viewer callback: {e}")
+                # Отправляем callback только если изменились (не чаще TT_VIEWER_THROTTLE_SEC)
+                if current != prev_current or total != prev_total:
+                    hot_log.debug("viewer", "👥 Зрителей", current=current, total=total, prev_current=prev_current, prev_total=prev_total)
+                    await throttle.viewer(current, total)
             
             @client.on(DisconnectEvent)
             async def on_disconnect(event: DisconnectEvent):
@@ -598,6 +616,7 @@ class TikTokService:
                 if self._stopping.get(user_id):
                     logger.info("Пропускаем disconnect callback для контролируемой остановки @%s", tiktok_username)
                     return
+                await throttle.flush()
                 if on_disconnect_callback:
                     try:
                         await on_disconnect_callback(tiktok_username)
@@ -631,6 +650,7 @@ class TikTokService:
                                 delay,
                             )
                             await asyncio.sleep(delay)
+                            _M_RECONNECTS.inc()
 
                             # Важно: перезапускаем с сохранёнными колбэками
                             name = self._usernames.get(user_id, tiktok_username)
@@ -740,6 +760,7 @@ class TikTokService:
                     break  # Не ретраим при критических ошибках
 
             if last_err is not None:
+                _M_FAILURES.inc()
                 # Убираем за собой на ошибке, чтобы не оставлять "мертвые" клиенты
                 try:
                     await self.stop_client(user_id)
@@ -748,6 +769,7 @@ class TikTokService:
                 raise last_err
             
             logger.info(f"TikTok клиент запущен для {user_id} (@{tiktok_username})")
+            _M_CONNECTS.inc()
 
             # Запускаем watchdog: если нет активности N секунд — мягкий рестарт клиента
             inactivity_limit = int(os.getenv("TT_WATCHDOG_INACTIVITY_SEC", "75"))
@@ -830,6 +852,9 @@ class TikTokService:
                 del self._clients[user_id]
             if user_id in self._callbacks:
                 del self._callbacks[user_id]
+            old_throttle = self._throttles.pop(user_id, None)
+            if old_throttle is not None:
+                old_throttle.close()
             raise
     
     async def stop_client(self, user_id: str):
@@ -874,10 +899,17 @@ class TikTokService:
                 del self._last_start_exc[user_id]
             if user_id in self._stopping:
                 del self._stopping[user_id]
+            throttle = self._throttles.pop(user_id, None)
+            if throttle is not None:
+                throttle.close()
             logger.info(f"TikTok клиент остановлен для {user_id}")
         except Exception as e:
             logger.error(f"Ошибка остановки TikTok клиента: {e}")
     
+    def throttle_stats(self) -> dict:
+        """Счётчики троттлинга viewer/like по подключениям (сколько пришло, отправлено, отброшено, склеено)."""
+        return {uid: t.snapshot() for uid, t in self._throttles.items()}
+
     def is_running(self, user_id: str) -> bool:
         """Проверяет, запущен ли клиент"""
         client = self._clients.get(user_id)
@@ -1,13 +1,101 @@
 import asyncio
+import bisect
+import hashlib
 import json
 import logging
 import os
+from collections import deque
 from typing import Any
 
 import websockets
 
+from app.services.event_throttle import EventThrottle
+from app.services.metrics import TIKTOK_CONNECTS, TIKTOK_FAILURES, TIKTOK_RECONNECTS
+
 logger = logging.getLogger(__name__)
 
+_M_CONNECTS = TIKTOK_CONNECTS.labels("js")
+_M_RECONNECTS = TIKTOK_RECONNECTS.labels("js")
+_M_FAILURES = TIKTOK_FAILURES.labels("js")
+
+# Protocol 2: batched `events` frames with per-user `seq` and cumulative `events_ack`.
+# Protocol 1 (one `event` frame per event) is still accepted from older bridges.
+BRIDGE_PROTOCOL_VERSION = 2
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class _PendingBatch:
+    """A received `events` batch; acked once all of its events have left the dispatch queues."""
+
+    __slots__ = ("batch", "remaining", "sealed", "window")
+
+    def __init__(self, batch: Any, window: deque):
+        self.batch = batch
+        self.remaining = 0
+        self.sealed = False
+        self.window = window
+
+
+class _DispatchQueue(asyncio.Queue):
+    """Per-user bounded queue. Lossless items (gifts, connect/disconnect) that do not fit wait
+    in `overflow` instead of being dropped; the overflow is bounded in practice because the
+    bridge stops sending once its ack window is full (acks are held until events are dequeued)."""
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize=maxsize)
+        self.overflow: deque = deque()
+
+    def offer(self, item: Any, lossless: bool = False) -> bool:
+        if not self.overflow:
+            try:
+                self.put_nowait(item)
+                return True
+            except asyncio.QueueFull:
+                pass
+        if lossless:
+            self.overflow.append(item)
+            return True
+        return False
+
+    async def take(self) -> Any:
+        item = await self.get()
+        while self.overflow and not self.full():
+            self.put_nowait(self.overflow.popleft())
+        return item
+
+    def pending(self) -> int:
+        return self.qsize() + len(self.overflow)
+
+
+class _BridgeConnection:
+    def __init__(self, url: str):
+        self.url = url
+        self.ws = None
+        # Batches received on the current connection, in order, not yet acked.
+        self.unacked: deque[_PendingBatch] = deque()
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.protocol = 1
+        self.attempted = False
+        self.remote_stats: dict[str, Any] = {}
+
+    def connect_url(self) -> str:
+        token = (os.getenv("TIKTOK_BRIDGE_TOKEN") or "").strip()
+        if not token:
+            return self.url
+        joiner = '&' if '?' in self.url else '?'
+        return f"{self.url}{joiner}token={token}"
+
 
 class JsTikTokService:
     def __init__(self):
@@ -19,20 +107,66 @@ class JsTikTokService:
         self._last_errors: dict[str, str] = {}
         self._callback_tasks: set[asyncio.Task] = set()
 
-        self._bridge_ws = None
-        self._bridge_ready = asyncio.Event()
+        # One worker per user drains a fixed-size queue. Batch acks are held until the
+        # batch's events are dequeued, so a slow consumer backs up the bridge window;
+        # if the queue is still full, noisy events are dropped, gifts never are.
+        self._dispatch_queue_size = max(1, _env_int("TIKTOK_BRIDGE_DISPATCH_QUEUE", 1000))
+        self._dispatch_drain_sec = max(0, _env_int("TIKTOK_BRIDGE_DRAIN_SEC", 10))
+        self._dispatch_queues: dict[str, _DispatchQueue] = {}
+        self._dispatch_workers: dict[str, asyncio.Task] = {}
+        self._last_seq: dict[str, int] = {}
+        self._throttles: dict[str, EventThrottle] = {}
+        self._dispatch_stats: dict[str, int] = {
+            "batches": 0,
+            "events": 0,
+            "seq_gaps": 0,
+            "seq_missed": 0,
+            "duplicates": 0,
+            "dropped": 0,
+            "overflowed": 0,
+            "drain_lost": 0,
+        }
+
+        # Users are spread over one or more bridges with a consistent-hash ring;
+        # a user stays on the bridge it was assigned to until that bridge dies.
+        self._bridges: dict[str, _BridgeConnection] = {url: _BridgeConnection(url) for url in self._bridge_urls()}
+        self._ring: list[tuple[int, str]] = sorted(
+            (_ring_hash(f"{url}#{i}"), url)
+            for url in self._bridges
+            for i in range(max(1, _env_int("TIKTOK_BRIDGE_VNODES", 64)))
+        )
+        self._ring_keys = [h for h, _ in self._ring]
+        self._assignments: dict[str, _BridgeConnection] = {}
         self._bridge_lock = asyncio.Lock()
-        self._bridge_task: asyncio.Task | None = None
         self._closing = False
         self._request_seq = 0
 
-    def _bridge_url(self) -> str:
-        raw = (os.getenv("TIKTOK_BRIDGE_WS_URL") or "ws://127.0.0.1:3000/bridge").strip()
-        token = (os.getenv("TIKTOK_BRIDGE_TOKEN") or "").strip()
-        if not token:
-            return raw
-        joiner = '&' if '?' in raw else '?'
-        return f"{raw}{joiner}token={token}"
+    @staticmethod
+    def _bridge_urls() -> list[str]:
+        raw = (os.getenv("TIKTOK_BRIDGE_WS_URLS") or os.getenv("TIKTOK_BRIDGE_WS_URL") or "ws://127.0.0.1:3000/bridge")
+        urls: list[str] = []
+        for part in raw.replace(";", ",").split(","):
+            url = part.strip()
+            if url and url not in urls:
+                urls.append(url)
+        return urls or ["ws://127.0.0.1:3000/bridge"]
+
+    def _ring_order(self, user_id: str) -> list[_BridgeConnection]:
+        start = bisect.bisect(self._ring_keys, _ring_hash(user_id))
+        order: list[_BridgeConnection] = []
+        for i in range(len(self._ring)):
+            bridge = self._bridges[self._ring[(start + i) % len(self._ring)][1]]
+            if bridge not in order:
+                order.append(bridge)
+                if len(order) == len(self._bridges):
+                    break
+        return order
+
+    def _first_ready(self, user_id: str, exclude: _BridgeConnection | None = None) -> _BridgeConnection | None:
+        for bridge in self._ring_order(user_id):
+            if bridge is not exclude and bridge.ready.is_set():
+                return bridge
+        return None
 
     def _next_request_id(self) -> str:
         self._request_seq += 1
@@ -55,40 +189,191 @@ class JsTikTokService:
         if exc is not None:
             logger.exception("TikTok JS callback task failed", exc_info=exc)
 
-    async def _send(self, payload: dict[str, Any]) -> None:
-        ws = self._bridge_ws
+    def _submit(self, user_id: str, cb, *args, lossless: bool = False, batch: _PendingBatch | None = None) -> bool:
+        if cb is None:
+            return False
+        queue = self._dispatch_queues.get(user_id)
+        if queue is None:
+            queue = _DispatchQueue(self._dispatch_queue_size)
+            self._dispatch_queues[user_id] = queue
+            self._dispatch_workers[user_id] = asyncio.create_task(self._dispatch_worker(user_id, queue))
+        overflowed = bool(queue.overflow) or queue.full()
+        if queue.offer((cb, args, batch), lossless=lossless):
+            if batch is not None:
+                batch.remaining += 1
+            if overflowed:
+                self._dispatch_stats["overflowed"] += 1
+            return True
+
+        self._dispatch_stats["dropped"] += 1
+        dropped = self._dispatch_stats["dropped"]
+        if dropped == 1 or dropped % 500 == 0:
+            logger.warning(
+                "TikTok JS dispatch queue full for %s (size=%s), dropping events (total dropped=%s)",
+                user_id,
+                self._dispatch_queue_size,
+                dropped,
+            )
+        return False
+
+    async def _dispatch_worker(self, user_id: str, queue: _DispatchQueue) -> None:
+        while True:
+            item = await queue.take()
+            if item is None:
+                return
+            cb, args, batch = item
+            if batch is not None:
+                batch.remaining -= 1
+                self._ack_ready(batch.window)
+            try:
+                await cb(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("TikTok JS callback failed for %s", user_id)
+
+    def _stop_dispatcher(self, user_id: str) -> None:
+        queue = self._dispatch_queues.pop(user_id, None)
+        self._last_seq.pop(user_id, None)
+        worker = self._dispatch_workers.pop(user_id, None)
+        if worker is None or worker.done():
+            return
+        if queue is None:
+            worker.cancel()
+            return
+        # Already queued events (gifts!) are still processed; the worker exits on the sentinel.
+        queue.offer(None, lossless=True)
+        self._spawn(self._drain_dispatcher(user_id, queue, worker))
+
+    async def _drain_dispatcher(self, user_id: str, queue: _DispatchQueue, worker: asyncio.Task) -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(worker), timeout=self._dispatch_drain_sec)
+        except asyncio.TimeoutError:
+            lost = max(0, queue.pending() - 1)
+            worker.cancel()
+            self._dispatch_stats["drain_lost"] += lost
+            logger.warning(
+                "TikTok JS dispatch queue for %s not drained in %ss, discarding %s events",
+                user_id,
+                self._dispatch_drain_sec,
+                lost,
+            )
+
+    def _ack_ready(self, window: deque) -> None:
+        """Ack (cumulatively) the longest prefix of fully dispatched batches of one bridge connection."""
+        last = None
+        while window and window[0].sealed and window[0].remaining <= 0:
+            last = window.popleft()
+        if last is None:
+            return
+        bridge = next((b for b in self._bridges.values() if b.unacked is window), None)
+        if bridge is None or bridge.ws is None:
+            return
+        self._spawn(self._send_ack(bridge, last.batch))
+
+    async def _send_ack(self, bridge: _BridgeConnection, batch_id: Any) -> None:
+        try:
+            await self._send({"op": "events_ack", "batch": batch_id}, bridge)
+        except Exception as exc:
+            logger.warning("Failed to ack TikTok JS bridge batch %s: %s", batch_id, exc)
+
+    def dispatch_stats(self) -> dict[str, Any]:
+        return {
+            **self._dispatch_stats,
+            "protocols": {b.url: b.protocol for b in self._bridges.values()},
+            "queue_size": self._dispatch_queue_size,
+            "queued": {uid: q.pending() for uid, q in self._dispatch_queues.items() if q.pending()},
+        }
+
+    def throttle_stats(self) -> dict[str, dict[str, Any]]:
+        return {uid: t.snapshot() for uid, t in self._throttles.items()}
+
+    def _make_throttle(self, user_id: str, username: str, on_viewer, on_like) -> EventThrottle:
+        # Throttling happens before the dispatch queue, so merged/dropped events never occupy it.
+        async def viewer(current: int, total: int) -> None:
+            self._submit(user_id, on_viewer, current, total)
+
+        async def like(user: str, count: int) -> None:
+            self._submit(user_id, on_like, user, count)
+
+        return EventThrottle(
+            username,
+            on_viewer=viewer if on_viewer is not None else None,
+            on_like=like if on_like is not None else None,
+        )
+
+    async def _send(self, payload: dict[str, Any], bridge: _BridgeConnection | None = None) -> None:
+        ws = bridge.ws if bridge is not None else None
         if ws is None:
             raise RuntimeError("TikTok JS bridge is not connected")
         await ws.send(json.dumps(payload, ensure_ascii=False))
 
-    async def _ensure_bridge(self) -> None:
-        if self._bridge_task is None or self._bridge_task.done():
-            async with self._bridge_lock:
-                if self._bridge_task is None or self._bridge_task.done():
-                    self._bridge_task = asyncio.create_task(self._bridge_loop())
-        await asyncio.wait_for(self._bridge_ready.wait(), timeout=10)
+    async def _ensure_bridges(self) -> None:
+        async with self._bridge_lock:
+            for bridge in self._bridges.values():
+                if bridge.task is None or bridge.task.done():
+                    bridge.task = asyncio.create_task(self._bridge_loop(bridge))
+
+    async def _pick_bridge(self, user_id: str) -> _BridgeConnection:
+        await self._ensure_bridges()
+        order = self._ring_order(user_id)
+        home = order[0]
+        if not home.ready.is_set() and not home.attempted:
+            # Cold start: give the home node a moment so the ring spreads users evenly.
+            try:
+                await asyncio.wait_for(home.ready.wait(), timeout=10 if len(order) == 1 else 3)
+            except asyncio.TimeoutError:
+                pass
+
+        bridge = self._first_ready(user_id)
+        if bridge is not None:
+            return bridge
+
+        waiters = [asyncio.create_task(b.ready.wait()) for b in order]
+        try:
+            await asyncio.wait(waiters, timeout=10, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        bridge = self._first_ready(user_id)
+        if bridge is None:
+            raise RuntimeError("TikTok JS bridge is not connected")
+        return bridge
 
-    async def _bridge_loop(self) -> None:
+    async def _bridge_loop(self, bridge: _BridgeConnection) -> None:
         backoff = 2
         while not self._closing:
             try:
-                async with websockets.connect(self._bridge_url(), ping_interval=20, ping_timeout=20) as ws:
-                    self._bridge_ws = ws
-                    self._bridge_ready.set()
-                    logger.info("Connected to TikTok JS bridge: %s", self._bridge_url())
-                    await self._resubscribe_all()
+                async with websockets.connect(bridge.connect_url(), ping_interval=20, ping_timeout=20) as ws:
+                    bridge.ws = ws
+                    bridge.protocol = 1
+                    # Batch ids restart per connection; acks for the old one are meaningless.
+                    bridge.unacked = deque()
+                    await self._send_hello(bridge)
+                    bridge.ready.set()
+                    bridge.attempted = True
+                    logger.info("Connected to TikTok JS bridge: %s", bridge.url)
+                    await self._resubscribe_all(bridge)
                     backoff = 2
 
-                    async for raw in ws:
-                        await self._handle_bridge_message(raw)
+                    poller = asyncio.create_task(self._poll_bridge_stats(bridge))
+                    try:
+                        async for raw in ws:
+                            await self._handle_bridge_message(bridge, raw)
+                    finally:
+                        poller.cancel()
             except asyncio.CancelledError:
                 break
             except Exception as exc:
-                logger.warning("TikTok JS bridge disconnected: %s", exc)
+                logger.warning("TikTok JS bridge %s disconnected: %s", bridge.url, exc)
             finally:
-                self._bridge_ws = None
-                self._bridge_ready.clear()
-                self._mark_bridge_lost()
+                bridge.ws = None
+                bridge.attempted = True
+                was_ready = bridge.ready.is_set()
+                bridge.ready.clear()
+                self._mark_bridge_lost(bridge)
+                if was_ready and not self._closing:
+                    self._spawn(self._failover(bridge))
 
             if self._closing:
                 break
@@ -96,29 +381,95 @@ class JsTikTokService:
             await asyncio.sleep(backoff)
             backoff = min(15, backoff * 2)
 
-    def _mark_bridge_lost(self) -> None:
-        previously_connected = list(self._connected_user_ids)
-        self._connected_user_ids.clear()
-        for user_id in previously_connected:
+    async def _poll_bridge_stats(self, bridge: _BridgeConnection) -> None:
+        interval = max(5, _env_int("TIKTOK_BRIDGE_STATS_SEC", 30))
+        while bridge.ready.is_set():
+            await asyncio.sleep(interval)
+            try:
+                await self._send({"op": "stats", "requestId": self._next_request_id()}, bridge)
+            except Exception:
+                return
+
+    async def _send_hello(self, bridge: _BridgeConnection) -> None:
+        try:
+            await self._send({
+                "op": "hello",
+                "requestId": self._next_request_id(),
+                "protocol": BRIDGE_PROTOCOL_VERSION,
+                "window": max(1, _env_int("TIKTOK_BRIDGE_ACK_WINDOW", 8)),
+                "batchMs": max(0, _env_int("TIKTOK_BRIDGE_BATCH_MS", 50)),
+            }, bridge)
+        except Exception as exc:
+            logger.warning("Failed to negotiate TikTok JS bridge protocol with %s: %s", bridge.url, exc)
+
+    def _mark_bridge_lost(self, bridge: _BridgeConnection) -> None:
+        for user_id in list(self._connected_user_ids):
+            if self._assignments.get(user_id) is not bridge:
+                continue
+            self._connected_user_ids.discard(user_id)
+            self._last_seq.pop(user_id, None)
             callbacks = self._callbacks.get(user_id) or {}
             username = self._desired_usernames.get(user_id, user_id)
-            disconnect_cb = callbacks.get("disconnect")
-            if disconnect_cb is not None:
-                self._spawn(disconnect_cb(username))
+            self._submit(user_id, callbacks.get("disconnect"), username, lossless=True)
+
+    async def _subscribe_on(self, bridge: _BridgeConnection, user_id: str, username: str) -> None:
+        self._assignments[user_id] = bridge
+        self._last_seq.pop(user_id, None)
+        await self._send({
+            "op": "subscribe",
+            "requestId": self._next_request_id(),
+            "userId": user_id,
+            "username": username,
+        }, bridge)
 
-    async def _resubscribe_all(self) -> None:
+    async def _failover(self, dead: _BridgeConnection) -> None:
         for user_id, username in list(self._desired_usernames.items()):
+            if self._assignments.get(user_id) is not dead:
+                continue
+            target = self._first_ready(user_id, exclude=dead)
+            if target is None:
+                # Nothing else is up: the user is picked up again by _resubscribe_all.
+                continue
             try:
-                await self._send({
-                    "op": "subscribe",
-                    "requestId": self._next_request_id(),
-                    "userId": user_id,
-                    "username": username,
-                })
+                await self._subscribe_on(target, user_id, username)
+                logger.info("Moved %s from TikTok JS bridge %s to %s", user_id, dead.url, target.url)
+            except Exception as exc:
+                logger.warning("Failed to move %s to TikTok JS bridge %s: %s", user_id, target.url, exc)
+
+    async def _resubscribe_all(self, bridge: _BridgeConnection) -> None:
+        for user_id, username in list(self._desired_usernames.items()):
+            assigned = self._assignments.get(user_id)
+            if assigned is not bridge:
+                # Adopt users whose bridge is down and for whom this is the next ring node.
+                if assigned is not None and assigned.ready.is_set():
+                    continue
+                if self._first_ready(user_id) is not bridge:
+                    continue
+            try:
+                await self._subscribe_on(bridge, user_id, username)
             except Exception as exc:
                 logger.warning("Failed to resubscribe %s: %s", user_id, exc)
 
-    async def _handle_bridge_message(self, raw: str) -> None:
+    def bridge_stats(self) -> list[dict[str, Any]]:
+        assigned: dict[str, int] = {url: 0 for url in self._bridges}
+        connected: dict[str, int] = {url: 0 for url in self._bridges}
+        for user_id, bridge in self._assignments.items():
+            assigned[bridge.url] += 1
+            if user_id in self._connected_user_ids:
+                connected[bridge.url] += 1
+        return [
+            {
+                "url": bridge.url,
+                "connected": bridge.ready.is_set(),
+                "protocol": bridge.protocol,
+                "assigned_users": assigned[bridge.url],
+                "live_users": connected[bridge.url],
+                "bridge": bridge.remote_stats,
+            }
+            for bridge in self._bridges.values()
+        ]
+
+    async def _handle_bridge_message(self, bridge: _BridgeConnection, raw: str) -> None:
         try:
             message = json.loads(raw)
         except Exception:
@@ -126,23 +477,97 @@ class JsTikTokService:
             return
 
         op = str(message.get("op") or "").strip().lower()
-        if op == "ready" or op == "ack" or op == "pong" or op == "stats":
+        if op == "events":
+            await self._handle_events_batch(bridge, message)
+            return
+        if op == "ack" or op == "pong":
+            return
+        if op == "ready" or op == "stats":
+            bridge.remote_stats = {k: v for k, v in message.items() if k != "op"}
+            return
+        if op == "hello":
+            bridge.protocol = int(message.get("protocol") or 1)
+            logger.info(
+                "TikTok JS bridge %s protocol=%s window=%s batchMs=%s",
+                bridge.url,
+                bridge.protocol,
+                message.get("window"),
+                message.get("batchMs"),
+            )
             return
         if op == "status":
-            await self._handle_status(message)
+            await self._handle_status(bridge, message)
             return
         if op == "error":
-            await self._handle_error(message)
+            if str(message.get("code") or "") == "UNKNOWN_OP" and bridge.protocol == 1:
+                logger.info("TikTok JS bridge %s does not support batched protocol, using per-event frames", bridge.url)
+                return
+            await self._handle_error(bridge, message)
             return
         if op == "event":
-            await self._handle_event(message)
+            await self._handle_event(bridge, message)
             return
 
-    async def _handle_status(self, message: dict[str, Any]) -> None:
+    def _owns(self, bridge: _BridgeConnection, user_id: str) -> bool:
+        return self._assignments.get(user_id) is bridge
+
+    async def _handle_events_batch(self, bridge: _BridgeConnection, message: dict[str, Any]) -> None:
+        events = message.get("events") or []
+        self._dispatch_stats["batches"] += 1
+        batch_id = message.get("batch")
+        pending = None
+        if batch_id is not None:
+            pending = _PendingBatch(batch_id, bridge.unacked)
+            bridge.unacked.append(pending)
+        for item in events:
+            if not isinstance(item, dict):
+                continue
+            user_id = str(item.get("userId") or "").strip()
+            if not user_id or not self._owns(bridge, user_id):
+                continue
+            if not self._accept_seq(user_id, item.get("seq")):
+                continue
+            await self._dispatch_event(
+                user_id, str(item.get("event") or "").strip().lower(), item.get("payload") or {}, batch=pending
+            )
+
+        if pending is not None:
+            # Ack is sent once every event of this (and each earlier) batch has been dequeued.
+            pending.sealed = True
+            self._ack_ready(bridge.unacked)
+
+    def _accept_seq(self, user_id: str, raw_seq: Any) -> bool:
+        try:
+            seq = int(raw_seq)
+        except (TypeError, ValueError):
+            return True
+        last = self._last_seq.get(user_id)
+        if last is not None:
+            if seq <= last and seq != 1:
+                self._dispatch_stats["duplicates"] += 1
+                return False
+            if seq > last + 1:
+                missed = seq - last - 1
+                self._dispatch_stats["seq_gaps"] += 1
+                self._dispatch_stats["seq_missed"] += missed
+                logger.warning("TikTok JS bridge sequence gap for %s: missed %s events (%s -> %s)", user_id, missed, last, seq)
+        self._last_seq[user_id] = seq
+        self._dispatch_stats["events"] += 1
+        return True
+
+    async def _handle_status(self, bridge: _BridgeConnection, message: dict[str, Any]) -> None:
         user_id = str(message.get("userId") or "").strip()
         if not user_id:
             return
         state = str(message.get("state") or "").strip().lower()
+        if not self._owns(bridge, user_id):
+            # A bridge that came back after failover may still hold a session we moved away.
+            if state in {"connected", "connecting", "reconnecting", "idle"}:
+                try:
+                    await self._send({"op": "unsubscribe", "requestId": self._next_request_id(), "userId": user_id}, bridge)
+                except Exception as exc:
+                    logger.warning("Failed to release stale session %s on %s: %s", user_id, bridge.url, exc)
+            return
         username = str(message.get("username") or self._desired_usernames.get(user_id) or "").strip()
         was_connected = user_id in self._connected_user_ids
 
@@ -154,92 +579,100 @@ class JsTikTokService:
             if waiter is not None and not waiter.done():
                 waiter.set_result(True)
             if not was_connected:
+                _M_CONNECTS.inc()
                 connect_cb = (self._callbacks.get(user_id) or {}).get("connect")
-                if connect_cb is not None:
-                    self._spawn(connect_cb(username))
+                self._submit(user_id, connect_cb, username, lossless=True)
             return
 
         self._connected_user_ids.discard(user_id)
+        if state == "reconnecting":
+            _M_RECONNECTS.inc()
 
         if state in {"reconnecting", "disconnected"} and was_connected:
+            throttle = self._throttles.get(user_id)
+            if throttle is not None:
+                await throttle.flush()
             disconnect_cb = (self._callbacks.get(user_id) or {}).get("disconnect")
-            if disconnect_cb is not None:
-                self._spawn(disconnect_cb(username))
+            self._submit(user_id, disconnect_cb, username, lossless=True)
 
-    async def _handle_error(self, message: dict[str, Any]) -> None:
+    async def _handle_error(self, bridge: _BridgeConnection, message: dict[str, Any]) -> None:
         user_id = str(message.get("userId") or "").strip()
         error_message = str(message.get("message") or "TikTok JS bridge error").strip()
+        if user_id and not self._owns(bridge, user_id):
+            return
         if user_id:
+            _M_FAILURES.inc()
             self._last_errors[user_id] = error_message
             waiter = self._pending_starts.pop(user_id, None)
             if waiter is not None and not waiter.done():
                 waiter.set_exception(RuntimeError(error_message))
         logger.warning("TikTok JS bridge error%s: %s", f" for {user_id}" if user_id else "", error_message)
 
-    async def _handle_event(self, message: dict[str, Any]) -> None:
+    async def _handle_event(self, bridge: _BridgeConnection, message: dict[str, Any]) -> None:
         user_id = str(message.get("userId") or "").strip()
-        if not user_id:
+        if not user_id or not self._owns(bridge, user_id):
             return
+        self._dispatch_stats["events"] += 1
+        await self._dispatch_event(user_id, str(message.get("event") or "").strip().lower(), message.get("payload") or {})
 
-        event_name = str(message.get("event") or "").strip().lower()
-        payload = message.get("payload") or {}
+    async def _dispatch_event(
+        self, user_id: str, event_name: str, payload: dict[str, Any], batch: _PendingBatch | None = None
+    ) -> None:
         callbacks = self._callbacks.get(user_id) or {}
 
         if event_name == "chat":
-            cb = callbacks.get("comment")
-            if cb is not None:
-                self._spawn(cb(str(payload.get("user") or ""), str(payload.get("message") or "")))
+            self._submit(
+                user_id,
+                callbacks.get("comment"),
+                str(payload.get("user") or ""),
+                str(payload.get("message") or ""),
+                batch=batch,
+            )
             return
 
         if event_name == "gift":
-            cb = callbacks.get("gift")
-            if cb is not None:
-                self._spawn(cb(
-                    str(payload.get("user") or ""),
-                    str(payload.get("giftId") or ""),
-                    str(payload.get("giftName") or "Gift"),
-                    int(payload.get("count") or 1),
-                    int(payload.get("diamonds") or 0),
-                ))
+            self._submit(
+                user_id,
+                callbacks.get("gift"),
+                str(payload.get("user") or ""),
+                str(payload.get("giftId") or ""),
+                str(payload.get("giftName") or "Gift"),
+                int(payload.get("count") or 1),
+                int(payload.get("diamonds") or 0),
+                lossless=True,
+                batch=batch,
+            )
             return
 
         if event_name == "like":
-            cb = callbacks.get("like")
-            if cb is not None:
-                self._spawn(cb(str(payload.get("user") or ""), int(payload.get("count") or 1)))
+            throttle = self._throttles.get(user_id)
+            if throttle is not None:
+                await throttle.like(str(payload.get("user") or ""), int(payload.get("count") or 1))
             return
 
         if event_name == "viewer_join":
-            cb = callbacks.get("join")
-            if cb is not None:
-                self._spawn(cb({
-                    "username": payload.get("username"),
-                    "nickname": payload.get("nickname"),
-                }))
+            self._submit(user_id, callbacks.get("join"), {
+                "username": payload.get("username"),
+                "nickname": payload.get("nickname"),
+            }, batch=batch)
             return
 
         if event_name == "follow":
-            cb = callbacks.get("follow")
-            if cb is not None:
-                self._spawn(cb(str(payload.get("user") or "")))
+            self._submit(user_id, callbacks.get("follow"), str(payload.get("user") or ""), batch=batch)
             return
 
         if event_name == "subscribe":
-            cb = callbacks.get("subscribe")
-            if cb is not None:
-                self._spawn(cb(str(payload.get("user") or "")))
+            self._submit(user_id, callbacks.get("subscribe"), str(payload.get("user") or ""), batch=batch)
             return
 
         if event_name == "share":
-            cb = callbacks.get("share")
-            if cb is not None:
-                self._spawn(cb(str(payload.get("user") or "")))
+            self._submit(user_id, callbacks.get("share"), str(payload.get("user") or ""), batch=batch)
             return
 
         if event_name == "viewer":
-            cb = callbacks.get("viewer")
-            if cb is not None:
-                self._spawn(cb(int(payload.get("current") or 0), int(payload.get("total") or 0)))
+            throttle = self._throttles.get(user_id)
+            if throttle is not None:
+                await throttle.viewer(int(payload.get("current") or 0), int(payload.get("total") or 0))
 
     async def start_client(
         self,
@@ -275,8 +708,14 @@ class JsTikTokService:
         }
         self._desired_usernames[uid] = username
         self._last_errors.pop(uid, None)
+        self._last_seq.pop(uid, None)
+        old_throttle = self._throttles.pop(uid, None)
+        if old_throttle is not None:
+            old_throttle.close()
+        self._throttles[uid] = self._make_throttle(uid, username, on_viewer_callback, on_like_callback)
 
-        await self._ensure_bridge()
+        previous = self._assignments.get(uid)
+        bridge = previous if previous is not None and previous.ready.is_set() else await self._pick_bridge(uid)
 
         waiter = asyncio.get_running_loop().create_future()
         old_waiter = self._pending_starts.get(uid)
@@ -284,12 +723,7 @@ class JsTikTokService:
             old_waiter.cancel()
         self._pending_starts[uid] = waiter
 
-        await self._send({
-            "op": "subscribe",
-            "requestId": self._next_request_id(),
-            "userId": uid,
-            "username": username,
-        })
+        await self._subscribe_on(bridge, uid, username)
 
         try:
             await asyncio.wait_for(waiter, timeout=float(os.getenv("TT_CONNECT_TIMEOUT_SEC", "25")))
@@ -307,14 +741,19 @@ class JsTikTokService:
         if waiter is not None and not waiter.done():
             waiter.cancel()
         self._callbacks.pop(uid, None)
+        throttle = self._throttles.pop(uid, None)
+        if throttle is not None:
+            throttle.close()
+        self._stop_dispatcher(uid)
 
-        if self._bridge_ws is not None and self._bridge_ready.is_set():
+        bridge = self._assignments.pop(uid, None)
+        if bridge is not None and bridge.ws is not None and bridge.ready.is_set():
             try:
                 await self._send({
                     "op": "unsubscribe",
                     "requestId": self._next_request_id(),
                     "userId": uid,
-                })
+                }, bridge)
             except Exception as exc:
                 logger.warning("Failed to unsubscribe %s from TikTok JS bridge: %s", uid, exc)
 
@@ -12,5 +12,20 @@ if connector_backend == "js":
     except Exception as exc:  # pragma: no cover
         logger.exception("Failed to initialize JS TikTok bridge, falling back to Python connector: %s", exc)
         from app.services.tiktok_service import tiktok_service  # type: ignore
+elif connector_backend == "replay":
+    from app.services.event_recording import ReplayTikTokService
+
+    tiktok_service = ReplayTikTokService()
+    logger.warning("TikTok connector backend: replay of %s", tiktok_service.path or "<TIKTOK_REPLAY_FILE not set>")
+elif connector_backend == "synthetic":
+    from app.services.tiktok_service_synthetic import tiktok_service  # type: ignore
+    logger.warning("TikTok connector backend: synthetic (generated events, load testing only)")
 else:
-    from app.services.tiktok_service import tiktok_service  # type: ignore
\ No newline at end of file
+    from app.services.tiktok_service import tiktok_service  # type: ignore
+
+record_dir = str(os.getenv("TIKTOK_RECORD_DIR", "")).strip()
+if record_dir and connector_backend != "replay":
+    from app.services.event_recording import RecordingTikTokService
+
+    tiktok_service = RecordingTikTokService(tiktok_service, record_dir)  # type: ignore
+    logger.info("TikTok event recording enabled: %s", record_dir)
@@ -0,0 +1,328 @@
+"""
+Синтетический TikTok-коннектор для нагрузочных тестов (TIKTOK_CONNECTOR_BACKEND=synthetic).
+
+Тот же интерфейс, что у python/js backend (start_client/stop_client/is_running), но события
+генерируются локально: комментарии, подарки со стриками, входы, лайки и счётчик зрителей.
+В текст каждого комментария добавляется метка `@ts=<unix ms>` — по ней
+tools/ws_load_test_v2.py считает задержку от генерации до WS-клиента.
+
+Настройки (env):
+    SYNTH_EVENTS_PER_SEC=20        — событий в секунду на одно подключение
+    SYNTH_MIX=comment=50,gift=10,like=25,join=10,viewer=5  — веса типов событий
+    SYNTH_DONORS=1000              — сколько разных зрителей/донатеров
+    SYNTH_DONOR_DIST=zipf          — zipf | uniform
+    SYNTH_ZIPF_S=1.1               — «крутизна» zipf (чем больше, тем сильнее доминируют топ-донатеры)
+    SYNTH_STREAK_MAX=15            — максимальная длина стрика подарка (кадры с растущим count)
+    SYNTH_STREAK_INTERVAL_MS=250   — пауза между кадрами стрика
+    SYNTH_VIEWERS=500              — базовый онлайн
+    SYNTH_SEED=                    — seed генератора (для воспроизводимых прогонов)
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Optional
+
+from app.services.event_throttle import EventThrottle
+
+logger = logging.getLogger(__name__)
+
+# (gift_id, name, diamonds за штуку, streakable, вес)
+GIFTS: list[tuple[str, str, int, bool, float]] = [
+    ("5655", "Rose", 1, True, 50.0),
+    ("5269", "TikTok", 1, True, 20.0),
+    ("5487", "Finger Heart", 5, True, 12.0),
+    ("5879", "Doughnut", 30, True, 6.0),
+    ("6064", "GG", 1, True, 6.0),
+    ("5827", "Ice Cream Cone", 1, True, 4.0),
+    ("6427", "Hat and Mustache", 99, False, 1.5),
+    ("5585", "Confetti", 100, False, 1.0),
+    ("6751", "TikTok Universe", 34999, False, 0.05),
+]
+
+_EVENT_TYPES = ("comment", "gift", "like", "join", "viewer")
+
+_PHRASES = [
+    "привет", "всем хай", "лол", "🔥🔥🔥", "как дела?", "го ещё", "где играешь?",
+    "первый раз тут", "топ стрим", "😂", "сколько лет?", "включи музыку", "ахаха", "gg",
+]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _parse_mix(raw: str) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for part in (raw or "").replace(";", ",").split(","):
+        key, _, value = part.partition("=")
+        key = key.strip().lower()
+        if key not in _EVENT_TYPES:
+            continue
+        try:
+            mix[key] = max(0.0, float(value))
+        except ValueError:
+            continue
+    return mix
+
+
+@dataclass
+class SyntheticProfile:
+    events_per_sec: float = 20.0
+    mix: dict[str, float] = field(default_factory=lambda: {"comment": 50, "gift": 10, "like": 25, "join": 10, "viewer": 5})
+    donors: int = 1000
+    donor_dist: str = "zipf"
+    zipf_s: float = 1.1
+    streak_max: int = 15
+    streak_interval_ms: int = 250
+    viewers: int = 500
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "SyntheticProfile":
+        base = cls()
+        mix = _parse_mix(os.getenv("SYNTH_MIX") or "") or base.mix
+        seed_raw = (os.getenv("SYNTH_SEED") or "").strip()
+        return cls(
+            events_per_sec=max(0.0, _env_float("SYNTH_EVENTS_PER_SEC", base.events_per_sec)),
+            mix=mix,
+            donors=max(1, int(_env_float("SYNTH_DONORS", base.donors))),
+            donor_dist=(os.getenv("SYNTH_DONOR_DIST") or base.donor_dist).strip().lower(),
+            zipf_s=max(0.0, _env_float("SYNTH_ZIPF_S", base.zipf_s)),
+            streak_max=max(1, int(_env_float("SYNTH_STREAK_MAX", base.streak_max))),
+            streak_interval_ms=max(0, int(_env_float("SYNTH_STREAK_INTERVAL_MS", base.streak_interval_ms))),
+            viewers=max(0, int(_env_float("SYNTH_VIEWERS", base.viewers))),
+            seed=int(seed_raw) if seed_raw.lstrip("-").isdigit() else None,
+        )
+
+
+class _Generator:
+    """Источник событий для одного подключения."""
+
+    def __init__(self, profile: SyntheticProfile, seed_key: str):
+        self.profile = profile
+        self.rng = random.Random(f"{profile.seed}:{seed_key}" if profile.seed is not None else None)
+        self.donor_names = [f"viewer_{i:06d}" for i in range(profile.donors)]
+        if profile.donor_dist == "zipf" and profile.donors > 1:
+            weights = [1.0 / ((rank + 1) ** profile.zipf_s) for rank in range(profile.donors)]
+            self._donor_cum = list(itertools.accumulate(weights))
+        else:
+            self._donor_cum = None
+        self._types = [t for t in _EVENT_TYPES if profile.mix.get(t, 0) > 0] or ["comment"]
+        self._type_cum = list(itertools.accumulate(profile.mix.get(t, 0) or 1 for t in self._types))
+        self._gift_cum = list(itertools.accumulate(g[4] for g in GIFTS))
+        self.viewers = profile.viewers
+        self.total_viewers = profile.viewers
+        self.seq = 0
+
+    def donor(self) -> str:
+        if self._donor_cum is None:
+            return self.donor_names[self.rng.randrange(len(self.donor_names))]
+        x = self.rng.random() * self._donor_cum[-1]
+        return self.donor_names[min(bisect.bisect(self._donor_cum, x), len(self.donor_names) - 1)]
+
+    def event_type(self) -> str:
+        x = self.rng.random() * self._type_cum[-1]
+        return self._types[min(bisect.bisect(self._type_cum, x), len(self._types) - 1)]
+
+    def gift(self) -> tuple[str, str, int, bool]:
+        x = self.rng.random() * self._gift_cum[-1]
+        gift_id, name, diamonds, streakable, _ = GIFTS[min(bisect.bisect(self._gift_cum, x), len(GIFTS) - 1)]
+        return gift_id, name, diamonds, streakable
+
+    def comment(self) -> str:
+        self.seq += 1
+        return f"{self.rng.choice(_PHRASES)} #{self.seq} @ts={int(time.time() * 1000)}"
+
+    def viewer_step(self) -> tuple[int, int]:
+        drift = max(1, self.profile.viewers // 50)
+        self.viewers = max(0, self.viewers + self.rng.randint(-drift, drift))
+        self.total_viewers = max(self.total_viewers, self.viewers) + self.rng.randint(0, drift)
+        return self.viewers, self.total_viewers
+
+
+class SyntheticTikTokService:
+    """Генератор событий вместо подключения к TikTok LIVE."""
+
+    def __init__(self):
+        self._clients: dict[str, asyncio.Task] = {}
+        self._callbacks: dict[str, dict[str, Any]] = {}
+        self._desired_usernames: dict[str, str] = {}
+        self._throttles: dict[str, EventThrottle] = {}
+        self._streak_tasks: dict[str, set[asyncio.Task]] = {}
+        self._profiles: dict[str, SyntheticProfile] = {}
+        self.default_profile = SyntheticProfile.from_env()
+        self._stats: dict[str, int] = {t: 0 for t in _EVENT_TYPES}
+        # Наблюдатели (uid, kind, user) — вызываются прямо перед callback; их использует tools/ws_bench_v2.py.
+        self.emit_listeners: list[Callable[[str, str, str], None]] = []
+
+    def set_profile(self, user_id: str, profile: SyntheticProfile | None = None, **overrides) -> SyntheticProfile:
+        """Профиль генерации для конкретного пользователя (действует со следующего start_client)."""
+        base = profile or self._profiles.get(str(user_id)) or self.default_profile
+        resolved = replace(base, **overrides) if overrides else base
+        self._profiles[str(user_id)] = resolved
+        return resolved
+
+    async def start_client(
+        self,
+        user_id: str,
+        tiktok_username: str,
+        on_comment_callback: Optional[Callable] = None,
+        on_gift_callback: Optional[Callable] = None,
+        on_like_callback: Optional[Callable] = None,
+        on_join_callback: Optional[Callable] = None,
+        on_follow_callback: Optional[Callable] = None,
+        on_subscribe_callback: Optional[Callable] = None,
+        on_share_callback: Optional[Callable] = None,
+        on_viewer_callback: Optional[Callable] = None,
+        on_connect_callback: Optional[Callable] = None,
+        on_disconnect_callback: Optional[Callable] = None,
+    ):
+        uid = str(user_id)
+        username = str(tiktok_username or "").strip().lstrip("@").lower()
+        if not username:
+            raise RuntimeError("TikTok username is required")
+        if uid in self._clients:
+            await self.stop_client(uid)
+
+        self._callbacks[uid] = {
+            "comment": on_comment_callback,
+            "gift": on_gift_callback,
+            "join": on_join_callback,
+            "connect": on_connect_callback,
+            "disconnect": on_disconnect_callback,
+        }
+        self._desired_usernames[uid] = username
+        self._throttles[uid] = EventThrottle(username, on_viewer=on_viewer_callback, on_like=on_like_callback)
+        self._streak_tasks[uid] = set()
+
+        profile = self._profiles.get(uid) or self.default_profile
+        generator = _Generator(profile, f"{uid}:{username}")
+        self._clients[uid] = asyncio.create_task(self._run(uid, generator))
+        logger.info(
+            "Synthetic TikTok stream started for %s (@%s): %.1f ev/s, donors=%s (%s)",
+            uid, username, profile.events_per_sec, profile.donors, profile.donor_dist,
+        )
+        if on_connect_callback:
+            try:
+                await on_connect_callback(username)
+            except Exception as e:
+                logger.error(f"Ошибка в connect callback: {e}")
+
+    async def stop_client(self, user_id: str):
+        uid = str(user_id)
+        task = self._clients.pop(uid, None)
+        if task is not None and not task.done():
+            task.cancel()
+        for streak in self._streak_tasks.pop(uid, set()):
+            streak.cancel()
+        throttle = self._throttles.pop(uid, None)
+        if throttle is not None:
+            throttle.close()
+        self._callbacks.pop(uid, None)
+        self._desired_usernames.pop(uid, None)
+
+    def is_running(self, user_id: str) -> bool:
+        task = self._clients.get(str(user_id))
+        return task is not None and not task.done()
+
+    def synthetic_stats(self) -> dict[str, Any]:
+        return {"generated": dict(self._stats), "clients": len(self._clients)}
+
+    def throttle_stats(self) -> dict:
+        return {uid: t.snapshot() for uid, t in self._throttles.items()}
+
+    async def _run(self, uid: str, gen: _Generator) -> None:
+        rate = gen.profile.events_per_sec
+        if rate <= 0:
+            return
+        interval = 1.0 / rate
+        next_at = time.monotonic()
+        try:
+            while True:
+                await self._emit(uid, gen)
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif delay < -1.0:
+                    # Не успеваем: не копим долг бесконечно, иначе после паузы будет залп.
+                    next_at = time.monotonic()
+                else:
+                    await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+
+    def _notify(self, uid: str, kind: str, user: str) -> None:
+        for listener in self.emit_listeners:
+            try:
+                listener(uid, kind, user)
+            except Exception:
+                pass
+
+    async def _emit(self, uid: str, gen: _Generator) -> None:
+        callbacks = self._callbacks.get(uid) or {}
+        kind = gen.event_type()
+        self._stats[kind] += 1
+        try:
+            if kind == "comment":
+                cb = callbacks.get("comment")
+                if cb:
+                    user = gen.donor()
+                    self._notify(uid, kind, user)
+                    await cb(user, gen.comment())
+            elif kind == "gift":
+                self._start_gift(uid, gen)
+            elif kind == "like":
+                throttle = self._throttles.get(uid)
+                if throttle is not None:
+                    await throttle.like(gen.donor(), gen.rng.randint(1, 15))
+            elif kind == "join":
+                cb = callbacks.get("join")
+                if cb:
+                    name = gen.donor()
+                    self._notify(uid, kind, name)
+                    await cb({"username": name, "nickname": name.replace("_", " ").title()})
+            elif kind == "viewer":
+                throttle = self._throttles.get(uid)
+                if throttle is not None:
+                    await throttle.viewer(*gen.viewer_step())
+        except Exception as e:
+            logger.error(f"Ошибка в synthetic {kind} callback: {e}")
+
+    def _start_gift(self, uid: str, gen: _Generator) -> None:
+        gift_id, name, diamonds, streakable = gen.gift()
+        donor = gen.donor()
+        length = gen.rng.randint(1, gen.profile.streak_max) if streakable else 1
+        tasks = self._streak_tasks.get(uid)
+        if tasks is None:
+            return
+        task = asyncio.create_task(self._gift_streak(uid, donor, gift_id, name, diamonds, length, gen.profile.streak_interval_ms))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _gift_streak(self, uid: str, donor: str, gift_id: str, name: str, diamonds: int, length: int, interval_ms: int) -> None:
+        # Как у TikTok: каждый кадр стрика несёт накопленный count.
+        for count in range(1, length + 1):
+            cb = (self._callbacks.get(uid) or {}).get("gift")
+            if cb is None:
+                return
+            try:
+                self._notify(uid, "gift", donor)
+                await cb(donor, gift_id, name, count, diamonds * count)
+            except Exception as e:
+                logger.error(f"Ошибка в synthetic gift callback: {e}")
+            if count < length and interval_ms:
+                await asyncio.sleep(interval_ms / 1000.0)
+
+
+tiktok_service = SyntheticTikTokService()
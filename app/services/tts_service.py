@@ -3,18 +3,19 @@ import logging
 import asyncio
 import shutil
 import subprocess
+import time
+from functools import lru_cache
+from importlib.util import find_spec
 from pathlib import Path
 from contextvars import ContextVar
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional, Dict
-from gtts import gTTS
-import edge_tts
 import httpx
-try:
-    from openai import OpenAI  # type: ignore[import-not-found]
-except Exception:
-    OpenAI = None
+# gTTS / edge_tts / openai импортируются при первой генерации соответствующим движком:
+# на холодном старте они не нужны, а openai тянет за собой pydantic-модели всего API.
+
+from app.services.metrics import TTS_ERRORS, TTS_FALLBACKS, TTS_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -288,12 +289,20 @@ def get_voice_by_id(voice_id: str) -> dict | None:
     return None
 
 
+@lru_cache(maxsize=None)
+def _have_module(name: str) -> bool:
+    try:
+        return find_spec(name) is not None
+    except Exception:
+        return False
+
+
 def get_all_voices():
     """Получить список всех доступных голосов.
     Если отсутствует OPENAI_API_KEY или SDK — openai голоса помечаем флагом unavailable.
     """
     all_voices = []
-    have_openai = OpenAI is not None and os.getenv("OPENAI_API_KEY")
+    have_openai = _have_module("openai") and os.getenv("OPENAI_API_KEY")
     have_eleven = bool(os.getenv("ELEVENLABS_API_KEY"))
     for engine, engine_voices in AVAILABLE_VOICES.items():
         for v in engine_voices:
@@ -346,6 +355,7 @@ async def generate_tts(text: str, voice_id: str = "gtts-ru", user_id: str = None
     
     result = ""
     primary_exc: Exception | None = None
+    t0 = time.perf_counter()
     try:
         if engine == "gtts":
             result = await _generate_gtts(text, voice_info, user_id)
@@ -372,6 +382,9 @@ async def generate_tts(text: str, voice_id: str = "gtts-ru", user_id: str = None
         primary_exc = e
         logger.exception("Primary TTS engine failed (engine=%s voice_id=%s)", engine, voice_id)
         result = ""
+    TTS_SECONDS.labels(engine).observe(time.perf_counter() - t0)
+    if not result:
+        TTS_ERRORS.labels(engine).inc()
 
     if result:
         meta["used_voice_id"] = voice_id
@@ -388,6 +401,8 @@ async def generate_tts(text: str, voice_id: str = "gtts-ru", user_id: str = None
     # Фолбэк (по умолчанию оставляем, чтобы не ломать текущий UX),
     # но теперь можно увидеть, что он сработал.
     fallback_voice = {"lang": "ru", "engine": "gtts"}
+    TTS_FALLBACKS.inc()
+    t0 = time.perf_counter()
     try:
         logger.warning("TTS engine '%s' failed, falling back to gTTS (ru). voice_id=%s", engine, voice_id)
         result = await _generate_gtts(text, fallback_voice, user_id)
@@ -395,6 +410,9 @@ async def generate_tts(text: str, voice_id: str = "gtts-ru", user_id: str = None
         logger.exception("gTTS fallback failed")
         meta["fallback_error"] = str(e)
         result = ""
+    TTS_SECONDS.labels("gtts").observe(time.perf_counter() - t0)
+    if not result:
+        TTS_ERRORS.labels("gtts").inc()
 
     if result:
         meta["used_voice_id"] = "gtts-ru"
@@ -429,6 +447,8 @@ async def _generate_gtts(text: str, voice_info: dict, user_id: str = None) -> st
     file_path = os.path.join(tts_dir, filename)
 
     try:
+        from gtts import gTTS
+
         def _generate():
             lang = voice_info.get("lang", "ru")
             slow = voice_info.get("slow", False)
@@ -471,6 +491,8 @@ async def _generate_edge(text: str, voice_info: dict, user_id: str = None) -> st
     file_path = os.path.join(tts_dir, filename)
 
     try:
+        import edge_tts
+
         voice = voice_info["id"]
         communicate = edge_tts.Communicate(text, voice)
         timeout_s = float(os.getenv("EDGE_TTS_TIMEOUT_SECONDS", "35") or "35")
@@ -642,7 +664,9 @@ def _escape_xml(text: str) -> str:
 
 async def _generate_openai(text: str, voice_info: dict, user_id: str = None) -> str:
     """Генерация через OpenAI TTS (модель *_tts). Возвращает URL или пустую строку."""
-    if OpenAI is None:
+    try:
+        from openai import OpenAI  # type: ignore[import-not-found]
+    except Exception:
         logger.warning("OpenAI SDK не установлен - openai tts недоступен")
         return ""
     api_key = os.getenv("OPENAI_API_KEY")
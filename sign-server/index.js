@@ -30,6 +30,10 @@ const bridge = new TikTokLiveBridge({
   baseReconnectDelaySec: Number(process.env.TIKTOK_BRIDGE_RECONNECT_BASE_SEC || 2),
   maxReconnectDelaySec: Number(process.env.TIKTOK_BRIDGE_RECONNECT_MAX_SEC || 30),
   maxReconnectAttempts: Number(process.env.TIKTOK_BRIDGE_RECONNECT_ATTEMPTS || 8),
+  batchIntervalMs: Number(process.env.TIKTOK_BRIDGE_BATCH_MS || 50),
+  maxBatchSize: Number(process.env.TIKTOK_BRIDGE_MAX_BATCH || 500),
+  ackWindow: Number(process.env.TIKTOK_BRIDGE_ACK_WINDOW || 8),
+  maxBufferedEvents: Number(process.env.TIKTOK_BRIDGE_MAX_BUFFERED_EVENTS || 5000),
 });
 
 const bridgeServer = new WebSocketServer({ noServer: true });
@@ -66,6 +70,21 @@ bridgeServer.on('connection', (ws) => {
     }
 
     try {
+      if (data?.op === 'events_ack') {
+        bridge.ackBatch(ws, data.batch);
+        return;
+      }
+
+      if (data?.op === 'hello') {
+        const negotiated = bridge.configureBackendClient(ws, {
+          protocol: data.protocol,
+          window: data.window,
+          batchMs: data.batchMs,
+        });
+        ws.send(JSON.stringify({ op: 'hello', requestId: data.requestId || null, ...negotiated }));
+        return;
+      }
+
       if (data?.op === 'ping') {
         ws.send(JSON.stringify({ op: 'pong', ts: Date.now() }));
         return;
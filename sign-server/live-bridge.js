@@ -3,6 +3,10 @@ import pkg from 'tiktok-live-connector';
 
 const { WebcastPushConnection } = pkg;
 
+// Paid events: when a backend's buffer overflows these are kept and the
+// chat/like/join/follow/share/viewer noise is evicted instead.
+const KEEP_ON_OVERFLOW = new Set(['gift', 'subscribe']);
+
 function normalizeUsername(rawUsername) {
   return String(rawUsername || '').trim().replace(/^@+/, '').toLowerCase();
 }
@@ -76,6 +80,8 @@ class LiveSession {
     this.reconnectTimer = null;
     this.reconnectAttempt = 0;
     this.maxReconnectAttempts = bridge.maxReconnectAttempts;
+    // Per-user sequence number: lets the backend detect dropped/duplicated events.
+    this.seq = 0;
   }
 
   emitStatus(state, message, extra = {}) {
@@ -102,10 +108,13 @@ class LiveSession {
   }
 
   emitEvent(event, payload) {
-    this.bridge.broadcast({
+    this.seq += 1;
+    this.bridge.publishEvent({
       op: 'event',
       userId: this.userId,
       username: this.username,
+      seq: this.seq,
+      ts: Date.now(),
       event,
       payload,
     });
@@ -343,6 +352,10 @@ export class TikTokLiveBridge extends EventEmitter {
     baseReconnectDelaySec = 2,
     maxReconnectDelaySec = 30,
     maxReconnectAttempts = 8,
+    batchIntervalMs = 50,
+    maxBatchSize = 500,
+    ackWindow = 8,
+    maxBufferedEvents = 5000,
   } = {}) {
     super();
     this.backendToken = String(backendToken || '').trim();
@@ -350,8 +363,14 @@ export class TikTokLiveBridge extends EventEmitter {
     this.baseReconnectDelaySec = baseReconnectDelaySec;
     this.maxReconnectDelaySec = maxReconnectDelaySec;
     this.maxReconnectAttempts = maxReconnectAttempts;
+    this.batchIntervalMs = batchIntervalMs;
+    this.maxBatchSize = maxBatchSize;
+    this.ackWindow = ackWindow;
+    this.maxBufferedEvents = maxBufferedEvents;
     this.sessions = new Map();
-    this.backendClients = new Set();
+    // ws -> delivery state. protocol 1 gets one frame per event, protocol 2 gets
+    // batched `events` frames limited by an unacked-batch window.
+    this.backendClients = new Map();
   }
 
   stats() {
@@ -361,10 +380,21 @@ export class TikTokLiveBridge extends EventEmitter {
         connected += 1;
       }
     }
+    let buffered = 0;
+    let dropped = 0;
+    let droppedGifts = 0;
+    for (const client of this.backendClients.values()) {
+      buffered += client.queue.length;
+      dropped += client.dropped;
+      droppedGifts += client.droppedGifts;
+    }
     return {
       sessions: this.sessions.size,
       connected,
       backendClients: this.backendClients.size,
+      bufferedEvents: buffered,
+      droppedEvents: dropped,
+      droppedGifts,
     };
   }
 
@@ -376,7 +406,17 @@ export class TikTokLiveBridge extends EventEmitter {
   }
 
   addBackendClient(ws) {
-    this.backendClients.add(ws);
+    this.backendClients.set(ws, {
+      protocol: 1,
+      window: this.ackWindow,
+      batchIntervalMs: this.batchIntervalMs,
+      queue: [],
+      batchSeq: 0,
+      ackedBatch: 0,
+      dropped: 0,
+      droppedGifts: 0,
+      flushTimer: null,
+    });
     ws.send(JSON.stringify({ op: 'ready', ...this.stats() }));
     for (const session of this.sessions.values()) {
       ws.send(JSON.stringify({
@@ -391,15 +431,115 @@ export class TikTokLiveBridge extends EventEmitter {
   }
 
   removeBackendClient(ws) {
+    const client = this.backendClients.get(ws);
+    if (client?.flushTimer) {
+      clearTimeout(client.flushTimer);
+    }
     this.backendClients.delete(ws);
   }
 
+  configureBackendClient(ws, { protocol = 1, window, batchMs } = {}) {
+    const client = this.backendClients.get(ws);
+    if (!client) {
+      return null;
+    }
+    client.protocol = asNumber(protocol, 1) >= 2 ? 2 : 1;
+    client.window = Math.max(1, Math.min(64, asNumber(window, this.ackWindow)));
+    client.batchIntervalMs = Math.max(0, Math.min(1000, asNumber(batchMs, this.batchIntervalMs)));
+    return { protocol: client.protocol, window: client.window, batchMs: client.batchIntervalMs };
+  }
+
+  ackBatch(ws, batchId) {
+    const client = this.backendClients.get(ws);
+    if (!client) {
+      return;
+    }
+    // Acks are cumulative: acking batch N releases every batch up to N.
+    const acked = Math.min(client.batchSeq, asNumber(batchId, 0));
+    if (acked > client.ackedBatch) {
+      client.ackedBatch = acked;
+    }
+    if (client.queue.length > 0) {
+      this.scheduleFlush(ws, client, 0);
+    }
+  }
+
   broadcast(payload) {
     const raw = JSON.stringify(payload);
-    for (const client of this.backendClients) {
-      if (client.readyState === client.OPEN) {
-        client.send(raw);
+    for (const ws of this.backendClients.keys()) {
+      if (ws.readyState === ws.OPEN) {
+        ws.send(raw);
+      }
+    }
+  }
+
+  publishEvent(event) {
+    let raw = null;
+    for (const [ws, client] of this.backendClients) {
+      if (ws.readyState !== ws.OPEN) {
+        continue;
       }
+      if (client.protocol < 2) {
+        raw = raw || JSON.stringify(event);
+        ws.send(raw);
+        continue;
+      }
+      client.queue.push(event);
+      if (client.queue.length > this.maxBufferedEvents) {
+        this.trimQueue(client);
+      }
+      this.scheduleFlush(ws, client, client.batchIntervalMs);
+    }
+  }
+
+  trimQueue(client) {
+    // Backend is not acking fast enough. Evict the oldest noisy events first
+    // (with ~5% slack, so a full buffer is not rescanned on every event) and
+    // keep gifts. The backend sees the hole through the per-user seq numbers.
+    const cap = this.maxBufferedEvents;
+    const evict = client.queue.length - cap + Math.floor(cap / 20);
+    const kept = [];
+    let evicted = 0;
+    for (const item of client.queue) {
+      if (evicted < evict && !KEEP_ON_OVERFLOW.has(item.event)) {
+        evicted += 1;
+        continue;
+      }
+      kept.push(item);
+    }
+    // Nothing cheaper left: the buffer is all gifts, the oldest ones go.
+    const excess = kept.length - cap;
+    if (excess > 0) {
+      kept.splice(0, excess);
+      client.droppedGifts += excess;
+    }
+    client.queue = kept;
+    client.dropped += evicted + Math.max(0, excess);
+  }
+
+  scheduleFlush(ws, client, delayMs) {
+    if (client.flushTimer) {
+      return;
+    }
+    client.flushTimer = setTimeout(() => {
+      client.flushTimer = null;
+      this.flush(ws, client);
+    }, delayMs);
+  }
+
+  flush(ws, client) {
+    if (ws.readyState !== ws.OPEN || client.queue.length === 0) {
+      return;
+    }
+    if (client.batchSeq - client.ackedBatch >= client.window) {
+      // Window is full; the next ack re-schedules the flush.
+      return;
+    }
+    const events = client.queue.splice(0, this.maxBatchSize).map(({ op, username, ...rest }) => rest);
+    client.batchSeq += 1;
+    ws.send(JSON.stringify({ op: 'events', batch: client.batchSeq, events }));
+    if (client.queue.length > 0) {
+      this.scheduleFlush(ws, client, client.batchIntervalMs);
     }
   }
 
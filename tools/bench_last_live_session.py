@@ -0,0 +1,186 @@
+"""Benchmark: "last LIVE session per user" for one admin users page.
+
+Seeds a throwaway DB with users + stream_sessions (skewed: a few heavy
+streamers own most of the sessions) and times the ways to get one session
+per user for a page of the heaviest users:
+
+    all_rows     - old list_users: every session of the page, first per user in Python
+    window       - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY started_at DESC) = 1
+    limit1       - correlated ORDER BY started_at DESC LIMIT 1 per user
+                   (ix_stream_sessions_user_started)
+    denormalized - users.last_live_at / last_live_tiktok_username (what list_users reads now)
+
+Default DB is a temporary SQLite file; never point --database-url at a real DB,
+the tool creates and fills tables in it.
+
+Usage:
+    python tools/bench_last_live_session.py
+    python tools/bench_last_live_session.py --sessions 1000000 --users 2000 --page 50 --repeat 5
+    python tools/bench_last_live_session.py --database-url postgresql+psycopg2://bench@localhost/bench
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, create_engine, insert, text  # noqa: E402
+
+from app.db import models  # noqa: E402
+from app.db.index_migrations import INDEXES, create_index_sql  # noqa: E402
+
+QUERIES = {
+    "all_rows": """
+        SELECT user_id, started_at, tiktok_username FROM stream_sessions
+        WHERE user_id IN :ids ORDER BY started_at DESC
+    """,
+    "window": """
+        SELECT user_id, started_at, tiktok_username FROM (
+            SELECT user_id, started_at, tiktok_username,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY started_at DESC) AS rn
+            FROM stream_sessions WHERE user_id IN :ids
+        ) t WHERE rn = 1
+    """,
+    "limit1": """
+        SELECT u.id,
+               (SELECT s.started_at FROM stream_sessions s WHERE s.user_id = u.id
+                ORDER BY s.started_at DESC LIMIT 1),
+               (SELECT s.tiktok_username FROM stream_sessions s WHERE s.user_id = u.id
+                ORDER BY s.started_at DESC LIMIT 1)
+        FROM users u WHERE u.id IN :ids
+    """,
+    "denormalized": """
+        SELECT id, last_live_at, last_live_tiktok_username FROM users WHERE id IN :ids
+    """,
+}
+
+
+def _seed(engine, n_users: int, n_sessions: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    tables = [models.User.__table__, models.StreamSession.__table__]
+    models.Base.metadata.drop_all(engine, tables=tables)
+    models.Base.metadata.create_all(engine, tables=tables)
+
+    now = datetime.utcnow()
+    user_ids = [str(uuid.uuid4()) for _ in range(n_users)]
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.User.__table__),
+            [
+                {"id": uid, "username": f"bench_{i}", "password_hash": "-", "role": "user", "created_at": now}
+                for i, uid in enumerate(user_ids)
+            ],
+        )
+
+    # Парето-распределение: первые пользователи — тяжёлые стримеры с тысячами эфиров.
+    weights = [1.0 / (i + 1) ** 1.2 for i in range(n_users)]
+    batch = 50_000
+    done = 0
+    while done < n_sessions:
+        n = min(batch, n_sessions - done)
+        rows = []
+        for uid in rnd.choices(user_ids, weights=weights, k=n):
+            started = now - timedelta(seconds=rnd.randint(0, 3 * 365 * 86400))
+            tt = f"tt_{uid[:8]}"
+            rows.append({"id": str(uuid.uuid4()), "user_id": uid, "tiktok_username": tt, "started_at": started, "status": "ended"})
+        with engine.begin() as conn:
+            conn.execute(insert(models.StreamSession.__table__), rows)
+        done += n
+        print(f"  seeded {done}/{n_sessions} sessions", end="\r", flush=True)
+    print()
+
+    with engine.begin() as conn:
+        for spec in INDEXES:
+            if spec.table == models.StreamSession.__tablename__ and engine.dialect.name in spec.dialects:
+                conn.execute(text(create_index_sql(spec, concurrently=False)))
+        # Тот же backfill, что и в _bootstrap_legacy_schema.
+        conn.execute(
+            text(
+                """
+                UPDATE users SET
+                    last_live_at = (SELECT s.started_at FROM stream_sessions s
+                                    WHERE s.user_id = users.id ORDER BY s.started_at DESC LIMIT 1),
+                    last_live_tiktok_username = (SELECT s.tiktok_username FROM stream_sessions s
+                                                 WHERE s.user_id = users.id ORDER BY s.started_at DESC LIMIT 1)
+                """
+            )
+        )
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE users"))
+            conn.execute(text("ANALYZE stream_sessions"))
+        else:
+            conn.execute(text("ANALYZE"))
+    return user_ids
+
+
+def _run(conn, name: str, ids: list[str]) -> tuple[int, dict]:
+    stmt = text(QUERIES[name]).bindparams(bindparam("ids", expanding=True))
+    rows = conn.execute(stmt, {"ids": ids}).fetchall()
+    result: dict = {}
+    for uid, at, tt in rows:
+        if uid not in result:
+            result[uid] = (at, tt)
+    return len(rows), result
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Benchmark last-live-session lookups for the admin users page.")
+    p.add_argument("--database-url", default="", help="Throwaway DB (default: temporary SQLite file).")
+    p.add_argument("--users", type=int, default=2000)
+    p.add_argument("--sessions", type=int, default=1_000_000)
+    p.add_argument("--page", type=int, default=50, help="Users per admin page (heaviest first).")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=42)
+    args = p.parse_args()
+
+    tmp = None
+    url = args.database_url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(prefix="bench_last_live_", suffix=".db", delete=False)
+        tmp.close()
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+
+    try:
+        t0 = time.perf_counter()
+        user_ids = _seed(engine, args.users, args.sessions, args.seed)
+        print(f"seed: {time.perf_counter() - t0:.1f}s ({engine.dialect.name})")
+
+        page = user_ids[: args.page]
+        reference = None
+        with engine.connect() as conn:
+            for name in QUERIES:
+                timings = []
+                for _ in range(max(1, args.repeat)):
+                    t = time.perf_counter()
+                    fetched, result = _run(conn, name, page)
+                    timings.append((time.perf_counter() - t) * 1000.0)
+                if reference is None:
+                    reference = result
+                mismatch = sum(1 for uid, v in reference.items() if result.get(uid) != v)
+                print(
+                    f"{name:13s} median {statistics.median(timings):9.2f} ms  "
+                    f"min {min(timings):9.2f} ms  rows fetched {fetched:8d}  "
+                    f"{'OK' if not mismatch else f'MISMATCH {mismatch}'}"
+                )
+    finally:
+        engine.dispose()
+        if tmp is not None:
+            try:
+                os.unlink(tmp.name)
+            except OSError:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
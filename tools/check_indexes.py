@@ -0,0 +1,86 @@
+"""Check that hot queries are served by the composite indexes.
+
+Runs EXPLAIN for every query in app.db.index_migrations.HOT_QUERIES
+(SQLite: EXPLAIN QUERY PLAN, Postgres: EXPLAIN (FORMAT JSON)) and verifies
+that the plan uses one of the expected indexes. Exit code 1 if any query
+falls back to a scan / other index, so it can run in CI against a fresh DB.
+
+On Postgres small tables are usually seq-scanned regardless of indexes, so
+by default the check runs with enable_seqscan=off (only inside its own
+transaction) — it answers "can the planner use the index", not "does it
+today". Use --real-costs to see the planner's actual choice.
+
+Usage:
+    python tools/check_indexes.py
+    python tools/check_indexes.py --apply          # create missing indexes first
+    python tools/check_indexes.py --verbose --real-costs
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.db.database import IS_SQLITE, engine  # noqa: E402
+from app.db.index_migrations import HOT_QUERIES, ensure_indexes  # noqa: E402
+
+
+def _plan(conn, sql: str, params: dict) -> str:
+    if IS_SQLITE:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        return "\n".join(str(r[-1]) for r in rows)
+    row = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(row, str):
+        row = json.loads(row)
+    return json.dumps(row, indent=1)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="EXPLAIN hot queries and check index usage.")
+    p.add_argument("--apply", action="store_true", help="Run ensure_indexes() before checking.")
+    p.add_argument("--real-costs", action="store_true", help="Postgres: don't disable seq scans.")
+    p.add_argument("--verbose", action="store_true", help="Print full plans.")
+    args = p.parse_args()
+
+    if args.apply:
+        ensure_indexes()
+
+    dialect = "sqlite" if IS_SQLITE else "postgresql"
+    queries = [q for q in HOT_QUERIES if dialect in q.dialects]
+    failed = 0
+    with engine.connect() as conn:
+        for q in queries:
+            trans = conn.begin()
+            try:
+                if not IS_SQLITE and not args.real_costs:
+                    conn.execute(text("SET LOCAL enable_seqscan = off"))
+                plan = _plan(conn, q.sql, q.params)
+            except Exception as e:
+                print(f"ERROR {q.name}: {e}")
+                failed += 1
+                continue
+            finally:
+                trans.rollback()
+
+            used = [name for name in q.expect if name in plan]
+            if used:
+                print(f"OK    {q.name}: {used[0]}")
+            else:
+                failed += 1
+                print(f"FAIL  {q.name}: expected one of {', '.join(q.expect)}")
+            if args.verbose or not used:
+                for line in plan.splitlines():
+                    print(f"        {line}")
+
+    print(f"{len(queries) - failed}/{len(queries)} queries use the expected index")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,51 @@
+"""Nightly compaction of donor_daily_stats_tt.
+
+Drops daily buckets that fell out of the longest rolling window (30d) in small
+batches, so the table stays at most ~30 rows per (streamer, donor).
+Intended to be executed by cron once per day (UTC), next to rebuild_gift_stats.
+
+--backfill rebuilds the last 30 days of buckets from gift_events_tt. Startup
+schema bootstrap does this once automatically (DB_ROLLUP_BACKFILL); run it by
+hand if that was disabled or the buckets need to be rebuilt.
+
+Usage:
+    python tools/compact_donor_daily.py
+    python tools/compact_donor_daily.py --backfill
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from app.db.database import SessionLocal
+from app.services.gift_stats_service import (
+    DONOR_DAILY_RETENTION_DAYS,
+    backfill_donor_daily_tt,
+    compact_donor_daily_tt,
+)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Compact (and optionally backfill) donor_daily_stats_tt.")
+    p.add_argument("--backfill", action="store_true", help="Rebuild buckets of the retention window from gift_events_tt.")
+    p.add_argument("--keep-days", type=int, default=DONOR_DAILY_RETENTION_DAYS)
+    p.add_argument("--batch-size", type=int, default=5000)
+    args = p.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.backfill:
+            t0 = time.monotonic()
+            n = backfill_donor_daily_tt(db, days=args.keep_days)
+            print(f"backfill: {n} buckets in {time.monotonic() - t0:.1f}s")
+
+        t0 = time.monotonic()
+        deleted = compact_donor_daily_tt(db, keep_days=args.keep_days, batch_size=args.batch_size)
+        print(f"compaction: deleted {deleted} buckets older than {args.keep_days}d in {time.monotonic() - t0:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Cold-start report: how long `import app.main` takes and where the time goes.
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter
+(several times: the first run on a new DB does the schema bootstrap, later
+runs should hit the stored schema fingerprint and skip it), then prints
+wall time per run, self import time grouped by top-level package, and the
+slowest modules by cumulative time.
+
+By default a throwaway SQLite DB is used so the report does not touch a
+real database; pass --database-url to measure against one.
+
+Usage:
+    python tools/import_time_report.py
+    python tools/import_time_report.py --runs 3 --top 25
+    python tools/import_time_report.py --backend js
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+_PROBE = "import time; t0 = time.perf_counter(); import app.main; print('__WALL__', time.perf_counter() - t0)"
+
+
+def _run(env: dict) -> tuple[float | None, list[tuple[int, int, int, str]], list[str]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)))
+    wall = None
+    notes = []
+    for line in proc.stdout.splitlines():
+        if line.startswith("__WALL__"):
+            wall = float(line.split()[1])
+        elif line.startswith("[DB]"):
+            notes.append(line)
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.splitlines()[-15:])
+        raise SystemExit(f"import app.main failed (exit {proc.returncode}):\n{tail}")
+    return wall, rows, notes
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Measure cold-start import time of app.main.")
+    p.add_argument("--runs", type=int, default=2, help="Fresh interpreters to start (first one bootstraps a new DB).")
+    p.add_argument("--top", type=int, default=20, help="How many packages/modules to list.")
+    p.add_argument("--database-url", default="", help="DB to import against (default: temporary SQLite file).")
+    p.add_argument("--backend", default="", help="TIKTOK_CONNECTOR_BACKEND for the run (python|js|synthetic|replay).")
+    args = p.parse_args()
+
+    env = dict(os.environ)
+    tmp_path = None
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(prefix="ttboost-importtime-", suffix=".db")
+        os.close(fd)
+        os.unlink(tmp_path)
+        env["DATABASE_URL"] = f"sqlite:///{tmp_path}"
+    if args.backend:
+        env["TIKTOK_CONNECTOR_BACKEND"] = args.backend
+    env.setdefault("LOG_QUEUE", "0")
+
+    try:
+        last_rows: list[tuple[int, int, int, str]] = []
+        for i in range(1, max(1, args.runs) + 1):
+            wall, rows, notes = _run(env)
+            last_rows = rows
+            total_self = sum(r[0] for r in rows) / 1e6
+            print(f"run {i}: wall {wall:.3f}s, import self-time {total_self:.3f}s, modules {len(rows)}")
+            for note in notes:
+                print(f"        {note}")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    by_pkg: dict[str, int] = defaultdict(int)
+    for self_us, _cum, _depth, name in last_rows:
+        by_pkg[name.split(".")[0]] += self_us
+    print(f"\nself import time by top-level package (last run), top {args.top}:")
+    for pkg, us in sorted(by_pkg.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {us / 1000.0:9.1f} ms  {pkg}")
+
+    print(f"\nslowest modules by cumulative time (last run), top {args.top}:")
+    for _self, cum, depth, name in sorted(last_rows, key=lambda r: -r[1])[: args.top]:
+        print(f"  {cum / 1000.0:9.1f} ms  {'  ' * min(depth // 2, 6)}{name}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
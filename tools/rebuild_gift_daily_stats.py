@@ -0,0 +1,29 @@
+"""Rebuild of the per-gift daily rollup.
+
+Runs GROUP BY streamer_id, gift_name, day over gift_events and rewrites
+gift_daily_stats (used by admin top-gifts analytics). Startup schema bootstrap
+does this once automatically (DB_ROLLUP_BACKFILL); afterwards the table is
+maintained on every recorded gift. Run by hand if that step was disabled or
+the rollup needs to be rebuilt.
+
+Usage:
+    python tools/rebuild_gift_daily_stats.py
+"""
+
+from __future__ import annotations
+
+from app.db.database import SessionLocal
+from app.services.gift_stats_service import rebuild_gift_daily_stats
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        n = rebuild_gift_daily_stats(db)
+        print(f"OK: {n} rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Replay a recorded TikTok event stream through /v2/ws and report handler cost.
+
+Recordings are produced by running the backend with TIKTOK_RECORD_DIR=/path
+(see app/services/event_recording.py). The replay runs the app in-process
+against a throwaway SQLite DB, so it is deterministic and safe to run
+before/after every hot-path change.
+
+Usage:
+    python tools/replay_events.py recordings/streamer-20260101-120000.ttrec
+    python tools/replay_events.py rec.ttrec --speed 10          # 10x faster
+    python tools/replay_events.py rec.ttrec --speed 0 --json out.json   # as fast as possible
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ws_harness  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Replay a .ttrec recording through ws_v2 callbacks.")
+    p.add_argument("recording")
+    p.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = no pauses.")
+    p.add_argument("--database-url", default=None, help="Default: throwaway SQLite file.")
+    p.add_argument("--tts", action="store_true", help="Keep chat TTS enabled (network calls!).")
+    p.add_argument("--drain-timeout", type=float, default=10.0)
+    p.add_argument("--json", dest="json_out", default=None, help="Write the report as JSON here.")
+    return p.parse_args()
+
+
+def _fmt(v) -> str:
+    return "-" if v is None else f"{v:.2f}"
+
+
+def main() -> int:
+    args = parse_args()
+    if not os.path.exists(args.recording):
+        raise SystemExit(f"Recording not found: {args.recording}")
+
+    ws_harness.prepare_env(
+        "replay",
+        database_url=args.database_url,
+        TIKTOK_REPLAY_FILE=os.path.abspath(args.recording),
+        TIKTOK_REPLAY_SPEED=args.speed,
+    )
+    app = ws_harness.load_app()
+
+    from fastapi.testclient import TestClient
+
+    from app.services.event_recording import read_recording
+    from app.services.tiktok_service_runtime import tiktok_service
+
+    header, events = read_recording(args.recording)
+    recorded_events = sum(1 for _ in events)
+    username = str(header.get("username") or "replay")
+    _, token = ws_harness.create_user(tiktok_username=username, tts_enabled=args.tts)
+    sql = ws_harness.SqlCounter()
+
+    frames_by_type: dict[str, int] = {}
+    t0 = time.monotonic()
+    with TestClient(app) as client:
+        with client.websocket_connect(f"/v2/ws?token={token}&platform=desktop") as ws:
+            reader = ws_harness.FrameReader(ws)
+            ws.send_text(json.dumps({"action": "connect_tiktok", "username": username}))
+
+            while tiktok_service.finished_at is None and not reader.closed.is_set():
+                time.sleep(0.05)
+
+            # Все кадры, отправленные до pong, уже в очереди.
+            ws.send_text(json.dumps({"action": "ping"}))
+            deadline = time.monotonic() + args.drain_timeout
+            got_pong = False
+            while time.monotonic() < deadline and not got_pong:
+                try:
+                    _, raw = reader.frames.get(timeout=0.2)
+                except Exception:
+                    continue
+                kind = str((json.loads(raw) or {}).get("type") or "?")
+                if kind == "pong":
+                    got_pong = True
+                    continue
+                frames_by_type[kind] = frames_by_type.get(kind, 0) + 1
+            for _, raw in reader.drain():
+                kind = str((json.loads(raw) or {}).get("type") or "?")
+                frames_by_type[kind] = frames_by_type.get(kind, 0) + 1
+            ws.close()
+    wall = time.monotonic() - t0
+    sql.close()
+
+    db = sql.snapshot()
+    replay_sec = (tiktok_service.finished_at or time.monotonic()) - (tiktok_service.started_at or t0)
+    handlers = {}
+    for kind, stat in sorted(tiktok_service.handler_stats.items()):
+        count = int(stat["count"])
+        handlers[kind] = {
+            "count": count,
+            "errors": int(stat["errors"]),
+            "latency_ms": ws_harness.summarize(stat["durations_ms"]),
+            "db_statements": db["by_handler"].get(kind, 0),
+            "db_statements_per_event": round(db["by_handler"].get(kind, 0) / count, 2) if count else None,
+        }
+    handled = sum(h["count"] for h in handlers.values())
+    report = {
+        "recording": os.path.abspath(args.recording),
+        "username": username,
+        "speed": args.speed,
+        "recorded_events": recorded_events,
+        "handled_events": handled,
+        "replay_sec": round(replay_sec, 3),
+        "wall_sec": round(wall, 3),
+        "events_per_sec": round(handled / replay_sec, 1) if replay_sec > 0 else None,
+        "handlers": handlers,
+        "db": db,
+        "frames": {"total": sum(frames_by_type.values()), "by_type": frames_by_type},
+    }
+
+    print(f"recording={report['recording']} events={recorded_events} speed={args.speed or 'max'}")
+    print(f"replayed {handled} events in {report['replay_sec']}s ({report['events_per_sec']} ev/s)")
+    print(f"{'handler':<12} {'count':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8} {'sql/ev':>7}")
+    for kind, h in handlers.items():
+        lat = h["latency_ms"]
+        print(
+            f"{kind:<12} {h['count']:>7} {_fmt(lat['p50']):>8} {_fmt(lat['p95']):>8} "
+            f"{_fmt(lat['p99']):>8} {_fmt(lat['max']):>8} {_fmt(h['db_statements_per_event']):>7}"
+        )
+    print(f"db statements={db['total']} ({db['total_ms']} ms)  frames={report['frames']['total']} {frames_by_type}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"report written to {args.json_out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,342 @@
+"""End-to-end benchmark suite for /v2/ws.
+
+Starts the app in-process (uvicorn on a free port, throwaway SQLite DB) with the
+synthetic TikTok connector and runs fixed scenarios against real WebSocket clients:
+
+    chat_raid    — one streamer, comment flood from many distinct viewers
+    gift_streak  — long cumulative gift streaks from a small donor pool
+    join_storm   — burst of viewer joins with high viewer cardinality
+    idle_1k      — 1000 idle WS connections (memory/CPU per connection)
+
+For every scenario it reports p50/p95/p99 event-to-frame latency (from the moment the
+connector hands the event to ws_v2 to the moment the client receives the frame),
+events/s, process CPU seconds, RSS and SQL statements per event. Results are saved as
+JSON and can be compared against a previous run:
+
+Usage:
+    python tools/ws_bench_v2.py --out bench.json
+    python tools/ws_bench_v2.py --scenarios chat_raid,gift_streak --duration 10
+    python tools/ws_bench_v2.py --out new.json --baseline bench.json \\
+        --thresholds "latency_p95_ms=+25%,events_per_sec=-10%,db_statements_per_event=+0%"
+
+Exit code is 1 when any threshold is exceeded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ws_harness  # noqa: E402
+
+try:
+    import psutil  # type: ignore
+except Exception:  # pragma: no cover
+    psutil = None
+
+
+SCENARIOS: dict[str, dict[str, Any]] = {
+    "chat_raid": {
+        "streamers": 1,
+        "profile": {"events_per_sec": 200, "mix": {"comment": 1}, "donors": 5000, "donor_dist": "uniform"},
+    },
+    "gift_streak": {
+        "streamers": 1,
+        "profile": {
+            "events_per_sec": 10,
+            "mix": {"gift": 1},
+            "donors": 50,
+            "donor_dist": "zipf",
+            "streak_max": 60,
+            "streak_interval_ms": 50,
+        },
+    },
+    "join_storm": {
+        "streamers": 1,
+        "profile": {"events_per_sec": 300, "mix": {"join": 1}, "donors": 50000, "donor_dist": "uniform"},
+    },
+    "idle_1k": {
+        "streamers": 0,
+        "idle_connections": 1000,
+    },
+}
+
+# connector event -> ws frame type
+FRAME_TYPES = {"comment": "chat", "gift": "gift", "join": "viewer_join"}
+
+DEFAULT_THRESHOLDS = "latency_p95_ms=+25%,latency_p99_ms=+50%,events_per_sec=-10%,db_statements_per_event=+10%,rss_mb=+20%"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of scenarios.")
+    p.add_argument("--duration", type=float, default=15.0, help="Seconds of load per scenario.")
+    p.add_argument("--rate-scale", type=float, default=1.0, help="Multiply every scenario's event rate.")
+    p.add_argument("--idle-connections", type=int, default=None, help="Override idle_1k connection count.")
+    p.add_argument("--out", default=None, help="Write results JSON here.")
+    p.add_argument("--baseline", default=None, help="Previous results JSON to compare against.")
+    p.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    return p.parse_args()
+
+
+class EmitLog:
+    """Times at which the connector handed events to ws_v2, matched FIFO against received frames."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str, str], collections.deque] = collections.defaultdict(collections.deque)
+        self.emitted = 0
+
+    def listener(self, uid: str, kind: str, user: str) -> None:
+        frame_type = FRAME_TYPES.get(kind)
+        if frame_type is None:
+            return
+        with self._lock:
+            self.emitted += 1
+            self._pending[(uid, frame_type, user.lower())].append(time.time())
+
+    def match(self, uid: str, frame: dict[str, Any]) -> float | None:
+        key = (uid, str(frame.get("type") or ""), str(frame.get("user_norm") or frame.get("user") or "").lower())
+        with self._lock:
+            q = self._pending.get(key)
+            if not q:
+                return None
+            return q.popleft()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self.emitted = 0
+
+
+def _rss_mb() -> float:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    # ru_maxrss: KiB на Linux — это пик, а не текущее значение.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cpu_sec() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _stream_client(url: str, uid: str, username: str, stop_at: float, emits: EmitLog, out: dict[str, Any]) -> None:
+    import websockets
+
+    async with websockets.connect(url, ping_interval=None, close_timeout=2, max_queue=None) as ws:
+        await ws.send(json.dumps({"action": "connect_tiktok", "username": username}))
+        while time.monotonic() < stop_at:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            received = time.time()
+            try:
+                frame = json.loads(raw)
+            except Exception:
+                continue
+            out["frames"] += 1
+            emitted = emits.match(uid, frame)
+            if emitted is not None:
+                out["latencies_ms"].append((received - emitted) * 1000.0)
+        await ws.send(json.dumps({"action": "disconnect_tiktok"}))
+
+
+async def _idle_client(url: str, stop_at: float, out: dict[str, Any]) -> None:
+    import websockets
+
+    try:
+        async with websockets.connect(url, ping_interval=None, close_timeout=2) as ws:
+            out["connected"] += 1
+            while time.monotonic() < stop_at:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+    except Exception:
+        out["failed"] += 1
+
+
+async def run_scenario(name: str, spec: dict[str, Any], server: ws_harness.ServerThread, args: argparse.Namespace,
+                       emits: EmitLog, sql: ws_harness.SqlCounter) -> dict[str, Any]:
+    from app.services.tiktok_service_runtime import tiktok_service
+
+    duration = float(args.duration)
+    emits.reset()
+    out: dict[str, Any] = {"frames": 0, "latencies_ms": [], "connected": 0, "failed": 0}
+
+    streamers = []
+    for i in range(int(spec.get("streamers") or 0)):
+        username = f"bench_{name}_{i}"
+        uid, token = ws_harness.create_user(tiktok_username=username)
+        profile = dict(spec.get("profile") or {})
+        profile["events_per_sec"] = float(profile.get("events_per_sec", 20)) * float(args.rate_scale)
+        tiktok_service.set_profile(uid, **profile)
+        streamers.append((uid, token, username))
+
+    idle = int(spec.get("idle_connections") or 0)
+    if idle and args.idle_connections is not None:
+        idle = max(0, int(args.idle_connections))
+    idle_tokens = [ws_harness.create_user()[1] for _ in range(min(idle, 50))] if idle else []
+
+    sql_before = sql.snapshot()["total"]
+    cpu_before = _cpu_sec()
+    rss_before = _rss_mb()
+    generated_before = sum(tiktok_service.synthetic_stats()["generated"].values())
+    t0 = time.monotonic()
+    stop_at = t0 + duration
+
+    tasks = [
+        asyncio.create_task(_stream_client(f"{server.ws_url}?token={token}&platform=desktop", uid, username, stop_at, emits, out))
+        for uid, token, username in streamers
+    ]
+    for i in range(idle):
+        token = idle_tokens[i % len(idle_tokens)]
+        tasks.append(asyncio.create_task(_idle_client(f"{server.ws_url}?token={token}&platform=desktop", stop_at, out)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.monotonic() - t0
+
+    errors = [repr(r) for r in results if isinstance(r, Exception)]
+    generated = sum(tiktok_service.synthetic_stats()["generated"].values()) - generated_before
+    statements = sql.snapshot()["total"] - sql_before
+    lat = ws_harness.summarize(out["latencies_ms"])
+    matched = lat["n"]
+    result = {
+        "scenario": name,
+        "duration_sec": round(elapsed, 2),
+        "streamers": len(streamers),
+        "idle_connections": idle,
+        "idle_connected": out["connected"],
+        "idle_failed": out["failed"],
+        "events_generated": generated,
+        "events_delivered": matched,
+        "frames": out["frames"],
+        "events_per_sec": round(matched / elapsed, 1) if elapsed > 0 else None,
+        "latency_p50_ms": lat["p50"],
+        "latency_p95_ms": lat["p95"],
+        "latency_p99_ms": lat["p99"],
+        "latency_max_ms": lat["max"],
+        "cpu_sec": round(_cpu_sec() - cpu_before, 3),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+        "db_statements": statements,
+        "db_statements_per_event": round(statements / generated, 2) if generated else None,
+        "errors": errors[:5],
+    }
+    return result
+
+
+def _parse_thresholds(raw: str) -> dict[str, tuple[str, float]]:
+    """Parse "metric=+25%" (may grow by 25%) / "metric=-10%" (may drop by 10%)."""
+    out: dict[str, tuple[str, float]] = {}
+    for part in (raw or "").split(","):
+        key, _, value = part.partition("=")
+        value = value.strip().rstrip("%")
+        if not key.strip() or not value:
+            continue
+        direction = "-" if value.startswith("-") else "+"
+        try:
+            out[key.strip()] = (direction, abs(float(value)) / 100.0)
+        except ValueError:
+            continue
+    return out
+
+
+def compare(results: list[dict[str, Any]], baseline: dict[str, Any], thresholds: dict[str, tuple[str, float]]) -> list[str]:
+    base_by_name = {r["scenario"]: r for r in baseline.get("results", [])}
+    failures: list[str] = []
+    for r in results:
+        base = base_by_name.get(r["scenario"])
+        if not base:
+            continue
+        for metric, (direction, allowed) in thresholds.items():
+            new, old = r.get(metric), base.get(metric)
+            if not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if direction == "+":
+                limit = old * (1 + allowed)
+                bad = new > limit
+            else:
+                limit = old * (1 - allowed)
+                bad = new < limit
+            status = "FAIL" if bad else "ok"
+            print(f"  [{status}] {r['scenario']}.{metric}: {old} -> {new} (limit {limit:.2f})")
+            if bad:
+                failures.append(f"{r['scenario']}.{metric}")
+    return failures
+
+
+def main() -> int:
+    args = parse_args()
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (known: {', '.join(SCENARIOS)})")
+
+    ws_harness.prepare_env("synthetic", HOT_LOG_MODE=os.getenv("HOT_LOG_MODE", "sampled"))
+    app = ws_harness.load_app()
+
+    from app.services.tiktok_service_runtime import tiktok_service
+
+    emits = EmitLog()
+    tiktok_service.emit_listeners.append(emits.listener)
+    sql = ws_harness.SqlCounter()
+    server = ws_harness.ServerThread(app).start()
+
+    results = []
+    try:
+        for name in names:
+            print(f"== {name} ({args.duration:.0f}s)")
+            r = asyncio.run(run_scenario(name, SCENARIOS[name], server, args, emits, sql))
+            results.append(r)
+            print(
+                f"   events={r['events_delivered']}/{r['events_generated']} ev/s={r['events_per_sec']} "
+                f"p50={r['latency_p50_ms']} p95={r['latency_p95_ms']} p99={r['latency_p99_ms']} ms "
+                f"cpu={r['cpu_sec']}s rss={r['rss_mb']}MB sql/ev={r['db_statements_per_event']}"
+            )
+            if r["idle_connections"]:
+                print(f"   idle connected={r['idle_connected']} failed={r['idle_failed']}")
+            if r["errors"]:
+                print(f"   errors: {r['errors']}")
+    finally:
+        server.stop()
+        sql.close()
+
+    payload = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "duration_sec": args.duration,
+        "rate_scale": args.rate_scale,
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"== compare with {args.baseline}")
+        failures = compare(results, baseline, _parse_thresholds(args.thresholds))
+        if failures:
+            print(f"regressions: {', '.join(failures)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,193 @@
+"""In-process harness for driving /v2/ws without TikTok or a running server.
+
+Shared by tools/replay_events.py and tools/ws_bench_v2.py:
+  - prepare_env() points DATABASE_URL at a throwaway SQLite file and selects
+    the connector backend *before* the app is imported;
+  - load_app() imports app.main (schema bootstrap runs as usual);
+  - create_user() seeds a user with settings and returns (user_id, token);
+  - SqlCounter counts SQL statements/time, attributed to the replay handler
+    (app.services.event_recording.current_handler) when one is running;
+  - FrameReader drains a TestClient websocket on a background thread;
+  - ServerThread serves the app with uvicorn on a free local port, for
+    benchmarks that need many real WebSocket connections.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def prepare_env(backend: str, database_url: str | None = None, **extra: str) -> str:
+    """Must be called before anything from `app` is imported."""
+    if not database_url:
+        fd, path = tempfile.mkstemp(prefix="ttboost-bench-", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["TIKTOK_CONNECTOR_BACKEND"] = backend
+    os.environ.setdefault("TT_WS_AUTOSTART", "0")
+    os.environ.setdefault("JWT_SECRET", "bench-secret")
+    for key, value in extra.items():
+        os.environ[key] = str(value)
+    return database_url
+
+
+def load_app():
+    from app.main import app
+
+    return app
+
+
+def create_user(username: str | None = None, tiktok_username: str | None = None, tts_enabled: bool = False) -> tuple[str, str]:
+    from app.db import models
+    from app.db.database import SessionLocal
+    from app.services.security import create_access_token, hash_password
+
+    username = username or f"bench_{uuid.uuid4().hex[:10]}"
+    db = SessionLocal()
+    try:
+        user = models.User(username=username, tiktok_username=tiktok_username, password_hash=hash_password("bench"))
+        db.add(user)
+        db.flush()
+        db.add(models.UserSettings(user_id=user.id, tts_enabled=tts_enabled, gift_sounds_enabled=True))
+        db.commit()
+        user_id = str(user.id)
+    finally:
+        db.close()
+    return user_id, create_access_token(user_id)
+
+
+class SqlCounter:
+    """Counts cursor executions on the app engine."""
+
+    def __init__(self):
+        from sqlalchemy import event
+
+        from app.db.database import engine
+        from app.services.event_recording import current_handler
+
+        self._event = event
+        self._engine = engine
+        self._current_handler = current_handler
+        self.total = 0
+        self.total_ms = 0.0
+        self.by_handler: dict[str, int] = {}
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_bench_t0", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_bench_t0") or []
+        elapsed = (time.perf_counter() - stack.pop()) * 1000.0 if stack else 0.0
+        handler = self._current_handler.get() or "other"
+        with self._lock:
+            self.total += 1
+            self.total_ms += elapsed
+            self.by_handler[handler] = self.by_handler.get(handler, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {"total": self.total, "total_ms": round(self.total_ms, 2), "by_handler": dict(self.by_handler)}
+
+    def close(self) -> None:
+        self._event.remove(self._engine, "before_cursor_execute", self._before)
+        self._event.remove(self._engine, "after_cursor_execute", self._after)
+
+
+class FrameReader:
+    """Reads frames from a TestClient websocket session on a daemon thread."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.frames: "queue.Queue[tuple[float, str]]" = queue.Queue()
+        self.closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ws-frame-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                raw = self.ws.receive_text()
+                self.frames.put((time.time(), raw))
+        except Exception:
+            pass
+        finally:
+            self.closed.set()
+
+    def drain(self) -> list[tuple[float, str]]:
+        items = []
+        while True:
+            try:
+                items.append(self.frames.get_nowait())
+            except queue.Empty:
+                return items
+
+
+def _free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return int(sock.getsockname()[1])
+
+
+class ServerThread:
+    """uvicorn in a daemon thread (signal handlers are skipped off the main thread)."""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int | None = None):
+        import uvicorn
+
+        self.host = host
+        self.port = port or _free_port(host)
+        config = uvicorn.Config(app, host=host, port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self.server.run, name="bench-uvicorn", daemon=True)
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/v2/ws"
+
+    def start(self, timeout: float = 30.0) -> "ServerThread":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summarize(values: list[float]) -> dict[str, Any]:
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+        "mean": (sum(values) / len(values)) if values else None,
+    }
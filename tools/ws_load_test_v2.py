@@ -3,13 +3,17 @@ import asyncio
 import json
 import os
 import random
+import re
 import string
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import websockets
 
 
+_TS_RE = re.compile(r"@ts=(\d+)")
+
+
 def _rand_id(n: int = 8) -> str:
     return "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(n))
 
@@ -21,17 +25,60 @@ class Stats:
     failed: int = 0
     messages_sent: int = 0
     messages_recv: int = 0
+    by_type: dict = field(default_factory=dict)
+    latencies_ms: list = field(default_factory=list)
+
+    def on_message(self, raw) -> None:
+        self.messages_recv += 1
+        try:
+            data = json.loads(raw)
+        except Exception:
+            return
+        if not isinstance(data, dict):
+            return
+        kind = str(data.get("type") or "?")
+        self.by_type[kind] = self.by_type.get(kind, 0) + 1
+        if kind == "chat":
+            # Метка @ts=<unix ms> ставится синтетическим коннектором (TIKTOK_CONNECTOR_BACKEND=synthetic).
+            m = _TS_RE.search(str(data.get("message") or ""))
+            if m:
+                self.latencies_ms.append(time.time() * 1000 - int(m.group(1)))
+
+
+def _percentile(values: list, q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _fmt_ms(v: float | None) -> str:
+    return "-" if v is None else f"{v:.1f}ms"
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description=(
             "Load-test for TTBoost backend WS v2.\n"
-            "Creates many WebSocket connections to your backend only (does NOT connect TikTok Live)."
-        )
+            "Creates many WebSocket connections to your backend only (does NOT connect TikTok Live).\n"
+            "With --tiktok-username and a backend started with TIKTOK_CONNECTOR_BACKEND=synthetic,\n"
+            "each client also starts a generated event stream and end-to-end latency/throughput is reported."
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     p.add_argument("--ws", default=os.environ.get("WS_URL", "ws://127.0.0.1:8000/v2/ws"))
     p.add_argument("--token", default=os.environ.get("TOKEN"))
+    p.add_argument(
+        "--tokens-file",
+        default=os.environ.get("TOKENS_FILE"),
+        help="File with one JWT per line; connections use them round-robin (one TikTok stream per user).",
+    )
+    p.add_argument(
+        "--tiktok-username",
+        default=os.environ.get("TIKTOK_USERNAME"),
+        help="Send connect_tiktok with this username after connecting (use with the synthetic backend).",
+    )
     p.add_argument("--connections", type=int, default=int(os.environ.get("CONNECTIONS", "50")))
     p.add_argument("--duration", type=int, default=int(os.environ.get("DURATION", "60")))
     p.add_argument("--ramp", type=float, default=float(os.environ.get("RAMP", "5")))
@@ -68,18 +115,22 @@ async def client_task(
     stats: Stats,
     stop_at: float,
     send_interval: float,
+    tiktok_username: str | None = None,
 ) -> None:
     stats.started += 1
     try:
         async with websockets.connect(ws_url, ping_interval=None, close_timeout=2) as ws:
             stats.connected += 1
+            if tiktok_username:
+                await ws.send(json.dumps({"action": "connect_tiktok", "username": tiktok_username}))
+                stats.messages_sent += 1
             last_send = 0.0
             while time.monotonic() < stop_at:
                 # Best-effort receive, but don't block forever.
                 try:
                     msg = await asyncio.wait_for(ws.recv(), timeout=1.0)
                     if msg is not None:
-                        stats.messages_recv += 1
+                        stats.on_message(msg)
                 except asyncio.TimeoutError:
                     pass
                 except Exception:
@@ -101,7 +152,13 @@ async def client_task(
 async def run() -> int:
     args = parse_args()
 
-    if not args.token:
+    tokens: list[str] = []
+    if args.tokens_file:
+        with open(args.tokens_file, "r", encoding="utf-8") as f:
+            tokens = [line.strip() for line in f if line.strip()]
+    elif args.token:
+        tokens = [args.token]
+    if not tokens:
         raise SystemExit(
             "Missing token. Provide --token or env TOKEN (JWT from /v2/auth/login or from admin localStorage ttb_token)."
         )
@@ -122,21 +179,30 @@ async def run() -> int:
         await asyncio.sleep(ramp_step)
         url = _build_ws_url(
             args.ws,
-            args.token,
+            tokens[i % len(tokens)],
             args.platform,
             args.os,
             args.device,
             client_id=_rand_id(10),
         )
-        tasks.append(asyncio.create_task(client_task(i, url, stats, stop_at, float(args.send_interval))))
+        tasks.append(
+            asyncio.create_task(
+                client_task(i, url, stats, stop_at, float(args.send_interval), tiktok_username=args.tiktok_username)
+            )
+        )
 
     # Periodic status
+    last_recv = 0
+    last_t = start
     while time.monotonic() < stop_at:
         await asyncio.sleep(2.0)
-        elapsed = time.monotonic() - start
+        now = time.monotonic()
+        elapsed = now - start
+        rate = (stats.messages_recv - last_recv) / max(1e-6, now - last_t)
+        last_recv, last_t = stats.messages_recv, now
         print(
             f"t={elapsed:5.1f}s started={stats.started} connected={stats.connected} failed={stats.failed} "
-            f"sent={stats.messages_sent} recv={stats.messages_recv}"
+            f"sent={stats.messages_sent} recv={stats.messages_recv} recv_rate={rate:.0f}/s"
         )
 
     await asyncio.gather(*tasks, return_exceptions=True)
@@ -145,8 +211,18 @@ async def run() -> int:
     print("\nDone")
     print(
         f"elapsed={elapsed:.1f}s connections={n} connected={stats.connected} failed={stats.failed} "
-        f"sent={stats.messages_sent} recv={stats.messages_recv}"
+        f"sent={stats.messages_sent} recv={stats.messages_recv} throughput={stats.messages_recv / max(1e-6, elapsed):.1f} msg/s"
     )
+    if stats.by_type:
+        print("by type: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.by_type.items(), key=lambda kv: -kv[1])))
+    if stats.latencies_ms:
+        lat = stats.latencies_ms
+        print(
+            f"chat latency (n={len(lat)}): p50={_fmt_ms(_percentile(lat, 50))} p95={_fmt_ms(_percentile(lat, 95))} "
+            f"p99={_fmt_ms(_percentile(lat, 99))} max={_fmt_ms(max(lat))}"
+        )
+    elif args.tiktok_username:
+        print("chat latency: no stamped chat frames received (is the backend running with TIKTOK_CONNECTOR_BACKEND=synthetic?)")
     return 0
 
 